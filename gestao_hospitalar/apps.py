@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestaoHospitalarConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestao_hospitalar'
+
+    def ready(self):
+        # Invalidação da taxonomia NANDA/NOC/NIC compilada em memória
+        from . import signals  # noqa: F401
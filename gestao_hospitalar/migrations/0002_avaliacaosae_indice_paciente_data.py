@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao_hospitalar', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avaliacaosae',
+            index=models.Index(fields=['paciente', '-data_avaliacao'], name='sae_paciente_data_idx'),
+        ),
+    ]
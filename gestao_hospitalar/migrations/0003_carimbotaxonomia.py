@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao', '0002_ferramenta_empresa_ferramentas_contratadas'),
+        ('gestao_hospitalar', '0002_avaliacaosae_indice_paciente_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarimboTaxonomia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.PositiveIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('empresa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='carimbo_taxonomia', to='gestao.empresa')),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from gestao.models import Empresa
 from django.utils import timezone
 from django.conf import settings
@@ -52,6 +53,39 @@ class Leito(models.Model):
     def __str__(self):
         return f"Leito {self.numero} - Quarto {self.quarto.numero}"
 
+class PacienteQuerySet(models.QuerySet):
+    """Anotações das últimas avaliações, em subconsultas (uma única consulta para a lista inteira)."""
+
+    def com_ultima_avaliacao_fugulin(self, hoje=None):
+        """
+        Anota a última avaliação de Fugulin (ultima_fugulin_id, ultima_fugulin_data,
+        ultima_fugulin_pontuacao, ultima_fugulin_categoria) e avaliacao_hoje_feita.
+        """
+        hoje = hoje or timezone.now().date()
+        ultima = AvaliacaoFugulin.objects.filter(paciente=models.OuterRef('pk')).order_by('-data_avaliacao')[:1]
+        return self.annotate(
+            ultima_fugulin_id=models.Subquery(ultima.values('pk')),
+            ultima_fugulin_data=models.Subquery(ultima.values('data_avaliacao')),
+            ultima_fugulin_pontuacao=models.Subquery(ultima.values('pontuacao_total')),
+            ultima_fugulin_categoria=models.Subquery(ultima.values('categoria_cuidado')),
+            avaliacao_hoje_feita=models.Exists(
+                AvaliacaoFugulin.objects.filter(paciente=models.OuterRef('pk'), data_avaliacao=hoje)),
+        )
+
+    def com_ultima_sae(self):
+        """
+        Anota a última avaliação SAE (ultima_sae_id, ultima_sae_data) e o diagnóstico
+        NANDA selecionado nela (ultima_sae_nanda_codigo, ultima_sae_nanda_titulo).
+        """
+        ultima = AvaliacaoSAE.objects.filter(paciente=models.OuterRef('pk')).order_by('-data_avaliacao', '-pk')[:1]
+        return self.annotate(
+            ultima_sae_id=models.Subquery(ultima.values('pk')),
+            ultima_sae_data=models.Subquery(ultima.values('data_avaliacao')),
+            ultima_sae_nanda_codigo=models.Subquery(ultima.values('diagnostico_nanda_selecionado__codigo')),
+            ultima_sae_nanda_titulo=models.Subquery(ultima.values('diagnostico_nanda_selecionado__titulo')),
+        )
+
+
 class Paciente(models.Model):
     nome = models.CharField(max_length=200, verbose_name="Nome Completo do Paciente")
     data_nascimento = models.DateField(verbose_name="Data de Nascimento")
@@ -75,6 +109,8 @@ class Paciente(models.Model):
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name="pacientes")
     leito = models.OneToOneField(Leito, on_delete=models.SET_NULL, null=True, blank=True, related_name="paciente_alocado")
 
+    objects = PacienteQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Paciente"
         verbose_name_plural = "Pacientes"
@@ -207,6 +243,36 @@ class AtividadeNIC(models.Model):
     # A empresa da atividade é determinada pela intervenção NIC a que pertence.
     def __str__(self): return self.descricao[:70] + '...' if len(self.descricao) > 70 else self.descricao
 
+class CarimboTaxonomia(models.Model):
+    """
+    Carimbo de versão da taxonomia NANDA/NOC/NIC de uma empresa. Os sinais de
+    `gestao_hospitalar.signals` incrementam o carimbo a cada alteração e cada
+    worker compara com a versão da sua taxonomia compilada (ver taxonomia.py).
+    """
+    empresa = models.OneToOneField(Empresa, on_delete=models.CASCADE, related_name='carimbo_taxonomia')
+    versao = models.PositiveIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"{self.empresa} v{self.versao}"
+
+    @classmethod
+    def atual(cls, empresa_id):
+        """Versão corrente da taxonomia da empresa (0 se nunca foi alterada)."""
+        return cls.objects.filter(empresa_id=empresa_id).values_list('versao', flat=True).first() or 0
+
+    @classmethod
+    def incrementar(cls, empresa_id):
+        """Incrementa a versão de forma atômica (ignora empresas que acabaram de ser excluídas)."""
+        if cls.objects.filter(empresa_id=empresa_id).update(versao=F('versao') + 1, atualizado_em=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                carimbo, criado = cls.objects.get_or_create(empresa_id=empresa_id, defaults={'versao': 1})
+            if not criado:
+                cls.objects.filter(pk=carimbo.pk).update(versao=F('versao') + 1, atualizado_em=timezone.now())
+        except IntegrityError:
+            pass
+
 # ====================================================================
 # 3. MODELOS PARA REGISTRAR A AVALIAÇÃO E O PLANO DE CUIDADOS DO PACIENTE
 # Esta é a parte que será preenchida diariamente e persistida
@@ -219,7 +285,9 @@ class AvaliacaoSAE(models.Model):
     achados_selecionados = models.ManyToManyField(AchadoClinico, blank=True)
     diagnostico_nanda_selecionado = models.ForeignKey(DiagnosticoNANDA, on_delete=models.SET_NULL, null=True, blank=True)
     is_finalizada = models.BooleanField(default=False)
-    class Meta: ordering = ['-data_avaliacao']
+    class Meta:
+        ordering = ['-data_avaliacao']
+        indexes = [models.Index(fields=['paciente', '-data_avaliacao'], name='sae_paciente_data_idx')]
     def __str__(self): return f"SAE de {self.paciente.nome} em {self.data_avaliacao.strftime('%d/%m/%Y %H:%M')}"
 
 class PlanoCuidado(models.Model):
@@ -0,0 +1,48 @@
+# gestao_hospitalar/signals.py
+"""
+Invalidação da taxonomia compilada (ver `gestao_hospitalar.taxonomia`) quando
+NANDA, NOC, NIC, atividades ou as ligações entre eles mudam.
+Conectados em `GestaoHospitalarConfig.ready()`.
+
+A invalidação espera o commit da transação: antes dele, uma recompilação
+(neste ou em outro worker) leria as linhas antigas e as guardaria como novas.
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AtividadeNIC, DiagnosticoNANDA, IntervencaoNIC, ResultadoNOC
+from .taxonomia import taxonomias
+
+
+def _invalidar_apos_commit(empresa_id):
+    transaction.on_commit(lambda: taxonomias.invalidar(empresa_id))
+
+
+@receiver(post_save, sender=DiagnosticoNANDA)
+@receiver(post_delete, sender=DiagnosticoNANDA)
+@receiver(post_save, sender=ResultadoNOC)
+@receiver(post_delete, sender=ResultadoNOC)
+@receiver(post_save, sender=IntervencaoNIC)
+@receiver(post_delete, sender=IntervencaoNIC)
+def invalidar_taxonomia(sender, instance, **kwargs):
+    _invalidar_apos_commit(instance.empresa_id)
+
+
+@receiver(post_save, sender=AtividadeNIC)
+@receiver(post_delete, sender=AtividadeNIC)
+def invalidar_taxonomia_atividade(sender, instance, **kwargs):
+    try:
+        empresa_id = instance.intervencao.empresa_id
+    except IntervencaoNIC.DoesNotExist:
+        # Intervenção já apagada: a exclusão dela também invalida
+        return
+    _invalidar_apos_commit(empresa_id)
+
+
+@receiver(m2m_changed, sender=ResultadoNOC.diagnosticos_nanda.through)
+@receiver(m2m_changed, sender=IntervencaoNIC.resultados_noc.through)
+def invalidar_taxonomia_ligacoes(sender, instance, action, **kwargs):
+    # `instance` é qualquer um dos lados da ligação; os dois são da mesma empresa
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidar_apos_commit(instance.empresa_id)
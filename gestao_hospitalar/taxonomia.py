@@ -0,0 +1,158 @@
+# gestao_hospitalar/taxonomia.py
+"""
+Taxonomia NANDA -> NOC -> NIC compilada em memória, por empresa.
+
+Na primeira consulta de uma empresa, o grafo é montado com poucas consultas
+em lote (diagnósticos, ligações NANDA-NOC, NOCs, ligações NOC-NIC, NICs e
+atividades) e o plano de cuidados de cada NANDA já fica serializado em JSON;
+as consultas seguintes não tocam o banco.
+
+A compilação é descartada pelos sinais de `gestao_hospitalar.signals` quando
+um NANDA, NOC, NIC ou atividade da empresa é gravado ou apagado, ou quando as
+ligações entre eles mudam: o sinal incrementa o `CarimboTaxonomia` da
+empresa, e cada worker compara o carimbo com a versão da sua compilação no
+máximo uma vez a cada SAE_TAXONOMIA_INTERVALO segundos (uma consulta), como os
+snapshots do simulador fazem com o `CarimboVersao`.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import AtividadeNIC, CarimboTaxonomia, DiagnosticoNANDA, IntervencaoNIC, ResultadoNOC
+
+
+class TaxonomiaCompilada:
+    """Grafo de uma empresa: NOCs de cada NANDA, NICs de cada NOC e o plano de cada NANDA em JSON."""
+
+    __slots__ = ('empresa_id', 'versao', 'verificada_em', 'nocs_por_nanda', 'nics_por_noc', 'planos')
+
+    def __init__(self, empresa_id, versao, nocs_por_nanda, nics_por_noc, planos):
+        self.empresa_id = empresa_id
+        self.versao = versao
+        self.verificada_em = time.monotonic()
+        self.nocs_por_nanda = nocs_por_nanda
+        self.nics_por_noc = nics_por_noc
+        self.planos = planos
+
+    def plano(self, nanda_id):
+        """JSON (bytes) do plano de cuidados do NANDA, ou None se ele não for da empresa."""
+        return self.planos.get(nanda_id)
+
+
+def _agrupar(pares):
+    grupos = {}
+    for origem, destino in pares:
+        grupos.setdefault(origem, []).append(destino)
+    return grupos
+
+
+def compilar_taxonomia(empresa_id, versao=None):
+    """Monta o grafo e os planos serializados dos NANDAs da empresa (mesmo formato da API)."""
+    nanda_ids = list(DiagnosticoNANDA.objects.filter(empresa_id=empresa_id).values_list('id', flat=True))
+
+    ligacoes_noc = ResultadoNOC.diagnosticos_nanda.through.objects.filter(diagnosticonanda_id__in=nanda_ids)
+    nocs_por_nanda = _agrupar(
+        ligacoes_noc.order_by('resultadonoc_id').values_list('diagnosticonanda_id', 'resultadonoc_id'))
+    noc_ids = {noc_id for ids in nocs_por_nanda.values() for noc_id in ids}
+    nocs = {noc['id']: noc for noc in ResultadoNOC.objects.filter(id__in=noc_ids).values('id', 'titulo', 'definicao')}
+
+    ligacoes_nic = IntervencaoNIC.resultados_noc.through.objects.filter(resultadonoc_id__in=noc_ids)
+    nics_por_noc = _agrupar(
+        ligacoes_nic.order_by('intervencaonic_id').values_list('resultadonoc_id', 'intervencaonic_id'))
+    nic_ids = {nic_id for ids in nics_por_noc.values() for nic_id in ids}
+    nics = {nic['id']: nic for nic in IntervencaoNIC.objects.filter(id__in=nic_ids).values('id', 'titulo')}
+
+    atividades = {}
+    for atividade in AtividadeNIC.objects.filter(intervencao_id__in=nic_ids).order_by('id').values(
+            'id', 'descricao', 'intervencao_id'):
+        atividades.setdefault(atividade.pop('intervencao_id'), []).append(atividade)
+
+    # Cada NIC é serializado uma vez e reaproveitado em todos os NOCs que o usam
+    nics_serializados = {
+        nic_id: {'id': nic['id'], 'titulo': nic['titulo'], 'atividades': atividades.get(nic_id, [])}
+        for nic_id, nic in nics.items()
+    }
+    planos = {}
+    for nanda_id in nanda_ids:
+        plano = [
+            {
+                'id': nocs[noc_id]['id'],
+                'titulo': nocs[noc_id]['titulo'],
+                'definicao': nocs[noc_id]['definicao'],
+                'intervencoes_nic': [nics_serializados[nic_id] for nic_id in nics_por_noc.get(noc_id, [])],
+            }
+            for noc_id in nocs_por_nanda.get(nanda_id, [])
+        ]
+        planos[nanda_id] = json.dumps(plano, cls=DjangoJSONEncoder).encode()
+
+    return TaxonomiaCompilada(empresa_id, versao, nocs_por_nanda, nics_por_noc, planos)
+
+
+class CacheTaxonomia:
+    """
+    Taxonomias compiladas do processo, por empresa. Cada empresa tem o seu lock
+    de compilação, para que a compilação de uma não segure as consultas das outras.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks_empresa = {}
+        self._taxonomias = {}
+        # Invalidações por empresa: uma compilação iniciada antes de uma invalidação não é guardada
+        self._geracoes = {}
+
+    def _lock_empresa(self, empresa_id):
+        with self._lock:
+            return self._locks_empresa.setdefault(empresa_id, threading.Lock())
+
+    def _verificada(self, taxonomia):
+        return (taxonomia is not None
+                and time.monotonic() - taxonomia.verificada_em < getattr(settings, 'SAE_TAXONOMIA_INTERVALO', 5))
+
+    def obter(self, empresa_id):
+        taxonomia = self._taxonomias.get(empresa_id)
+        if self._verificada(taxonomia):
+            return taxonomia
+        with self._lock_empresa(empresa_id):
+            # Outra thread pode ter verificado ou compilado enquanto esperávamos o lock
+            taxonomia = self._taxonomias.get(empresa_id)
+            if self._verificada(taxonomia):
+                return taxonomia
+            versao = CarimboTaxonomia.atual(empresa_id)
+            if taxonomia is not None and taxonomia.versao == versao:
+                taxonomia.verificada_em = time.monotonic()
+                return taxonomia
+            with self._lock:
+                geracao = self._geracoes.setdefault(empresa_id, 0)
+            taxonomia = compilar_taxonomia(empresa_id, versao)
+            with self._lock:
+                if self._geracoes.get(empresa_id, 0) == geracao:
+                    self._taxonomias[empresa_id] = taxonomia
+        return taxonomia
+
+    def descartar(self, empresa_id=None):
+        """Descarta a compilação da empresa (ou de todas) só neste processo."""
+        with self._lock:
+            if empresa_id is None:
+                self._taxonomias.clear()
+                for chave in self._geracoes:
+                    self._geracoes[chave] += 1
+            else:
+                self._taxonomias.pop(empresa_id, None)
+                self._geracoes[empresa_id] = self._geracoes.get(empresa_id, 0) + 1
+
+    def invalidar(self, empresa_id):
+        """Incrementa o carimbo da empresa (avisa todos os workers) e descarta a compilação deste processo."""
+        CarimboTaxonomia.incrementar(empresa_id)
+        self.descartar(empresa_id)
+
+
+taxonomias = CacheTaxonomia()
+
+
+def obter_plano_cuidados(empresa_id, nanda_id):
+    """JSON (bytes) do plano de cuidados do NANDA na taxonomia da empresa, ou None."""
+    return taxonomias.obter(empresa_id).plano(nanda_id)
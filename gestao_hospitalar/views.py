@@ -1,6 +1,6 @@
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView, DetailView
 from .models import (
     Ala, AvaliacaoFugulin, Quarto, Leito, Paciente, AreaCorporal, 
@@ -17,6 +17,7 @@ from django.utils import timezone
 import json
 from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
+from .taxonomia import obter_plano_cuidados
 # Este Mixin agora serve apenas para verificar a permissão do usuário.
 
 class AdministradorRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
@@ -303,12 +304,8 @@ class SAEDashboardView(AdminClienteRequiredMixin, ListView):
     template_name = 'gestao_hospitalar/sae_dashboard.html'
     context_object_name = 'pacientes'
     def get_queryset(self):
-        return Paciente.objects.filter(empresa=self.request.user.empresa, leito__isnull=False).select_related('leito', 'leito__quarto', 'leito__quarto__ala').order_by('nome')
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        for paciente in context['pacientes']:
-            paciente.ultima_sae = paciente.avaliacoes_sae.order_by('-data_avaliacao').first()
-        return context
+        # Última SAE e diagnóstico NANDA anotados na própria consulta da lista
+        return Paciente.objects.filter(empresa=self.request.user.empresa, leito__isnull=False).select_related('leito', 'leito__quarto', 'leito__quarto__ala').com_ultima_sae().order_by('nome')
 
 
 
@@ -357,29 +354,18 @@ def sugerir_nanda_json(request):
 def get_plano_cuidados_json(request, nanda_id):
     """
     Para um NANDA selecionado, retorna os NOCs e NICs (com suas atividades) associados.
+    O plano vem já serializado da taxonomia compilada da empresa (ver taxonomia.py).
     """
-    diagnostico = get_object_or_404(DiagnosticoNANDA, pk=nanda_id)
-    
-    plano = []
-    # Itera sobre os resultados (NOC) ligados ao diagnóstico NANDA
-    for noc in diagnostico.resultados_noc.all():
-        noc_data = {
-            'id': noc.id,
-            'titulo': noc.titulo,
-            'definicao': noc.definicao,
-            'intervencoes_nic': []
-        }
-        # Para cada NOC, itera sobre as intervenções (NIC) ligadas a ele
-        for nic in noc.intervencoes_nic.all():
-            nic_data = {
-                'id': nic.id,
-                'titulo': nic.titulo,
-                'atividades': list(nic.atividades.all().values('id', 'descricao'))
-            }
-            noc_data['intervencoes_nic'].append(nic_data)
-        plano.append(noc_data)
-        
-    return JsonResponse(plano, safe=False)
+    empresa_id = getattr(request.user, 'empresa_id', None)
+    if empresa_id is None:
+        # Usuário sem empresa (administrador da plataforma): usa a empresa do próprio NANDA
+        diagnostico = get_object_or_404(DiagnosticoNANDA, pk=nanda_id)
+        empresa_id = diagnostico.empresa_id
+
+    plano = obter_plano_cuidados(empresa_id, nanda_id)
+    if plano is None:
+        raise Http404('Diagnóstico NANDA não encontrado.')
+    return HttpResponse(plano, content_type='application/json')
 
 # === Dashboard ===
 class HospitalDashboardView(AdminClienteRequiredMixin, TemplateView):
@@ -610,20 +596,11 @@ class ListaPacientesParaAvaliacaoView(AdminClienteRequiredMixin, ListView):
 
     def get_queryset(self):
         # Mostra apenas pacientes que estão atualmente em um leito (internados)
+        # A última avaliação e a de hoje vêm anotadas na mesma consulta (ver PacienteQuerySet)
         return Paciente.objects.filter(
             empresa=self.request.user.empresa, 
             leito__isnull=False
-        ).select_related('leito', 'leito__quarto').order_by('leito__quarto__ala__nome', 'leito__quarto__numero', 'leito__numero')
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        hoje = timezone.now().date()
-        # Adiciona a última avaliação de cada paciente para fácil visualização
-        for paciente in context['pacientes']:
-            paciente.ultima_avaliacao = paciente.avaliacoes_fugulin.order_by('-data_avaliacao').first()
-            # Verifica se a avaliação de hoje já foi feita
-            paciente.avaliacao_hoje_feita = paciente.avaliacoes_fugulin.filter(data_avaliacao=hoje).exists()
-        return context
+        ).select_related('leito', 'leito__quarto').com_ultima_avaliacao_fugulin().order_by('leito__quarto__ala__nome', 'leito__quarto__numero', 'leito__numero')
 
 class AvaliarPacienteView(AdminClienteRequiredMixin, View):
     form_class = AvaliacaoFugulinForm
@@ -3,6 +3,15 @@ ASGI config for lummia_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Simulador de risco em modo ASGI: defina SIMULADOR_ASGI=True para que as APIs
+de consulta (CNPJ e CNAEs) usem as views assíncronas, que aguardam o
+reCAPTCHA e a BrasilAPI sem prender um worker. Exemplo:
+
+    SIMULADOR_ASGI=True uvicorn lummia_project.asgi:application --workers 2
+
+Aumente também SIMULADOR_HTTP_POOL para perto de SIMULADOR_ASYNC_THREADS,
+para que as conexões keep-alive sejam reaproveitadas sob carga.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -120,4 +120,83 @@ if not DEBUG:
 
 
 RECAPTCHA_PUBLIC_KEY = os.getenv('RECAPTCHA_PUBLIC_KEY')
-RECAPTCHA_PRIVATE_KEY = os.getenv('RECAPTCHA_PRIVATE_KEY')
\ No newline at end of file
+RECAPTCHA_PRIVATE_KEY = os.getenv('RECAPTCHA_PRIVATE_KEY')
+
+# Simulador de risco: intervalo (segundos) entre verificações do carimbo de versão
+# das bases em memória. Após uma importação, os workers recarregam em até esse tempo.
+SIMULADOR_SNAPSHOT_INTERVALO = int(os.getenv('SIMULADOR_SNAPSHOT_INTERVALO', '30'))
+
+# Cache de consultas de CNPJ (BrasilAPI): validade em segundos antes de revalidar
+# em segundo plano e tamanho do LRU em memória de cada worker.
+SIMULADOR_CNPJ_TTL = int(os.getenv('SIMULADOR_CNPJ_TTL', str(7 * 24 * 3600)))
+SIMULADOR_CNPJ_LRU_TAMANHO = int(os.getenv('SIMULADOR_CNPJ_LRU_TAMANHO', '2048'))
+
+# Cliente HTTP compartilhado do simulador: conexões keep-alive por host e
+# sobrescritas opcionais de timeout/tentativas/disjuntor (ver simulador_risco.cliente_http).
+SIMULADOR_HTTP_POOL = int(os.getenv('SIMULADOR_HTTP_POOL', '10'))
+SIMULADOR_HTTP_HOSTS = {}
+
+# Triagem em lote de CNPJs: consultas externas simultâneas e tamanho máximo do lote.
+SIMULADOR_LOTE_WORKERS = int(os.getenv('SIMULADOR_LOTE_WORKERS', '8'))
+SIMULADOR_LOTE_MAXIMO = int(os.getenv('SIMULADOR_LOTE_MAXIMO', '500'))
+
+# Modo ASGI: quando True, as APIs do simulador com chamadas externas usam views
+# assíncronas; SIMULADOR_ASYNC_THREADS limita as chamadas externas simultâneas por processo.
+SIMULADOR_ASGI = os.getenv('SIMULADOR_ASGI', 'False') == 'True'
+SIMULADOR_ASYNC_THREADS = int(os.getenv('SIMULADOR_ASYNC_THREADS', '100'))
+
+# Cache das respostas de classificação por conjunto de CNAEs (JSON serializado em
+# memória de cada worker): limite total em bytes antes de descartar as menos usadas.
+SIMULADOR_CACHE_RESPOSTAS_BYTES = int(os.getenv('SIMULADOR_CACHE_RESPOSTAS_BYTES', str(32 * 1024 * 1024)))
+
+# Endereços dos serviços externos do simulador (sobrescritos pelo benchmark_simulador
+# para apontar para servidores locais).
+SIMULADOR_RECAPTCHA_URL = os.getenv('SIMULADOR_RECAPTCHA_URL', 'https://www.google.com/recaptcha/api/siteverify')
+SIMULADOR_BRASILAPI_CNPJ_URL = os.getenv('SIMULADOR_BRASILAPI_CNPJ_URL', 'https://brasilapi.com.br/api/cnpj/v1/')
+
+# Pacote de regras compilado por `manage.py compilar_bundle` para classificação no navegador.
+SIMULADOR_BUNDLE_DIR = os.getenv('SIMULADOR_BUNDLE_DIR', os.path.join(MEDIA_ROOT, 'simulador_risco'))
+
+# Controle de admissão das APIs públicas do simulador (ver simulador_risco.limites):
+# fichas por IP (taxa por segundo e rajada; taxa 0 desliga o limite), cache
+# compartilhado opcional entre workers (alias em CACHES, ex: 'default' com Redis)
+# e requisições simultâneas por processo.
+# Atrás de um proxy reverso, defina SIMULADOR_PROXIES_CONFIAVEIS antes de ligar o
+# limite: sem isso todos os visitantes têm o IP do proxy e dividem o mesmo balde.
+SIMULADOR_LIMITE_TAXA = float(os.getenv('SIMULADOR_LIMITE_TAXA', '0'))
+SIMULADOR_LIMITE_RAJADA = int(os.getenv('SIMULADOR_LIMITE_RAJADA', '20'))
+SIMULADOR_LIMITE_CACHE = os.getenv('SIMULADOR_LIMITE_CACHE', '')
+# O limite de concorrência é por processo e só atua com ASGI ou com workers
+# gthread (gunicorn --threads N, com N maior que o limite: o padrão 4 deixa as
+# demais threads para o resto do sistema); workers síncronos de uma thread nunca
+# passam de uma requisição em andamento.
+SIMULADOR_CONCORRENCIA_MAX = int(os.getenv('SIMULADOR_CONCORRENCIA_MAX', '200' if SIMULADOR_ASGI else '4'))
+# Número de proxies reversos confiáveis na frente da aplicação (ex: 1 para um
+# nginx que acrescenta $remote_addr ao X-Forwarded-For). O IP do cliente é a
+# entrada acrescentada pelo proxy mais externo; 0 usa o REMOTE_ADDR.
+SIMULADOR_PROXIES_CONFIAVEIS = int(os.getenv(
+    'SIMULADOR_PROXIES_CONFIAVEIS', '1' if os.getenv('SIMULADOR_PROXY_CONFIAVEL') == 'True' else '0'))
+
+# Validade (segundos) do token assinado que dispensa o reCAPTCHA nas chamadas
+# seguintes do mesmo cliente ao simulador.
+SIMULADOR_VERIFICACAO_VALIDADE = int(os.getenv('SIMULADOR_VERIFICACAO_VALIDADE', '900'))
+
+# Espelho local dos Dados Abertos do CNPJ (Receita Federal), gerado por
+# `manage.py importar_espelho_cnpj`. Vazio desliga o espelho (só BrasilAPI).
+SIMULADOR_ESPELHO_CNPJ_DIR = os.getenv('SIMULADOR_ESPELHO_CNPJ_DIR', '')
+
+# Município cuja classificação ambiental é servida quando a página ou a API não
+# indicam outro (slug de simulador_risco.Municipio).
+SIMULADOR_MUNICIPIO_PADRAO = os.getenv('SIMULADOR_MUNICIPIO_PADRAO', 'ssparaiso')
+
+# Relatórios para impressão do simulador: gravados por hash do conteúdo em
+# SIMULADOR_RELATORIOS_DIR e renderizados num pool de threads por processo.
+SIMULADOR_RELATORIOS_DIR = os.getenv('SIMULADOR_RELATORIOS_DIR', os.path.join(MEDIA_ROOT, 'simulador_risco', 'relatorios'))
+SIMULADOR_RELATORIOS_THREADS = int(os.getenv('SIMULADOR_RELATORIOS_THREADS', '2'))
+# Relatórios gravados há mais tempo que isso (segundos) são apagados do diretório.
+SIMULADOR_RELATORIOS_RETENCAO = int(os.getenv('SIMULADOR_RELATORIOS_RETENCAO', str(7 * 24 * 3600)))
+
+# Taxonomia NANDA/NOC/NIC compilada em memória por empresa (ver gestao_hospitalar.taxonomia):
+# intervalo (segundos) entre verificações do carimbo da empresa em cada worker.
+# Após uma alteração, os outros workers recompilam em até esse tempo.
+SAE_TAXONOMIA_INTERVALO = int(os.getenv('SAE_TAXONOMIA_INTERVALO', '5'))
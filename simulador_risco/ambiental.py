@@ -0,0 +1,205 @@
+# simulador_risco/ambiental.py
+"""
+Motor de classificação do Simulador Ambiental, por município (ex: Decreto
+Municipal nº 6615 de São Sebastião do Paraíso).
+
+Cada município tem a sua base ambiental ('ambiental:<slug>', com carimbo e
+versões próprios) e o seu índice em memória: toda a classificação do município
+(versão ativa ou a tabela `ClassificacaoAmbiental`, ver simulador_risco.versoes)
+indexada por código CNAE. O índice de um município só é montado na primeira
+consulta a ele e só é recarregado quando o carimbo da base 'ses' ou da base
+dele muda; municípios novos não pesam nas consultas dos demais.
+A classificação de um lote de CNAEs calcula o risco consolidado de cada CNAE e
+o risco geral em uma passada.
+"""
+import threading
+from functools import partial
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .models import Municipio
+from .snapshot import BASE_SES, SnapshotVersionado
+from .utils import formatar_cnae
+from .versoes import dados_base
+
+BASE_AMBIENTAL = 'ambiental'
+# Carimbo incrementado quando um município é cadastrado
+BASE_MUNICIPIOS = 'municipios'
+
+RISCO_MAP = {'I': 1, 'II': 2, 'III': 3}
+RISCO_CORES = {'I': 'success', 'II': 'warning', 'III': 'danger', 'NA': 'secondary'}
+
+# Item usado quando o CNAE existe, mas não tem classificação específica no decreto
+ITEM_REGRA_GERAL = MappingProxyType({
+    'dn_copam': 'N/A',
+    'descricao_especifica': 'Atividade não listada especificamente no Decreto (Regra Geral)',
+    'exigencia': 'Não se aplica / Dispensa',
+    'risco': 'I',
+    'cor': 'success'
+})
+
+MENSAGENS_RISCO_GERAL = {
+    'III': ('danger', "ATIVIDADE DE ALTO RISCO AMBIENTAL"),
+    'II': ('warning', "ATIVIDADE DE MÉDIO RISCO AMBIENTAL"),
+    'I': ('success', "ATIVIDADE DE BAIXO RISCO AMBIENTAL (Dispensado de Licenciamento)"),
+}
+
+
+class MunicipioDesconhecido(LookupError):
+    """O município informado não tem base ambiental cadastrada."""
+
+
+def municipio_padrao():
+    return getattr(settings, 'SIMULADOR_MUNICIPIO_PADRAO', 'ssparaiso')
+
+
+def base_ambiental(municipio):
+    """Nome da base ambiental do município no `CarimboVersao` e nas versões ('ambiental:ssparaiso')."""
+    return f'{BASE_AMBIENTAL}:{municipio}'
+
+
+def risco_maximo(riscos, padrao='NA'):
+    """Retorna o maior nível ('III' > 'II' > 'I') entre os riscos informados."""
+    maior, maior_valor = padrao, 0
+    for risco in riscos:
+        valor = RISCO_MAP.get(risco, 0)
+        if valor > maior_valor:
+            maior, maior_valor = risco, valor
+    return maior
+
+
+class IndiceAmbiental:
+    """Índice somente-leitura de um município: código CNAE -> (descrição IBGE, itens ambientais)."""
+
+    __slots__ = ('versao', 'municipio', 'descricoes', 'itens')
+
+    def __init__(self, versao, descricoes, itens, municipio=None):
+        self.versao = versao
+        self.municipio = MappingProxyType(municipio or {})
+        self.descricoes = MappingProxyType(descricoes)
+        self.itens = MappingProxyType(itens)
+
+    def classificar(self, codigos_limpos):
+        """
+        Classifica o lote de códigos limpos em uma passada.
+
+        Retorna um dicionário com:
+        - cnaes_processados: payload de `api_consultar_cnaes_ambiental`, na ordem informada;
+        - classificacoes: itens ambientais explicitamente listados no decreto;
+        - sem_classificacao: CNAEs existentes sem item no decreto (regra geral);
+        - nao_encontrados: códigos inexistentes na base de CNAEs;
+        - risco_geral: maior risco entre os CNAEs processados (incluindo a regra geral);
+        - risco_classificado: maior risco entre as classificações explícitas.
+        """
+        resultado = {
+            'cnaes_processados': [], 'classificacoes': [],
+            'sem_classificacao': [], 'nao_encontrados': [],
+        }
+        valor_geral = valor_classificado = 0
+        risco_geral = risco_classificado = 'NA'
+
+        for codigo in codigos_limpos:
+            descricao = self.descricoes.get(codigo)
+            if descricao is None:
+                resultado['nao_encontrados'].append(codigo)
+                continue
+
+            itens, risco_cnae = self.itens.get(codigo, ((), None))
+            if itens:
+                resultado['classificacoes'].extend(itens)
+                valor = RISCO_MAP.get(risco_cnae, 0)
+                if valor > valor_classificado:
+                    valor_classificado, risco_classificado = valor, risco_cnae
+            else:
+                # Se não tem classificação específica, assume o padrão de baixo risco
+                itens, risco_cnae = (ITEM_REGRA_GERAL,), 'I'
+                resultado['sem_classificacao'].append(codigo)
+
+            valor = RISCO_MAP.get(risco_cnae, 0)
+            if valor > valor_geral:
+                valor_geral, risco_geral = valor, risco_cnae
+
+            resultado['cnaes_processados'].append({
+                'codigo': codigo,
+                'codigo_formatado': formatar_cnae(codigo),
+                'descricao': descricao,
+                'itens_ambientais': [dict(item) for item in itens],
+                'risco_consolidado': risco_cnae,
+                'cor_consolidada': RISCO_CORES.get(risco_cnae, 'secondary')
+            })
+
+        resultado['risco_geral'] = risco_geral
+        resultado['risco_classificado'] = risco_classificado
+        return resultado
+
+
+def carregar_indice_ambiental(municipio, versao):
+    """Monta o índice do município com as descrições da base SES e os itens da base ambiental dele."""
+    descricoes = {cnae[0]: cnae[1] for cnae in dados_base(BASE_SES)['cnaes']}
+
+    agrupados = {}
+    itens_municipio = dados_base(base_ambiental(municipio))['itens']
+    for cnae, nivel, _, dn_copam, descricao_atividade, exigencia, risco in itens_municipio:
+        agrupados.setdefault(cnae, []).append(MappingProxyType({
+            'nivel_agregacao': nivel,
+            'dn_copam': dn_copam,
+            'descricao_especifica': descricao_atividade,
+            'exigencia': exigencia,
+            'risco': risco,
+            'cor': RISCO_CORES.get(risco, 'secondary')
+        }))
+
+    itens = {
+        codigo: (tuple(lista), risco_maximo(i['risco'] for i in lista))
+        for codigo, lista in agrupados.items()
+    }
+    return IndiceAmbiental(versao, descricoes, itens, obter_municipios()[municipio])
+
+
+def carregar_municipios(versao):
+    return MappingProxyType({
+        m['slug']: m for m in Municipio.objects.order_by('nome').values('slug', 'nome', 'uf', 'norma')
+    })
+
+
+municipios = SnapshotVersionado((BASE_MUNICIPIOS,), carregar_municipios)
+
+
+def obter_municipios():
+    """{slug: {'slug', 'nome', 'uf', 'norma'}} dos municípios cadastrados."""
+    return municipios.obter()
+
+
+class IndicesAmbientais:
+    """Um `SnapshotVersionado` por município, criado na primeira consulta ao município."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indices = {}
+
+    def obter(self, municipio):
+        snapshot = self._indices.get(municipio)
+        if snapshot is None:
+            if municipio not in obter_municipios():
+                raise MunicipioDesconhecido(municipio)
+            with self._lock:
+                snapshot = self._indices.get(municipio)
+                if snapshot is None:
+                    snapshot = self._indices[municipio] = SnapshotVersionado(
+                        (BASE_SES, base_ambiental(municipio)), partial(carregar_indice_ambiental, municipio))
+        return snapshot.obter()
+
+    def invalidar(self):
+        """Descarta os índices de todos os municípios (e a lista de municípios)."""
+        with self._lock:
+            self._indices = {}
+        municipios.invalidar()
+
+
+indices_ambientais = IndicesAmbientais()
+
+
+def obter_indice_ambiental(municipio=None):
+    """Índice ambiental corrente do município (padrão: SIMULADOR_MUNICIPIO_PADRAO) neste worker."""
+    return indices_ambientais.obter(municipio or municipio_padrao())
@@ -0,0 +1,33 @@
+# simulador_risco/assincrono.py
+"""
+Suporte às views assíncronas do simulador (modo ASGI).
+
+As chamadas externas continuam passando pelo `cliente_http` (pool de conexões,
+disjuntor e métricas), mas rodam num pool de threads de I/O dedicado e grande
+(SIMULADOR_ASYNC_THREADS), fora da thread única que o Django reserva para o
+código síncrono. Assim o event loop segura centenas de consultas externas em
+andamento sem bloquear as demais requisições.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'SIMULADOR_ASYNC_THREADS', 100),
+    thread_name_prefix='simulador-io',
+)
+
+
+def _executar(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # As threads de I/O também acessam o banco (cache de CNPJ): libera a conexão
+        close_old_connections()
+
+
+async def em_thread_io(func, *args, **kwargs):
+    """Executa `func` (bloqueante, com I/O externo) no pool de I/O e aguarda o resultado."""
+    return await sync_to_async(_executar, thread_sensitive=False, executor=_executor)(func, *args, **kwargs)
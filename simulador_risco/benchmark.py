@@ -0,0 +1,173 @@
+# simulador_risco/benchmark.py
+"""
+Peças do comando `benchmark_simulador`: servidores locais que fazem o papel do
+Google reCAPTCHA e da BrasilAPI, os cenários de carga e o cálculo das
+estatísticas (p50/p95/p99, consultas ao banco por requisição e requisições
+por segundo).
+"""
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+class _HandlerExterno(BaseHTTPRequestHandler):
+    """Responde como o reCAPTCHA (POST siteverify) e a BrasilAPI (GET /api/cnpj/v1/<cnpj>)."""
+
+    def _responder(self, dados):
+        atraso = self.server.atraso
+        if atraso:
+            time.sleep(atraso)
+        corpo = json.dumps(dados).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self._responder({'success': True, 'score': 0.9, 'action': 'submit'})
+
+    def do_GET(self):
+        cnpj = self.path.rstrip('/').rsplit('/', 1)[-1]
+        # CNAEs determinísticos por CNPJ, sorteados entre os códigos da base
+        sorteio = random.Random(cnpj)
+        cnaes = sorteio.sample(self.server.cnaes, min(5, len(self.server.cnaes)))
+        self._responder({
+            'cnpj': cnpj,
+            'razao_social': f'EMPRESA DE TESTE {cnpj}',
+            'nome_fantasia': 'TESTE',
+            'descricao_situacao_cadastral': 'ATIVA',
+            'cnae_fiscal': int(cnaes[0]),
+            'cnaes_secundarios': [{'codigo': int(c)} for c in cnaes[1:]],
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorExterno:
+    """Servidor HTTP local em thread própria; use como gerenciador de contexto."""
+
+    def __init__(self, cnaes, atraso=0.0):
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', 0), _HandlerExterno)
+        self._servidor.daemon_threads = True
+        self._servidor.cnaes = list(cnaes)
+        self._servidor.atraso = atraso
+        self.url = f'http://127.0.0.1:{self._servidor.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+
+def _post_json(client, nome_url, dados):
+    return client.post(reverse(nome_url), data=json.dumps(dados), content_type='application/json')
+
+
+def montar_cenarios(cnaes, cnaes_risco_p, semente=42):
+    """
+    Cenários {nome: função(client, i) -> resposta}. Cada iteração sorteia um
+    conjunto novo (falhas no cache de respostas), exceto nos cenários '*_repetidos'.
+    """
+    sorteio = random.Random(semente)
+    token = {'g-recaptcha-response': 'benchmark'}
+    repetidos = sorteio.sample(cnaes, 10)
+    termos = ['restaurante', 'comercio varejista', 'construcao', 'farmacia', 'transporte', '4711', 'padaria']
+
+    def classificar(quantidade, base=cnaes, nome_url='simulador_risco:api_consultar_cnaes'):
+        def cenario(client, i):
+            return _post_json(client, nome_url, {'cnaes': sorteio.sample(base, min(quantidade, len(base))), **token})
+        return cenario
+
+    return {
+        'cnaes_1': classificar(1),
+        'cnaes_10': classificar(10),
+        'cnaes_100': classificar(100),
+        'cnaes_repetidos': lambda client, i: _post_json(
+            client, 'simulador_risco:api_consultar_cnaes', {'cnaes': repetidos, **token}),
+        'perguntas_risco_p': classificar(5, base=cnaes_risco_p),
+        'cnaes_desconhecidos': lambda client, i: _post_json(
+            client, 'simulador_risco:api_consultar_cnaes',
+            {'cnaes': [f'99{abs(i) % 10000:04d}{j}' for j in range(10)], **token}),
+        'ambiental_10': classificar(10, nome_url='simulador_risco:api_consultar_cnaes_ambiental'),
+        'cnpj_cache_frio': lambda client, i: client.get(
+            reverse('simulador_risco:api_consultar_cnpj', args=[f'{10 ** 13 + i:014d}']), token),
+        'cnpj_cache_quente': lambda client, i: client.get(
+            reverse('simulador_risco:api_consultar_cnpj', args=['11222333000181']), token),
+        'empresa_cache_quente': lambda client, i: client.get(
+            reverse('simulador_risco:api_consultar_empresa', args=['11222333000181']), token),
+        'buscar_cnae': lambda client, i: client.get(
+            reverse('simulador_risco:api_buscar_cnae'), {'termo': termos[i % len(termos)]}),
+    }
+
+
+def percentil(amostras_ordenadas, p):
+    """Percentil por interpolação linear (amostras já ordenadas)."""
+    if len(amostras_ordenadas) == 1:
+        return amostras_ordenadas[0]
+    posicao = (len(amostras_ordenadas) - 1) * p / 100
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(amostras_ordenadas) - 1)
+    return amostras_ordenadas[baixo] + (amostras_ordenadas[alto] - amostras_ordenadas[baixo]) * (posicao - baixo)
+
+
+def medir(client, cenario, iteracoes, aquecimento=5):
+    """Executa o cenário em sequência e devolve as estatísticas de latência, consultas e vazão."""
+    for i in range(aquecimento):
+        cenario(client, -1 - i)
+
+    latencias, consultas, erros = [], [], 0
+    inicio_total = time.perf_counter()
+    for i in range(iteracoes):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            resposta = cenario(client, i)
+            latencias.append(time.perf_counter() - inicio)
+        consultas.append(len(capturadas))
+        erros += resposta.status_code >= 400
+    duracao_total = time.perf_counter() - inicio_total
+
+    latencias.sort()
+    return {
+        'iteracoes': iteracoes,
+        'erros': erros,
+        'p50_ms': round(1000 * percentil(latencias, 50), 3),
+        'p95_ms': round(1000 * percentil(latencias, 95), 3),
+        'p99_ms': round(1000 * percentil(latencias, 99), 3),
+        'media_ms': round(1000 * statistics.fmean(latencias), 3),
+        'max_ms': round(1000 * latencias[-1], 3),
+        'consultas_por_requisicao': round(statistics.fmean(consultas), 2),
+        'requisicoes_por_segundo': round(iteracoes / duracao_total, 1),
+    }
+
+
+def comparar(atual, anterior, tolerancia):
+    """Linhas de comparação por cenário; marca como regressão o p95 acima da tolerância (fração)."""
+    linhas, regressoes = [], []
+    for nome, dados in atual['cenarios'].items():
+        antes = anterior.get('cenarios', {}).get(nome)
+        if not antes:
+            linhas.append(f'{nome}: sem medição anterior')
+            continue
+        variacoes = {}
+        for campo in ('p50_ms', 'p95_ms', 'p99_ms'):
+            variacoes[campo] = (dados[campo] - antes[campo]) / antes[campo] if antes[campo] else 0.0
+        consultas = dados['consultas_por_requisicao'] - antes['consultas_por_requisicao']
+        linha = (f"{nome}: p50 {variacoes['p50_ms']:+.1%}  p95 {variacoes['p95_ms']:+.1%}  "
+                 f"p99 {variacoes['p99_ms']:+.1%}  consultas {consultas:+.2f}")
+        if variacoes['p95_ms'] > tolerancia or consultas > 0:
+            regressoes.append(nome)
+        linhas.append(linha)
+    return linhas, regressoes
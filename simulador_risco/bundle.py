@@ -0,0 +1,151 @@
+# simulador_risco/bundle.py
+"""
+Pacote estático das regras do simulador para classificação no navegador.
+
+O comando `compilar_bundle` junta a base da Resolução SES (CNAEs, perguntas e
+opções) e a classificação ambiental num JSON compacto, nomeado pelo hash do
+conteúdo (`<hash>.json`), e registra o pacote corrente em `atual.json`. As
+páginas do simulador baixam o pacote uma vez (cache de um ano, imutável) e
+classificam localmente; as APIs continuam como alternativa e para uso em lote.
+
+O pacote só é oferecido às páginas enquanto a versão das bases com que foi
+compilado for a versão corrente: depois de uma importação, até o pacote ser
+recompilado, as páginas voltam a usar as APIs.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .ambiental import ITEM_REGRA_GERAL, RISCO_CORES as RISCO_CORES_AMBIENTAL, obter_indice_ambiental
+from .snapshot import RISCO_CORES, RISCO_MAP, RISCO_TOOLTIPS, TOOLTIP_PROJETO, obter_snapshot_ses
+
+FORMATO_BUNDLE = 1
+ARQUIVO_ATUAL = 'atual.json'
+PADRAO_HASH = re.compile(r'^[0-9a-f]{16}$')
+
+
+def diretorio_bundle():
+    return getattr(settings, 'SIMULADOR_BUNDLE_DIR', os.path.join(settings.MEDIA_ROOT, 'simulador_risco'))
+
+
+def montar_bundle():
+    """Monta o conteúdo do pacote a partir do snapshot SES e do índice ambiental deste worker."""
+    snapshot = obter_snapshot_ses()
+    indice = obter_indice_ambiental()
+
+    cnaes_ses = {}
+    perguntas = {}
+    for codigo, cnae in snapshot.cnaes.items():
+        cnaes_ses[codigo] = [cnae['risco_base'], int(cnae['dispensado_projeto']), list(cnae['perguntas_nums'])]
+    for perguntas_cnae in snapshot.perguntas_por_cnae.values():
+        for numero, pergunta in perguntas_cnae:
+            perguntas[numero] = [pergunta['texto'], [[op['texto'], op['risco']] for op in pergunta['opcoes']]]
+
+    itens_ambientais = {
+        codigo: [risco, [[i['nivel_agregacao'], i['dn_copam'], i['descricao_especifica'], i['exigencia'], i['risco']]
+                         for i in itens]]
+        for codigo, (itens, risco) in indice.itens.items()
+    }
+
+    return {
+        'formato': FORMATO_BUNDLE,
+        'versao': list(indice.versao),
+        'descricoes': dict(indice.descricoes),
+        'ses': {
+            'cnaes': cnaes_ses,
+            'perguntas': perguntas,
+            'ordem': RISCO_MAP,
+            'cores': RISCO_CORES,
+            'tooltips': RISCO_TOOLTIPS,
+            'tooltip_projeto': TOOLTIP_PROJETO,
+        },
+        'ambiental': {
+            'itens': itens_ambientais,
+            'regra_geral': dict(ITEM_REGRA_GERAL),
+            'cores': RISCO_CORES_AMBIENTAL,
+        },
+    }
+
+
+def serializar_bundle(conteudo):
+    """JSON compacto e determinístico + os 16 primeiros caracteres do SHA-256 dele."""
+    dados = json.dumps(conteudo, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode()
+    return dados, hashlib.sha256(dados).hexdigest()[:16]
+
+
+def _gravar_atomico(caminho, dados):
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    with os.fdopen(descritor, 'wb') as f:
+        f.write(dados)
+    os.chmod(temporario, 0o644)  # mkstemp cria com 0600
+    os.replace(temporario, caminho)
+
+
+def gravar_bundle(diretorio=None, manter=3):
+    """Compila e grava o pacote, aponta `atual.json` para ele e remove os pacotes mais antigos."""
+    diretorio = diretorio or diretorio_bundle()
+    os.makedirs(diretorio, exist_ok=True)
+    conteudo = montar_bundle()
+    dados, hash_conteudo = serializar_bundle(conteudo)
+
+    _gravar_atomico(os.path.join(diretorio, f'{hash_conteudo}.json'), dados)
+    manifesto = {'hash': hash_conteudo, 'versao': conteudo['versao'], 'bytes': len(dados)}
+    _gravar_atomico(os.path.join(diretorio, ARQUIVO_ATUAL), json.dumps(manifesto).encode())
+
+    antigos = sorted(
+        (nome for nome in os.listdir(diretorio)
+         if PADRAO_HASH.match(nome.removesuffix('.json')) and nome != f'{hash_conteudo}.json'),
+        key=lambda nome: os.path.getmtime(os.path.join(diretorio, nome)), reverse=True)
+    # Mantém alguns pacotes anteriores para as páginas que ainda estão abertas
+    for nome in antigos[max(manter - 1, 0):]:
+        os.remove(os.path.join(diretorio, nome))
+    return manifesto
+
+
+class _Manifesto:
+    """Lê `atual.json` de novo apenas quando o arquivo muda (mtime)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._manifesto = None
+
+    def obter(self):
+        caminho = os.path.join(diretorio_bundle(), ARQUIVO_ATUAL)
+        try:
+            mtime = os.path.getmtime(caminho)
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(caminho, encoding='utf-8') as f:
+                        self._manifesto = json.load(f)
+                except (OSError, ValueError):
+                    self._manifesto = None
+                self._mtime = mtime
+            return self._manifesto
+
+
+_manifesto = _Manifesto()
+
+
+def bundle_atual():
+    """Hash do pacote corrente, ou None se não existir ou tiver sido compilado de bases antigas."""
+    manifesto = _manifesto.obter()
+    if not manifesto or manifesto.get('versao') != list(obter_indice_ambiental().versao):
+        return None
+    return manifesto['hash']
+
+
+def caminho_bundle(hash_conteudo):
+    """Caminho do arquivo do pacote, ou None se o hash for inválido ou o arquivo não existir."""
+    if not PADRAO_HASH.match(hash_conteudo):
+        return None
+    caminho = os.path.join(diretorio_bundle(), f'{hash_conteudo}.json')
+    return caminho if os.path.exists(caminho) else None
@@ -0,0 +1,206 @@
+# simulador_risco/busca.py
+"""
+Índice de busca em memória para o autocompletar de CNAEs.
+
+Cada CNAE é um documento com a descrição oficial e os sinônimos de atividade
+do Decreto Ambiental (ex: "Canil; Criação De Cães"). Os textos são
+normalizados sem acentos e em minúsculas, então "construcao" encontra
+"Construção". A busca combina:
+
+1. Prefixo de palavras: cada termo digitado precisa ser prefixo de alguma
+   palavra do documento (vocabulário ordenado + bisect);
+2. Trigramas: quando nenhum documento casa por prefixo, procura trechos no
+   meio das palavras e erros de digitação leves, ordenados pela similaridade;
+3. Código: termos numéricos casam com o início (ou o meio) do código CNAE.
+
+O índice é reconstruído automaticamente quando o carimbo das bases muda.
+"""
+import heapq
+import unicodedata
+from bisect import bisect_left
+
+from .ambiental import base_ambiental, municipio_padrao
+from .snapshot import BASE_SES, SnapshotVersionado
+from .utils import formatar_cnae
+from .versoes import dados_base
+
+# Textos sem conteúdo útil na planilha do decreto
+TEXTOS_IGNORADOS = {'', '-', 'não listada'}
+# Similaridade mínima (Jaccard de trigramas) entre um termo e uma palavra do índice
+SIMILARIDADE_MINIMA = 0.4
+PESO_SINONIMO = 0.5
+
+
+def normalizar(texto):
+    """Remove acentos, passa para minúsculas e troca pontuação por espaço."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ''.join(c if c.isalnum() else ' ' for c in sem_acentos.lower())
+
+
+def trigramas(texto):
+    trigs = set()
+    for palavra in texto.split():
+        palavra = f'  {palavra} '
+        trigs.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return trigs
+
+
+class IndiceBusca:
+    """Índice invertido por palavra (e trigramas do vocabulário) sobre os documentos de CNAE."""
+
+    __slots__ = ('versao', 'codigos', 'textos', 'descricoes_norm', 'vocabulario',
+                 'docs_por_palavra', 'palavras_por_trigrama', 'trigramas_por_palavra')
+
+    def __init__(self, versao, documentos):
+        """`documentos`: lista de (codigo, descricao, [sinônimos]); os ids seguem a ordem dos códigos."""
+        self.versao = versao
+        self.codigos = []
+        self.textos = []
+        self.descricoes_norm = []
+        self.docs_por_palavra = {}
+
+        for doc_id, (codigo, descricao, sinonimos) in enumerate(sorted(documentos)):
+            self.codigos.append(codigo)
+            self.textos.append(f"{formatar_cnae(codigo)} - {descricao}")
+            descricao_norm = normalizar(descricao)
+            self.descricoes_norm.append(descricao_norm)
+            texto_norm = ' '.join([descricao_norm] + [normalizar(s) for s in sinonimos])
+            for palavra in set(texto_norm.split()):
+                self.docs_por_palavra.setdefault(palavra, set()).add(doc_id)
+
+        self.vocabulario = sorted(self.docs_por_palavra)
+        self.palavras_por_trigrama = {}
+        self.trigramas_por_palavra = []
+        for idx, palavra in enumerate(self.vocabulario):
+            trigs = trigramas(palavra)
+            self.trigramas_por_palavra.append(len(trigs))
+            for trig in trigs:
+                self.palavras_por_trigrama.setdefault(trig, []).append(idx)
+
+    def _docs_com_prefixo(self, prefixo):
+        docs = set()
+        i = bisect_left(self.vocabulario, prefixo)
+        while i < len(self.vocabulario) and self.vocabulario[i].startswith(prefixo):
+            docs |= self.docs_por_palavra[self.vocabulario[i]]
+            i += 1
+        return docs
+
+    def _buscar_codigo(self, digitos, limite):
+        achados = []
+        for doc_id in range(bisect_left(self.codigos, digitos), len(self.codigos)):
+            if not self.codigos[doc_id].startswith(digitos) or len(achados) >= limite:
+                break
+            achados.append(doc_id)
+        if len(achados) < limite:
+            vistos = set(achados)
+            achados += [doc_id for doc_id, codigo in enumerate(self.codigos)
+                        if doc_id not in vistos and digitos in codigo][:limite - len(achados)]
+        return achados
+
+    def _pontuar(self, doc_id, palavras, termo_norm):
+        descricao = self.descricoes_norm[doc_id]
+        palavras_descricao = descricao.split()
+        pontos = 0.0
+        for palavra in palavras:
+            if palavra in palavras_descricao:
+                pontos += 3
+            elif any(p.startswith(palavra) for p in palavras_descricao):
+                pontos += 2
+            else:
+                pontos += 1  # casou apenas por sinônimo
+        if descricao.startswith(termo_norm):
+            pontos += 2
+        # Descrições mais curtas e específicas primeiro
+        return pontos - len(descricao) / 1000
+
+    def buscar(self, termo, limite=10):
+        """Retorna até `limite` ids de documento, do mais para o menos relevante."""
+        termo_norm = normalizar(termo).strip()
+        palavras = termo_norm.split()
+        if not palavras:
+            return []
+
+        digitos = ''.join(filter(str.isdigit, termo))
+        if digitos and digitos == ''.join(palavras):
+            return self._buscar_codigo(digitos, limite)
+
+        candidatos = None
+        for palavra in palavras:
+            docs = self._docs_com_prefixo(palavra)
+            candidatos = docs if candidatos is None else candidatos & docs
+            if not candidatos:
+                break
+
+        resultado = heapq.nlargest(
+            limite, candidatos or (), key=lambda d: (self._pontuar(d, palavras, termo_norm), -d))
+
+        if not resultado:
+            resultado = self._buscar_trigramas(palavras, limite)
+        return resultado
+
+    def _palavras_parecidas(self, palavra):
+        """Palavras do vocabulário com similaridade de trigramas acima do mínimo: {palavra: similaridade}."""
+        trigs = trigramas(palavra)
+        comuns = {}
+        for trig in trigs:
+            for idx in self.palavras_por_trigrama.get(trig, ()):
+                comuns[idx] = comuns.get(idx, 0) + 1
+        parecidas = {}
+        for idx, n in comuns.items():
+            similaridade = n / (len(trigs) + self.trigramas_por_palavra[idx] - n)
+            if similaridade >= SIMILARIDADE_MINIMA:
+                parecidas[self.vocabulario[idx]] = similaridade
+        return parecidas
+
+    def _buscar_trigramas(self, palavras, limite):
+        """Cada termo casa com as palavras mais parecidas do vocabulário (erros de digitação, trechos)."""
+        candidatos = None
+        pontos = {}
+        for palavra in palavras:
+            docs_palavra = {}
+            for parecida, similaridade in self._palavras_parecidas(palavra).items():
+                for doc_id in self.docs_por_palavra[parecida]:
+                    # Casar pela descrição oficial vale mais que casar por sinônimo
+                    peso = 1.0 if parecida in self.descricoes_norm[doc_id].split() else PESO_SINONIMO
+                    docs_palavra[doc_id] = max(docs_palavra.get(doc_id, 0), similaridade * peso)
+            for doc_id in self._docs_com_prefixo(palavra):
+                docs_palavra[doc_id] = 1.0
+            candidatos = set(docs_palavra) if candidatos is None else candidatos & docs_palavra.keys()
+            if not candidatos:
+                return []
+            for doc_id in candidatos:
+                pontos[doc_id] = pontos.get(doc_id, 0) + docs_palavra[doc_id]
+        # Descrições mais curtas e específicas primeiro
+        return heapq.nlargest(
+            limite, candidatos, key=lambda d: (pontos[d] - len(self.descricoes_norm[d]) / 1000, -d))
+
+    def autocompletar(self, termo, limite=10):
+        """Formato esperado pelo Select2: [{'id': codigo, 'text': '0000-0/00 - descrição'}]."""
+        return [{'id': self.codigos[i], 'text': self.textos[i]} for i in self.buscar(termo, limite)]
+
+
+def carregar_indice_busca(versao):
+    """
+    Monta os documentos (descrição + sinônimos do decreto) a partir das versões
+    ativas das bases. Os sinônimos vêm da base ambiental do município padrão.
+    """
+    sinonimos = {}
+    for cnae, _, descricao_cnae, _, descricao_atividade, _, _ in dados_base(base_ambiental(municipio_padrao()))['itens']:
+        for texto in (descricao_cnae, descricao_atividade):
+            if texto and texto.strip().lower() not in TEXTOS_IGNORADOS:
+                sinonimos.setdefault(cnae, set()).add(texto.strip())
+
+    documentos = [
+        (codigo, descricao, sorted(sinonimos.get(codigo, ())))
+        for codigo, descricao, *_ in dados_base(BASE_SES)['cnaes']
+    ]
+    return IndiceBusca(versao, documentos)
+
+
+indice_busca = SnapshotVersionado((BASE_SES, base_ambiental(municipio_padrao())), carregar_indice_busca)
+
+
+def buscar_cnaes(termo, limite=10):
+    """Atalho para o autocompletar sobre o índice corrente deste worker."""
+    return indice_busca.obter().autocompletar(termo, limite)
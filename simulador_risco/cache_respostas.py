@@ -0,0 +1,136 @@
+# simulador_risco/cache_respostas.py
+"""
+Cache das respostas das APIs de classificação (`api_consultar_cnaes` e
+`api_consultar_cnaes_ambiental`). A consulta de empresa (`api_consultar_empresa`)
+monta a resposta combinada a partir das mesmas duas entradas.
+
+A maior parte do tráfego repete as mesmas combinações de CNAEs (a mesma
+empresa simulada de novo, CNAEs comuns de comércio). A chave é o conjunto
+ordenado de códigos mais a versão da base (e, na ambiental, o município), e o valor é o JSON já serializado:
+um acerto não toca o banco nem o codificador JSON. Como a versão faz parte da
+chave, uma importação nova invalida tudo naturalmente; as entradas antigas
+saem pelo LRU, limitado pelo total de bytes (SIMULADOR_CACHE_RESPOSTAS_BYTES).
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .ambiental import obter_indice_ambiental
+from .snapshot import obter_snapshot_ses
+from .utils import limpar_cnae
+
+
+class CacheRespostas:
+    """LRU de respostas serializadas (bytes), limitado pelo tamanho total, com contadores."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or getattr(settings, 'SIMULADOR_CACHE_RESPOSTAS_BYTES', 32 * 1024 * 1024)
+        self._dados = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def obter_ou_gerar(self, chave, gerar):
+        """Devolve os bytes em cache para `chave` ou serializa `gerar()` e guarda o resultado."""
+        with self._lock:
+            conteudo = self._dados.get(chave)
+            if conteudo is not None:
+                self._dados.move_to_end(chave)
+                self.acertos += 1
+                return conteudo
+            self.falhas += 1
+
+        # Gerado fora do lock: duas requisições simultâneas da mesma chave apenas repetem o trabalho
+        conteudo = json.dumps(gerar(), cls=DjangoJSONEncoder).encode()
+        if len(conteudo) > self.max_bytes:
+            return conteudo
+
+        with self._lock:
+            anterior = self._dados.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._dados[chave] = conteudo
+            self._bytes += len(conteudo)
+            while self._bytes > self.max_bytes:
+                _, descartado = self._dados.popitem(last=False)
+                self._bytes -= len(descartado)
+                self.descartes += 1
+        return conteudo
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+            self._bytes = 0
+
+    def metricas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acerto': round(self.acertos / consultas, 3) if consultas else 0.0,
+                'descartes': self.descartes,
+                'entradas': len(self._dados),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+cache_respostas = CacheRespostas()
+
+
+def _chave(codigos_limpos):
+    # Ordem e repetições não mudam a classificação: a resposta é sempre gerada sobre o conjunto ordenado
+    return tuple(sorted(set(codigos_limpos)))
+
+
+def resposta_sanitaria(codigos_limpos):
+    """JSON (bytes) de `api_consultar_cnaes` para os códigos limpos."""
+    snapshot = obter_snapshot_ses()
+    codigos = _chave(codigos_limpos)
+    return cache_respostas.obter_ou_gerar(
+        ('ses', snapshot.versao, codigos), lambda: snapshot.classificar(list(codigos)))
+
+
+def resposta_ambiental(codigos_limpos, municipio=None):
+    """
+    JSON (bytes) de `api_consultar_cnaes_ambiental` para os códigos limpos, na
+    base do município (padrão: SIMULADOR_MUNICIPIO_PADRAO). Levanta
+    `MunicipioDesconhecido` se o município não estiver cadastrado.
+    """
+    indice = obter_indice_ambiental(municipio)
+    codigos = _chave(codigos_limpos)
+
+    def gerar():
+        classificacao = indice.classificar(list(codigos))
+        return {
+            'cnaes_processados': classificacao['cnaes_processados'],
+            'risco_geral': classificacao['risco_geral'],
+        }
+
+    return cache_respostas.obter_ou_gerar(('ambiental', indice.municipio['slug'], indice.versao, codigos), gerar)
+
+
+def resposta_empresa(dados_cnpj, municipio=None):
+    """
+    JSON (bytes) de `api_consultar_empresa`: os dados cadastrais do CNPJ mais as
+    classificações sanitária e ambiental dos seus CNAEs, emendadas já serializadas.
+    """
+    codigos = [limpar_cnae(c) for c in dados_cnpj['cnaes'] if c and c != '0']
+    cabecalho = json.dumps(
+        {'empresa_data': dados_cnpj['empresa_data'], 'cnaes': dados_cnpj['cnaes']}, cls=DjangoJSONEncoder).encode()
+    return b''.join((
+        cabecalho[:-1],
+        b', "sanitario": ', resposta_sanitaria(codigos),
+        b', "ambiental": ', resposta_ambiental(codigos, municipio), b'}',
+    ))
+
+
+def metricas():
+    """Atalho para os contadores do cache deste worker."""
+    return cache_respostas.metricas()
@@ -0,0 +1,164 @@
+# simulador_risco/carteira.py
+"""
+Carteira de empresas acompanhadas pela consultoria (`ItemCarteira`, por
+cliente `gestao.Empresa`), com a última classificação sanitária e ambiental
+gravada no próprio item.
+
+Cada item mantém o índice reverso `CNAECarteira` (CNAE -> itens). Quando uma
+base muda (importação, dispensa de projeto, ativação de versão), os comandos
+guardam o conteúdo servido antes da mudança com `conteudo_atual`, e
+`recalcular_apos_mudanca` compara com o conteúdo novo (`calcular_diferencas`),
+busca pelo índice só os itens que têm algum dos CNAEs alterados e os
+reclassifica, gravando um `RelatorioCarteira` com o que mudou em cada um.
+A base ambiental de um município só afeta os itens daquele município.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .ambiental import base_ambiental, indices_ambientais, municipio_padrao
+from .cnpj import consultar_cnpj
+from .lote import classificar_cnaes
+from .models import CNAECarteira, CarimboVersao, ItemCarteira, RelatorioCarteira
+from .snapshot import BASE_SES, snapshot_ses
+from .utils import limpar_cnae
+from .versoes import calcular_diferencas, dados_base, tipo_base
+
+# Campos do resumo comparados a cada reclassificação
+CAMPOS_RESUMO = ('risco_sanitario', 'projeto_obrigatorio', 'pendente', 'risco_ambiental')
+
+
+def _municipio(item):
+    return item.municipio.slug if item.municipio_id else municipio_padrao()
+
+
+def indexar_item(item):
+    """Refaz as entradas do item no índice reverso a partir de `item.cnaes`."""
+    with transaction.atomic():
+        CNAECarteira.objects.filter(item=item).delete()
+        CNAECarteira.objects.bulk_create(CNAECarteira(item=item, codigo=codigo) for codigo in set(item.cnaes))
+
+
+def classificar_item(item):
+    """
+    Classifica o item nas bases em uso e grava o resultado.
+    Retorna {campo: [antes, depois]} do que mudou desde a classificação anterior;
+    os riscos de cada CNAE aparecem como 'sanitario:<codigo>' e 'ambiental:<codigo>'.
+    """
+    municipio = _municipio(item)
+    resultado = classificar_cnaes(item.cnaes, item.respostas, municipio)
+    sanitario, ambiental = resultado['sanitario'], resultado['ambiental']
+    riscos_resolvidos = sanitario['riscos_resolvidos']
+    novo = {
+        'risco_sanitario': sanitario['risco'],
+        'projeto_obrigatorio': sanitario['projeto_obrigatorio'],
+        'pendente': sanitario['pendente'],
+        'risco_ambiental': ambiental['risco'],
+        'classificacao': {
+            'sanitario': {
+                cnae['codigo']: riscos_resolvidos.get(cnae['codigo'], cnae['risco_base'])
+                for cnae in sanitario['cnaes_processados']
+            },
+            'ambiental': {cnae['codigo']: cnae['risco_consolidado'] for cnae in ambiental['cnaes_processados']},
+        },
+    }
+
+    mudancas = {}
+    if item.classificado_em:
+        for campo in CAMPOS_RESUMO:
+            if getattr(item, campo) != novo[campo]:
+                mudancas[campo] = [getattr(item, campo), novo[campo]]
+        for nome_base, riscos in novo['classificacao'].items():
+            anteriores = item.classificacao.get(nome_base, {})
+            for codigo in sorted(anteriores.keys() | riscos.keys()):
+                if anteriores.get(codigo) != riscos.get(codigo):
+                    mudancas[f'{nome_base}:{codigo}'] = [anteriores.get(codigo), riscos.get(codigo)]
+
+    bases = (BASE_SES, base_ambiental(municipio))
+    for campo, valor in novo.items():
+        setattr(item, campo, valor)
+    item.versoes = dict(zip(bases, CarimboVersao.atuais(*bases)))
+    item.classificado_em = timezone.now()
+    item.save(update_fields=[*novo, 'versoes', 'classificado_em'])
+    return mudancas
+
+
+def adicionar_item(empresa, cnpj='', cnaes=(), nome='', municipio=None, respostas=None):
+    """
+    Inclui na carteira do cliente um CNPJ (os CNAEs vêm da consulta do CNPJ) ou
+    um conjunto de CNAEs, já indexado e classificado.
+    """
+    cnpj = ''.join(filter(str.isdigit, cnpj or ''))
+    if cnpj:
+        dados = consultar_cnpj(cnpj)
+        cnaes = dados['cnaes']
+        nome = nome or dados['empresa_data'].get('razao_social') or ''
+    codigos = sorted({limpar_cnae(c) for c in cnaes if c and c != '0'} - {''})
+    with transaction.atomic():
+        item = ItemCarteira.objects.create(
+            empresa=empresa, cnpj=cnpj, nome=nome, cnaes=codigos, respostas=respostas or {}, municipio=municipio)
+        indexar_item(item)
+    classificar_item(item)
+    return item
+
+
+def itens_afetados(base, codigos):
+    """Itens da carteira com algum dos CNAEs, pelo índice reverso (na base ambiental, só os do município)."""
+    itens = ItemCarteira.objects.filter(indice_cnaes__codigo__in=codigos)
+    if tipo_base(base) == 'ambiental':
+        municipio = base.partition(':')[2]
+        filtro = Q(municipio__slug=municipio)
+        if municipio == municipio_padrao():
+            filtro |= Q(municipio__isnull=True)
+        itens = itens.filter(filtro)
+    return itens.distinct().select_related('empresa', 'municipio')
+
+
+def recalcular_carteira(base, codigos):
+    """Reclassifica os itens com algum dos CNAEs alterados na base e grava o relatório (None se nada mudou)."""
+    codigos = sorted(codigos)
+    if not codigos:
+        return None
+    # O comando que alterou a base pode ter carregado as bases antigas neste processo
+    snapshot_ses.invalidar()
+    indices_ambientais.invalidar()
+
+    recalculados, mudancas = 0, []
+    for item in itens_afetados(base, codigos):
+        campos = classificar_item(item)
+        recalculados += 1
+        if campos:
+            mudancas.append({
+                'item': item.pk, 'empresa': str(item.empresa), 'cnpj': item.cnpj, 'nome': item.nome,
+                'campos': campos,
+            })
+    return RelatorioCarteira.objects.create(
+        base=base, versao=CarimboVersao.atual(base), cnaes_alterados=codigos,
+        itens_recalculados=recalculados, mudancas=mudancas)
+
+
+def conteudo_atual(base):
+    """Conteúdo servido da base, para comparar depois da mudança (None com a carteira vazia)."""
+    return dados_base(base) if CNAECarteira.objects.exists() else None
+
+
+def recalcular_apos_mudanca(base, antes):
+    """Reclassifica os itens afetados pelas diferenças entre `antes` (ver `conteudo_atual`) e o conteúdo servido agora."""
+    if antes is None:
+        return None
+    diferencas = calcular_diferencas(base, antes, dados_base(base))
+    codigos = diferencas['novos'] + diferencas['removidos'] + [item['codigo'] for item in diferencas['alterados']]
+    return recalcular_carteira(base, codigos)
+
+
+def linhas_relatorio(relatorio):
+    """Texto do relatório para a saída dos comandos."""
+    if relatorio is None:
+        yield 'Carteira: nenhum CNAE da carteira foi alterado.'
+        return
+    yield (f'Carteira: {len(relatorio.cnaes_alterados)} CNAEs alterados na base {relatorio.base}, '
+           f'{relatorio.itens_recalculados} itens reclassificados, {len(relatorio.mudancas)} com mudança '
+           f'(relatório {relatorio.pk}).')
+    for mudanca in relatorio.mudancas:
+        campos = '; '.join(f'{campo}: {antes} -> {depois}' for campo, (antes, depois) in mudanca['campos'].items())
+        yield f"  {mudanca['empresa']} / {mudanca['nome'] or mudanca['cnpj'] or mudanca['item']}: {campos}"
@@ -0,0 +1,216 @@
+# simulador_risco/cliente_http.py
+"""
+Cliente HTTP compartilhado para as chamadas externas do simulador
+(Google reCAPTCHA e BrasilAPI).
+
+- Uma única `requests.Session` por processo, com pool de conexões keep-alive,
+  evita um novo handshake TCP+TLS a cada requisição;
+- Cada host tem seu orçamento de tempo (timeout de conexão, de leitura e
+  tempo total incluindo as novas tentativas);
+- Novas tentativas com backoff exponencial e jitter, apenas onde é seguro
+  repetir (o token do reCAPTCHA só pode ser verificado uma vez);
+- Um disjuntor por host passa a falhar imediatamente depois de uma sequência
+  de erros, liberando os workers enquanto o serviço externo está degradado;
+- Contadores de latência e de erros por host, expostos por `metricas()`.
+"""
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Configuração padrão por host; pode ser sobrescrita em settings.SIMULADOR_HTTP_HOSTS
+HOSTS_PADRAO = {
+    'www.google.com': {
+        'timeout_conexao': 2.0, 'timeout_leitura': 3.0, 'orcamento': 4.0,
+        'tentativas': 0, 'falhas_para_abrir': 5, 'segundos_aberto': 30,
+    },
+    'brasilapi.com.br': {
+        'timeout_conexao': 2.0, 'timeout_leitura': 5.0, 'orcamento': 8.0,
+        'tentativas': 2, 'falhas_para_abrir': 5, 'segundos_aberto': 60,
+    },
+}
+CONFIG_GENERICA = {
+    'timeout_conexao': 3.0, 'timeout_leitura': 5.0, 'orcamento': 10.0,
+    'tentativas': 1, 'falhas_para_abrir': 5, 'segundos_aberto': 30,
+}
+STATUS_REPETIVEIS = {429, 502, 503, 504}
+BACKOFF_BASE = 0.2
+
+
+class CircuitoAberto(requests.RequestException):
+    """Levantada sem tentar a chamada quando o disjuntor do host está aberto."""
+
+
+class Disjuntor:
+    """Disjuntor clássico: fechado -> aberto após N falhas -> meio-aberto após o intervalo."""
+
+    def __init__(self, falhas_para_abrir, segundos_aberto):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.segundos_aberto = segundos_aberto
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._falhas < self.falhas_para_abrir:
+                return 'fechado'
+            return 'aberto' if time.monotonic() < self._aberto_ate else 'meio-aberto'
+
+    def permitir(self):
+        """No estado meio-aberto, deixa passar uma chamada de teste por intervalo."""
+        with self._lock:
+            if self._falhas < self.falhas_para_abrir:
+                return True
+            agora = time.monotonic()
+            if agora < self._aberto_ate:
+                return False
+            self._aberto_ate = agora + self.segundos_aberto
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self._falhas == self.falhas_para_abrir:
+                self._aberto_ate = time.monotonic() + self.segundos_aberto
+
+
+class MetricasHost:
+    """Contadores de um host (protegidos pelo lock do cliente)."""
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.erros = 0
+        self.tentativas_extras = 0
+        self.rejeitadas_circuito = 0
+        self.latencia_total = 0.0
+        self.latencia_max = 0.0
+
+    def como_dict(self):
+        concluidas = self.requisicoes - self.rejeitadas_circuito
+        return {
+            'requisicoes': self.requisicoes,
+            'erros': self.erros,
+            'tentativas_extras': self.tentativas_extras,
+            'rejeitadas_circuito': self.rejeitadas_circuito,
+            'latencia_media_ms': round(1000 * self.latencia_total / concluidas, 1) if concluidas else 0.0,
+            'latencia_max_ms': round(1000 * self.latencia_max, 1),
+        }
+
+
+class ClienteHTTP:
+    """Sessão com pool de conexões + disjuntor e métricas por host."""
+
+    def __init__(self, hosts=None, tamanho_pool=None):
+        self._hosts = dict(HOSTS_PADRAO)
+        self._hosts.update(hosts if hosts is not None else getattr(settings, 'SIMULADOR_HTTP_HOSTS', {}))
+        tamanho_pool = tamanho_pool or getattr(settings, 'SIMULADOR_HTTP_POOL', 10)
+
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=len(self._hosts) + 2, pool_maxsize=tamanho_pool, max_retries=0)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+
+        self._lock = threading.Lock()
+        self._disjuntores = {}
+        self._metricas = {}
+
+    def _config(self, host):
+        return {**CONFIG_GENERICA, **self._hosts.get(host, {})}
+
+    def _disjuntor(self, host, config):
+        with self._lock:
+            if host not in self._disjuntores:
+                self._disjuntores[host] = Disjuntor(config['falhas_para_abrir'], config['segundos_aberto'])
+                self._metricas[host] = MetricasHost()
+            return self._disjuntores[host], self._metricas[host]
+
+    def request(self, method, url, **kwargs):
+        """
+        Faz a requisição respeitando o orçamento de tempo, as novas tentativas e
+        o disjuntor do host. Erros de rede e respostas 5xx/429 finais são
+        levantados como requests.RequestException (CircuitoAberto inclusive).
+        """
+        host = urlsplit(url).hostname or ''
+        config = self._config(host)
+        disjuntor, metricas = self._disjuntor(host, config)
+
+        with self._lock:
+            metricas.requisicoes += 1
+        if not disjuntor.permitir():
+            with self._lock:
+                metricas.rejeitadas_circuito += 1
+            raise CircuitoAberto(f'Serviço {host} temporariamente indisponível (circuito aberto).')
+
+        inicio = time.monotonic()
+        prazo = inicio + config['orcamento']
+        tentativa = 0
+        try:
+            while True:
+                restante = prazo - time.monotonic()
+                timeout = (min(config['timeout_conexao'], restante), min(config['timeout_leitura'], restante))
+                try:
+                    response = self.session.request(method, url, timeout=timeout, **kwargs)
+                    if response.status_code in STATUS_REPETIVEIS:
+                        response.raise_for_status()
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+                    espera = random.uniform(0, BACKOFF_BASE * (2 ** tentativa))
+                    if tentativa >= config['tentativas'] or time.monotonic() + espera >= prazo - 0.1:
+                        raise
+                    tentativa += 1
+                    with self._lock:
+                        metricas.tentativas_extras += 1
+                    time.sleep(espera)
+        except requests.RequestException:
+            disjuntor.registrar_falha()
+            self._registrar_latencia(metricas, inicio, erro=True)
+            raise
+
+        if response.status_code >= 500:
+            disjuntor.registrar_falha()
+        else:
+            disjuntor.registrar_sucesso()
+        self._registrar_latencia(metricas, inicio, erro=response.status_code >= 400)
+        return response
+
+    def _registrar_latencia(self, metricas, inicio, erro):
+        duracao = time.monotonic() - inicio
+        with self._lock:
+            metricas.latencia_total += duracao
+            metricas.latencia_max = max(metricas.latencia_max, duracao)
+            if erro:
+                metricas.erros += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metricas(self):
+        """Retorna os contadores por host, com o estado atual do disjuntor."""
+        with self._lock:
+            hosts = list(self._metricas.items())
+            disjuntores = dict(self._disjuntores)
+        return {
+            host: {**metricas.como_dict(), 'circuito': disjuntores[host].estado}
+            for host, metricas in hosts
+        }
+
+
+cliente = ClienteHTTP()
+
+
+def metricas():
+    """Atalho para os contadores do cliente compartilhado deste worker."""
+    return cliente.metricas()
@@ -0,0 +1,194 @@
+# simulador_risco/cnpj.py
+"""
+Cache das consultas de CNPJ feitas à BrasilAPI.
+
+Antes de tudo, `consultar_cnpj` procura o CNPJ no espelho local dos Dados
+Abertos da Receita Federal (ver simulador_risco.espelho_cnpj), quando ele foi
+importado. Fora do espelho, as camadas, da mais rápida para a mais lenta, são:
+1. LRU em memória do processo (SIMULADOR_CNPJ_LRU_TAMANHO entradas);
+2. Tabela `ConsultaCNPJ` com a resposta normalizada;
+3. Chamada à BrasilAPI.
+
+Uma entrada mais velha que SIMULADOR_CNPJ_TTL é servida mesmo assim
+(stale-while-revalidate) e atualizada em segundo plano. Se a BrasilAPI estiver
+fora do ar, qualquer entrada existente, por mais antiga que seja, é devolvida.
+Consultas simultâneas do mesmo CNPJ compartilham uma única chamada externa.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .cliente_http import cliente
+from .espelho_cnpj import consultar_espelho
+from .models import ConsultaCNPJ
+
+logger = logging.getLogger(__name__)
+
+BRASILAPI_CNPJ_URL = 'https://brasilapi.com.br/api/cnpj/v1/'
+
+
+def _ttl():
+    return getattr(settings, 'SIMULADOR_CNPJ_TTL', 7 * 24 * 3600)
+
+
+def normalizar_resposta(data):
+    """Reduz a resposta da BrasilAPI aos campos usados pelo simulador."""
+    cnaes_codes = []
+    if data.get('cnae_fiscal'):
+        cnaes_codes.append(str(data['cnae_fiscal']))
+    if data.get('cnaes_secundarios'):
+        for cnae_sec in data.get('cnaes_secundarios', []):
+            cnaes_codes.append(str(cnae_sec.get('codigo')))
+
+    return {
+        'empresa_data': {
+            'razao_social': data.get('razao_social'),
+            'nome_fantasia': data.get('nome_fantasia'),
+            'situacao_cadastral': data.get('descricao_situacao_cadastral'),
+        },
+        'cnaes': cnaes_codes
+    }
+
+
+def buscar_brasilapi(cnpj_limpo):
+    """Consulta a BrasilAPI e devolve a resposta normalizada (levanta requests.RequestException)."""
+    url_base = getattr(settings, 'SIMULADOR_BRASILAPI_CNPJ_URL', BRASILAPI_CNPJ_URL)
+    response = cliente.get(f"{url_base}{cnpj_limpo}")
+    response.raise_for_status()
+    return normalizar_resposta(response.json())
+
+
+class _LRU:
+    """LRU simples protegido por lock: cnpj -> (dados, obtido_em em epoch)."""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            valor = self._dados.get(chave)
+            if valor is not None:
+                self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho:
+                self._dados.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+
+class _Voo:
+    """Chamada externa em andamento, compartilhada entre as requisições do mesmo CNPJ."""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.dados = None
+        self.erro = None
+
+
+class CacheCNPJ:
+    """LRU + tabela `ConsultaCNPJ` na frente da função `buscar` (BrasilAPI por padrão)."""
+
+    def __init__(self, buscar=buscar_brasilapi, tamanho_lru=None):
+        self._buscar = buscar
+        self._lru = _LRU(tamanho_lru or getattr(settings, 'SIMULADOR_CNPJ_LRU_TAMANHO', 2048))
+        self._voos = {}
+        self._voos_lock = threading.Lock()
+        self._revalidando = set()
+
+    def consultar(self, cnpj_limpo):
+        """Retorna os dados normalizados do CNPJ, consultando a BrasilAPI só quando necessário."""
+        entrada = self._lru.get(cnpj_limpo)
+        if entrada is None:
+            registro = ConsultaCNPJ.objects.filter(cnpj=cnpj_limpo).first()
+            if registro is not None:
+                entrada = (registro.dados, registro.consultado_em.timestamp())
+                self._lru.set(cnpj_limpo, entrada)
+
+        if entrada is None:
+            return self._buscar_coalescido(cnpj_limpo)
+
+        dados, obtido_em = entrada
+        if time.time() - obtido_em > _ttl():
+            # Entrada vencida: responde com ela e atualiza em segundo plano
+            self._revalidar_em_segundo_plano(cnpj_limpo)
+        return dados
+
+    def _buscar_coalescido(self, cnpj_limpo):
+        with self._voos_lock:
+            voo = self._voos.get(cnpj_limpo)
+            lider = voo is None
+            if lider:
+                voo = self._voos[cnpj_limpo] = _Voo()
+
+        if not lider:
+            voo.evento.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.dados
+
+        try:
+            voo.dados = self._buscar(cnpj_limpo)
+            self._gravar(cnpj_limpo, voo.dados)
+            return voo.dados
+        except Exception as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._voos_lock:
+                self._voos.pop(cnpj_limpo, None)
+            voo.evento.set()
+
+    def _revalidar_em_segundo_plano(self, cnpj_limpo):
+        with self._voos_lock:
+            if cnpj_limpo in self._voos or cnpj_limpo in self._revalidando:
+                return
+            self._revalidando.add(cnpj_limpo)
+        threading.Thread(target=self._revalidar, args=(cnpj_limpo,), daemon=True).start()
+
+    def _revalidar(self, cnpj_limpo):
+        try:
+            self._buscar_coalescido(cnpj_limpo)
+        except Exception as e:
+            # Mantém a entrada antiga; a próxima consulta tenta novamente
+            logger.warning("Falha ao revalidar CNPJ %s: %s", cnpj_limpo, e)
+        finally:
+            with self._voos_lock:
+                self._revalidando.discard(cnpj_limpo)
+            connections.close_all()
+
+    def _gravar(self, cnpj_limpo, dados):
+        agora = timezone.now()
+        self._lru.set(cnpj_limpo, (dados, agora.timestamp()))
+        try:
+            ConsultaCNPJ.objects.update_or_create(cnpj=cnpj_limpo, defaults={'dados': dados, 'consultado_em': agora})
+        except DatabaseError as e:
+            # A resposta já foi obtida; não perde a consulta por falha ao gravar o cache
+            logger.warning("Falha ao gravar cache do CNPJ %s: %s", cnpj_limpo, e)
+
+    def limpar_memoria(self):
+        self._lru.clear()
+
+
+cache_cnpj = CacheCNPJ()
+
+
+def consultar_cnpj(cnpj_limpo):
+    """Espelho local da Receita Federal e, na falta do CNPJ nele, o cache de CNPJ deste worker."""
+    dados = consultar_espelho(cnpj_limpo)
+    if dados is not None:
+        return dados
+    return cache_cnpj.consultar(cnpj_limpo)
@@ -0,0 +1,377 @@
+# simulador_risco/espelho_cnpj.py
+"""
+Espelho local dos Dados Abertos do CNPJ (Receita Federal).
+
+O comando `importar_espelho_cnpj` lê os arquivos de Estabelecimentos (CNPJ,
+nome fantasia, situação cadastral, CNAE principal e secundários) e, se
+informados, os de Empresas (razão social) e grava dois arquivos binários
+ordenados em SIMULADOR_ESPELHO_CNPJ_DIR:
+
+- estabelecimentos.bin: chave = CNPJ de 14 dígitos;
+- empresas.bin: chave = CNPJ básico (8 primeiros dígitos).
+
+Formato de cada arquivo (inteiros sem sinal de 64 bits na ordem de bytes da máquina):
+
+    cabeçalho   MAGICO (8 bytes), ordem dos bytes (1 byte), 7 bytes livres, n
+    chaves      n chaves em ordem crescente
+    posições    n + 1 deslocamentos dos registros dentro da área de dados
+    dados       registros de tamanho variável
+
+O leitor mapeia o arquivo em memória (mmap) e faz busca binária direto sobre
+as chaves: uma consulta custa O(log n) leituras na própria página do arquivo,
+sem carregar nada no heap do processo. Como o mapeamento é do arquivo, todos
+os workers do gunicorn compartilham as mesmas páginas do cache do sistema
+operacional. O arquivo é substituído de forma atômica e os workers reabrem a
+versão nova na verificação seguinte (a cada SIMULADOR_SNAPSHOT_INTERVALO segundos).
+
+A ordenação na importação é externa: blocos ordenados em memória, gravados em
+arquivos temporários e intercalados (heapq.merge), então o volume da base
+completa (dezenas de milhões de estabelecimentos) não precisa caber na memória.
+"""
+import csv
+import heapq
+import io
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGICO = b'LMCNPJ01'
+CABECALHO = struct.Struct('<8sB7xQ')
+ORDEM_BYTES = 1 if sys.byteorder == 'little' else 0
+# Registro dos arquivos temporários da ordenação externa: chave, tamanho do conteúdo
+REGISTRO_TEMPORARIO = struct.Struct('<QI')
+# Registro de estabelecimento: situação cadastral, quantidade de CNAEs; seguem os CNAEs e o nome fantasia
+ESTABELECIMENTO = struct.Struct('<BB')
+
+ARQUIVO_ESTABELECIMENTOS = 'estabelecimentos.bin'
+ARQUIVO_EMPRESAS = 'empresas.bin'
+
+# Códigos de situação cadastral do leiaute da Receita Federal
+SITUACOES = {1: 'NULA', 2: 'ATIVA', 3: 'SUSPENSA', 4: 'INAPTA', 8: 'BAIXADA'}
+
+# Colunas usadas dos leiautes de Estabelecimentos (30 colunas) e de Empresas
+COL_CNPJ_BASICO, COL_CNPJ_ORDEM, COL_CNPJ_DV = 0, 1, 2
+COL_NOME_FANTASIA, COL_SITUACAO = 4, 5
+COL_CNAE_PRINCIPAL, COL_CNAES_SECUNDARIOS = 11, 12
+COL_RAZAO_SOCIAL = 1
+COLUNAS_ESTABELECIMENTO = 30
+
+
+def diretorio_espelho():
+    return getattr(settings, 'SIMULADOR_ESPELHO_CNPJ_DIR', '')
+
+
+def _intervalo_verificacao():
+    return getattr(settings, 'SIMULADOR_SNAPSHOT_INTERVALO', 30)
+
+
+# --- Gravação ---
+
+def _gravar_bloco(registros):
+    """Ordena o bloco e grava num arquivo temporário; devolve o arquivo posicionado no início."""
+    registros.sort(key=lambda registro: registro[0])
+    temporario = tempfile.TemporaryFile()
+    for chave, conteudo in registros:
+        temporario.write(REGISTRO_TEMPORARIO.pack(chave, len(conteudo)))
+        temporario.write(conteudo)
+    temporario.seek(0)
+    return temporario
+
+
+def _ler_bloco(arquivo):
+    while True:
+        cabecalho = arquivo.read(REGISTRO_TEMPORARIO.size)
+        if not cabecalho:
+            return
+        chave, tamanho = REGISTRO_TEMPORARIO.unpack(cabecalho)
+        yield chave, arquivo.read(tamanho)
+
+
+def _intercalar_unicos(blocos):
+    """Intercala os blocos ordenados; para chaves repetidas fica o último registro lido."""
+    anterior = None
+    for registro in heapq.merge(*(_ler_bloco(b) for b in blocos), key=lambda r: r[0]):
+        if anterior is not None and registro[0] != anterior[0]:
+            yield anterior
+        anterior = registro
+    if anterior is not None:
+        yield anterior
+
+
+def gravar_arquivo_ordenado(registros, caminho, tamanho_bloco=1_000_000):
+    """
+    Grava os pares (chave inteira, bytes) no formato do espelho, substituindo
+    `caminho` de forma atômica. Devolve a quantidade de chaves gravadas.
+    """
+    blocos = []
+    bloco = []
+    try:
+        for registro in registros:
+            bloco.append(registro)
+            if len(bloco) >= tamanho_bloco:
+                blocos.append(_gravar_bloco(bloco))
+                bloco = []
+        if bloco or not blocos:
+            blocos.append(_gravar_bloco(bloco))
+
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        with tempfile.TemporaryFile() as chaves, tempfile.TemporaryFile() as posicoes, \
+                tempfile.TemporaryFile() as dados:
+            quantidade = posicao = 0
+            buffer_chaves, buffer_posicoes = array('Q'), array('Q')
+            for chave, conteudo in _intercalar_unicos(blocos):
+                buffer_chaves.append(chave)
+                buffer_posicoes.append(posicao)
+                dados.write(conteudo)
+                posicao += len(conteudo)
+                quantidade += 1
+                if len(buffer_chaves) >= 65536:
+                    buffer_chaves.tofile(chaves)
+                    buffer_posicoes.tofile(posicoes)
+                    buffer_chaves, buffer_posicoes = array('Q'), array('Q')
+            buffer_posicoes.append(posicao)  # fim do último registro
+            buffer_chaves.tofile(chaves)
+            buffer_posicoes.tofile(posicoes)
+
+            descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+            try:
+                with os.fdopen(descritor, 'wb') as saida:
+                    saida.write(CABECALHO.pack(MAGICO, ORDEM_BYTES, quantidade))
+                    for parte in (chaves, posicoes, dados):
+                        parte.seek(0)
+                        while True:
+                            pedaco = parte.read(8 * 1024 * 1024)
+                            if not pedaco:
+                                break
+                            saida.write(pedaco)
+                os.chmod(temporario, 0o644)  # mkstemp cria com 0600
+                os.replace(temporario, caminho)
+            except BaseException:
+                os.unlink(temporario)
+                raise
+        return quantidade
+    finally:
+        for arquivo in blocos:
+            arquivo.close()
+
+
+def codificar_estabelecimento(situacao, cnaes, nome_fantasia):
+    cnaes = cnaes[:255]
+    return (ESTABELECIMENTO.pack(situacao, len(cnaes)) + struct.pack(f'<{len(cnaes)}I', *cnaes)
+            + nome_fantasia.encode('utf-8'))
+
+
+def decodificar_estabelecimento(conteudo):
+    situacao, quantidade = ESTABELECIMENTO.unpack_from(conteudo)
+    fim_cnaes = ESTABELECIMENTO.size + 4 * quantidade
+    cnaes = struct.unpack_from(f'<{quantidade}I', conteudo, ESTABELECIMENTO.size)
+    return situacao, cnaes, bytes(conteudo[fim_cnaes:]).decode('utf-8')
+
+
+# --- Leitura dos arquivos da Receita Federal ---
+
+def _abrir_linhas(caminhos):
+    """Linhas CSV (';', latin-1, sem cabeçalho) dos arquivos informados, aceitando os .zip da Receita."""
+    for caminho in caminhos:
+        if caminho.lower().endswith('.zip'):
+            with zipfile.ZipFile(caminho) as pacote:
+                for nome in pacote.namelist():
+                    with pacote.open(nome) as bruto:
+                        yield from csv.reader(io.TextIOWrapper(bruto, encoding='latin-1', newline=''), delimiter=';')
+        else:
+            with open(caminho, encoding='latin-1', newline='') as f:
+                yield from csv.reader(f, delimiter=';')
+
+
+def _inteiro(texto):
+    texto = (texto or '').strip()
+    return int(texto) if texto.isdigit() else 0
+
+
+def ler_estabelecimentos(caminhos):
+    """Pares (CNPJ, registro codificado) dos arquivos de Estabelecimentos; linhas malformadas são ignoradas."""
+    for linha in _abrir_linhas(caminhos):
+        if len(linha) <= COL_CNAES_SECUNDARIOS:
+            continue
+        cnpj = f'{linha[COL_CNPJ_BASICO]}{linha[COL_CNPJ_ORDEM]}{linha[COL_CNPJ_DV]}'
+        if len(cnpj) != 14 or not cnpj.isdigit():
+            continue
+        cnaes = [_inteiro(linha[COL_CNAE_PRINCIPAL])]
+        cnaes += [_inteiro(c) for c in linha[COL_CNAES_SECUNDARIOS].split(',') if c.strip()]
+        yield int(cnpj), codificar_estabelecimento(
+            _inteiro(linha[COL_SITUACAO]), [c for c in cnaes if c], linha[COL_NOME_FANTASIA].strip())
+
+
+def ler_empresas(caminhos):
+    """Pares (CNPJ básico, razão social) dos arquivos de Empresas."""
+    for linha in _abrir_linhas(caminhos):
+        if len(linha) <= COL_RAZAO_SOCIAL or not linha[0].isdigit():
+            continue
+        yield int(linha[0]), linha[COL_RAZAO_SOCIAL].strip().encode('utf-8')
+
+
+# --- Base sintética (testes e benchmark) ---
+
+def digitos_verificadores(base12):
+    """Os dois dígitos verificadores do CNPJ para os 12 primeiros dígitos."""
+    digitos = base12
+    for pesos in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        resto = sum(int(d) * p for d, p in zip(digitos, pesos)) % 11
+        digitos += str(0 if resto < 2 else 11 - resto)
+    return digitos[12:]
+
+
+def gerar_sintetico(diretorio, quantidade, cnaes, semente=42):
+    """
+    Grava arquivos no leiaute da Receita (SINTETICO.ESTABELE.csv e
+    SINTETICO.EMPRECSV.csv) com `quantidade` estabelecimentos de CNPJs válidos e
+    CNAEs sorteados entre `cnaes`. Devolve (estabelecimentos, empresas).
+    """
+    sorteio = random.Random(semente)
+    cnaes = [c for c in cnaes if len(c) == 7] or ['4711302']
+    caminho_estab = os.path.join(diretorio, 'SINTETICO.ESTABELE.csv')
+    caminho_empresas = os.path.join(diretorio, 'SINTETICO.EMPRECSV.csv')
+    with open(caminho_estab, 'w', encoding='latin-1', newline='') as estab, \
+            open(caminho_empresas, 'w', encoding='latin-1', newline='') as empresas:
+        escritor_estab = csv.writer(estab, delimiter=';', quoting=csv.QUOTE_ALL)
+        escritor_empresas = csv.writer(empresas, delimiter=';', quoting=csv.QUOTE_ALL)
+        basicos = sorteio.sample(range(10 ** 7, 10 ** 8), max(1, quantidade // 2))
+        for i in range(quantidade):
+            basico = str(basicos[i % len(basicos)])
+            ordem = f'{i // len(basicos) + 1:04d}'
+            atividades = sorteio.sample(cnaes, min(len(cnaes), sorteio.randint(1, 6)))
+            linha = [''] * COLUNAS_ESTABELECIMENTO
+            linha[COL_CNPJ_BASICO], linha[COL_CNPJ_ORDEM] = basico, ordem
+            linha[COL_CNPJ_DV] = digitos_verificadores(basico + ordem)
+            linha[3] = '1' if ordem == '0001' else '2'
+            linha[COL_NOME_FANTASIA] = f'FANTASIA {i}'
+            linha[COL_SITUACAO] = sorteio.choice(['02', '02', '02', '02', '08', '04'])
+            linha[COL_CNAE_PRINCIPAL] = atividades[0]
+            linha[COL_CNAES_SECUNDARIOS] = ','.join(atividades[1:])
+            escritor_estab.writerow(linha)
+            if ordem == '0001':
+                escritor_empresas.writerow([basico, f'EMPRESA SINTETICA {basico} LTDA', '2062', '49', '1000,00', '01', ''])
+    return caminho_estab, caminho_empresas
+
+
+# --- Leitura ---
+
+class ArquivoOrdenado:
+    """Arquivo do espelho mapeado em memória; `buscar` faz busca binária nas chaves."""
+
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, ordem_bytes, self.quantidade = CABECALHO.unpack_from(self._mapa)
+        if magico != MAGICO or ordem_bytes != ORDEM_BYTES:
+            raise ValueError(f'{caminho} não é um arquivo do espelho de CNPJ compatível.')
+        visao = memoryview(self._mapa)
+        inicio_posicoes = CABECALHO.size + 8 * self.quantidade
+        self._inicio_dados = inicio_posicoes + 8 * (self.quantidade + 1)
+        self._chaves = visao[CABECALHO.size:inicio_posicoes].cast('Q')
+        self._posicoes = visao[inicio_posicoes:self._inicio_dados].cast('Q')
+        self._dados = visao[self._inicio_dados:]
+
+    def buscar(self, chave):
+        """Conteúdo (memoryview) do registro da chave, ou None."""
+        i = bisect_left(self._chaves, chave)
+        if i == self.quantidade or self._chaves[i] != chave:
+            return None
+        return self._dados[self._posicoes[i]:self._posicoes[i + 1]]
+
+
+def _identidade(caminho):
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        return None
+    return estado.st_ino, estado.st_mtime_ns, estado.st_size
+
+
+class EspelhoCNPJ:
+    """Os dois arquivos do espelho deste worker, reabertos quando a importação os substitui."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._verificado_em = None
+        self._identidades = None
+        self._estabelecimentos = None
+        self._empresas = None
+        self.acertos = 0
+        self.falhas = 0
+
+    def _atualizar(self):
+        agora = time.monotonic()
+        if self._verificado_em is not None and agora - self._verificado_em < _intervalo_verificacao():
+            return
+        with self._lock:
+            if self._verificado_em is not None and agora - self._verificado_em < _intervalo_verificacao():
+                return
+            diretorio = diretorio_espelho()
+            caminhos = (os.path.join(diretorio, ARQUIVO_ESTABELECIMENTOS), os.path.join(diretorio, ARQUIVO_EMPRESAS))
+            identidades = tuple(_identidade(c) for c in caminhos) if diretorio else (None, None)
+            if identidades != self._identidades:
+                try:
+                    self._estabelecimentos = ArquivoOrdenado(caminhos[0]) if identidades[0] else None
+                    self._empresas = ArquivoOrdenado(caminhos[1]) if identidades[1] else None
+                except (OSError, ValueError) as e:
+                    logger.warning("Espelho de CNPJ indisponível: %s", e)
+                    self._estabelecimentos = self._empresas = None
+                self._identidades = identidades
+            self._verificado_em = agora
+
+    def consultar(self, cnpj_limpo):
+        """Dados no formato de `cnpj.normalizar_resposta`, ou None se o CNPJ não estiver no espelho."""
+        self._atualizar()
+        estabelecimentos, empresas = self._estabelecimentos, self._empresas
+        if estabelecimentos is None or len(cnpj_limpo) != 14 or not cnpj_limpo.isdigit():
+            return None
+        conteudo = estabelecimentos.buscar(int(cnpj_limpo))
+        if conteudo is None:
+            with self._lock:
+                self.falhas += 1
+            return None
+        with self._lock:
+            self.acertos += 1
+        situacao, cnaes, nome_fantasia = decodificar_estabelecimento(conteudo)
+        razao_social = empresas.buscar(int(cnpj_limpo[:8])) if empresas is not None else None
+        return {
+            'empresa_data': {
+                'razao_social': bytes(razao_social).decode('utf-8') if razao_social is not None else None,
+                'nome_fantasia': nome_fantasia or None,
+                'situacao_cadastral': SITUACOES.get(situacao),
+            },
+            'cnaes': [f'{c:07d}' for c in cnaes],
+        }
+
+    def metricas(self):
+        self._atualizar()
+        with self._lock:
+            acertos, falhas = self.acertos, self.falhas
+        return {
+            'estabelecimentos': self._estabelecimentos.quantidade if self._estabelecimentos else 0,
+            'empresas': self._empresas.quantidade if self._empresas else 0,
+            'acertos': acertos,
+            'falhas': falhas,
+        }
+
+
+espelho_cnpj = EspelhoCNPJ()
+
+
+def consultar_espelho(cnpj_limpo):
+    """Atalho para o espelho deste worker."""
+    return espelho_cnpj.consultar(cnpj_limpo)
@@ -0,0 +1,260 @@
+# simulador_risco/hierarquia.py
+"""
+Índice hierárquico da CNAE 2.x (IBGE): seção -> divisão -> grupo -> classe -> subclasse.
+
+O código de 7 dígitos já carrega a hierarquia: '4711-3/02' é a subclasse 02
+da classe 47.11-3, do grupo 47.1, da divisão 47, que pertence à seção G. O
+índice é uma árvore de prefixos sobre esses segmentos, com os agregados de
+cada nó (quantidade de subclasses, contagem e maior risco sanitário e
+ambiental) calculados uma vez na montagem. Assim, "maior risco abaixo da
+classe 4711-3" custa a descida da árvore (no máximo cinco níveis), sem varrer
+a tabela de CNAEs.
+
+Códigos parciais são aceitos com ou sem pontuação ('47', '47.1', '4711',
+'4711-3', '47113', '4711-3/0'). Quando o último segmento está incompleto, o
+índice desce se ele identificar um único filho ('4711' -> classe 47.11-3) e
+para no último nível identificado caso contrário.
+
+O risco sanitário agregado é o pior caso: CNAEs de risco 'P' entram com o
+maior risco possível entre as respostas das suas perguntas. O ambiental segue
+o simulador: CNAEs sem item no decreto valem a regra geral (risco I), e a
+base usada é a do município padrão (SIMULADOR_MUNICIPIO_PADRAO).
+"""
+from .ambiental import RISCO_MAP as RISCO_MAP_AMBIENTAL, base_ambiental, municipio_padrao
+from .snapshot import BASE_SES, SnapshotVersionado
+from .utils import formatar_cnae, limpar_cnae
+from .versoes import dados_base
+
+# Ordem de gravidade sanitária, sem o 'P' (que é resolvido pelo pior caso das respostas)
+GRAVIDADE_SES = {'NA': 0, 'I': 1, 'II': 2, 'III': 3}
+
+# Seções da CNAE 2.x: letra -> (primeira divisão, última divisão, denominação)
+SECOES = {
+    'A': (1, 3, 'Agricultura, pecuária, produção florestal, pesca e aqüicultura'),
+    'B': (5, 9, 'Indústrias extrativas'),
+    'C': (10, 33, 'Indústrias de transformação'),
+    'D': (35, 35, 'Eletricidade e gás'),
+    'E': (36, 39, 'Água, esgoto, atividades de gestão de resíduos e descontaminação'),
+    'F': (41, 43, 'Construção'),
+    'G': (45, 47, 'Comércio; reparação de veículos automotores e motocicletas'),
+    'H': (49, 53, 'Transporte, armazenagem e correio'),
+    'I': (55, 56, 'Alojamento e alimentação'),
+    'J': (58, 63, 'Informação e comunicação'),
+    'K': (64, 66, 'Atividades financeiras, de seguros e serviços relacionados'),
+    'L': (68, 68, 'Atividades imobiliárias'),
+    'M': (69, 75, 'Atividades profissionais, científicas e técnicas'),
+    'N': (77, 82, 'Atividades administrativas e serviços complementares'),
+    'O': (84, 84, 'Administração pública, defesa e seguridade social'),
+    'P': (85, 85, 'Educação'),
+    'Q': (86, 88, 'Saúde humana e serviços sociais'),
+    'R': (90, 93, 'Artes, cultura, esporte e recreação'),
+    'S': (94, 96, 'Outras atividades de serviços'),
+    'T': (97, 97, 'Serviços domésticos'),
+    'U': (99, 99, 'Organismos internacionais e outras instituições extraterritoriais'),
+}
+
+# Nível -> tamanho do código limpo ao final do nível
+NIVEIS = (('divisao', 2), ('grupo', 3), ('classe', 5), ('subclasse', 7))
+
+
+def secao_da_divisao(divisao):
+    """Letra da seção da divisão ('47' -> 'G'), ou None se a divisão não existir na CNAE."""
+    numero = int(divisao)
+    for letra, (inicio, fim, _) in SECOES.items():
+        if inicio <= numero <= fim:
+            return letra
+    return None
+
+
+def formatar_nivel(codigo):
+    """Formata o código limpo conforme o nível: '47', '47.1', '47.11-3', '4711-3/02'."""
+    if len(codigo) == 3:
+        return f'{codigo[:2]}.{codigo[2]}'
+    if len(codigo) == 5:
+        return f'{codigo[:2]}.{codigo[2:4]}-{codigo[4]}'
+    return formatar_cnae(codigo)
+
+
+def _pior(atual, risco, gravidade):
+    return risco if gravidade.get(risco, -1) > gravidade.get(atual, -1) else atual
+
+
+class NoCNAE:
+    """Nó da árvore: um código de seção, divisão, grupo, classe ou subclasse com os agregados da subárvore."""
+
+    __slots__ = ('codigo', 'nivel', 'descricao', 'filhos', 'quantidade',
+                 'risco_ses', 'risco_ambiental', 'contagem_ses', 'contagem_ambiental')
+
+    def __init__(self, codigo, nivel, descricao=''):
+        self.codigo = codigo
+        self.nivel = nivel
+        self.descricao = descricao
+        self.filhos = {}
+        self.quantidade = 0
+        self.risco_ses = None
+        self.risco_ambiental = None
+        self.contagem_ses = {}
+        self.contagem_ambiental = {}
+
+    def somar(self, risco_base, risco_ses, risco_ambiental):
+        self.quantidade += 1
+        self.contagem_ses[risco_base] = self.contagem_ses.get(risco_base, 0) + 1
+        self.contagem_ambiental[risco_ambiental] = self.contagem_ambiental.get(risco_ambiental, 0) + 1
+        self.risco_ses = _pior(self.risco_ses, risco_ses, GRAVIDADE_SES)
+        self.risco_ambiental = _pior(self.risco_ambiental, risco_ambiental, RISCO_MAP_AMBIENTAL)
+
+    def subclasses(self):
+        """Códigos das subclasses da subárvore, em ordem."""
+        if self.nivel == 'subclasse':
+            yield self.codigo
+            return
+        for chave in sorted(self.filhos):
+            yield from self.filhos[chave].subclasses()
+
+    def resumo(self):
+        return {
+            'codigo': self.codigo,
+            'codigo_formatado': self.codigo if self.nivel == 'secao' else formatar_nivel(self.codigo),
+            'nivel': self.nivel,
+            'descricao': self.descricao,
+            'quantidade_subclasses': self.quantidade,
+            'risco_sanitario_maximo': self.risco_ses,
+            'risco_ambiental_maximo': self.risco_ambiental,
+            'contagem_sanitaria': dict(self.contagem_ses),
+            'contagem_ambiental': dict(self.contagem_ambiental),
+        }
+
+
+class HierarquiaCNAE:
+    """Árvore de prefixos somente-leitura sobre os CNAEs carregados."""
+
+    __slots__ = ('versao', 'secoes', 'divisoes')
+
+    def __init__(self, versao, cnaes):
+        """`cnaes`: iterável de (codigo, descricao, risco_base, pior risco sanitário, risco ambiental)."""
+        self.versao = versao
+        self.secoes = {letra: NoCNAE(letra, 'secao', nome) for letra, (_, _, nome) in SECOES.items()}
+        self.divisoes = {}
+
+        for codigo, descricao, risco_base, risco_ses, risco_ambiental in cnaes:
+            if len(codigo) != 7:
+                continue
+            letra = secao_da_divisao(codigo[:2])
+            if letra is None:
+                continue
+            caminho = [self.secoes[letra]]
+            no = self.divisoes.setdefault(codigo[:2], NoCNAE(codigo[:2], 'divisao'))
+            caminho.append(no)
+            inicio = 2
+            for nivel, fim in NIVEIS[1:]:
+                no = no.filhos.setdefault(codigo[inicio:fim], NoCNAE(codigo[:fim], nivel))
+                caminho.append(no)
+                inicio = fim
+            no.descricao = descricao
+            for ancestral in caminho:
+                ancestral.somar(risco_base, risco_ses, risco_ambiental)
+
+        for no in self.divisoes.values():
+            self.secoes[secao_da_divisao(no.codigo)].filhos[no.codigo] = no
+
+    def resolver(self, codigo):
+        """
+        Nó do código (parcial ou completo) ou da letra da seção; None se não existir.
+        Custa um passo por nível, independente do tamanho da base.
+        """
+        codigo = (codigo or '').strip()
+        if len(codigo) == 1 and codigo.upper() in self.secoes:
+            return self.secoes[codigo.upper()]
+        codigo = limpar_cnae(codigo)
+        if len(codigo) < 2 or len(codigo) > 7:
+            return None
+
+        no = self.divisoes.get(codigo[:2])
+        inicio = 2
+        for _, fim in NIVEIS[1:]:
+            if no is None or len(codigo) <= inicio:
+                return no
+            segmento = codigo[inicio:fim]
+            if len(segmento) == fim - inicio:
+                no = no.filhos.get(segmento)
+            else:
+                # Segmento incompleto: desce apenas se identificar um único filho
+                candidatos = [filho for chave, filho in no.filhos.items() if chave.startswith(segmento)]
+                if not candidatos:
+                    return None
+                return candidatos[0] if len(candidatos) == 1 else no
+            inicio = fim
+        return no
+
+    def caminho(self, codigo):
+        """Resumos do nó e dos seus ancestrais, da seção até ele."""
+        no = self.resolver(codigo)
+        if no is None:
+            return []
+        if no.nivel == 'secao':
+            return [no.resumo()]
+        nos = [self.secoes[secao_da_divisao(no.codigo[:2])], self.divisoes[no.codigo[:2]]]
+        atual = nos[-1]
+        inicio = 2
+        for _, fim in NIVEIS[1:]:
+            if len(no.codigo) < fim:
+                break
+            atual = atual.filhos[no.codigo[inicio:fim]]
+            nos.append(atual)
+            inicio = fim
+        return [item.resumo() for item in nos]
+
+    def consultar(self, codigo):
+        """
+        Resumo do nível indicado pelo código, com o caminho até a seção e os
+        filhos imediatos (sem descer às subclasses quando o nó é uma seção ou divisão).
+        """
+        no = self.resolver(codigo)
+        if no is None:
+            return None
+        resumo = no.resumo()
+        resumo['caminho'] = self.caminho(no.codigo)[:-1]
+        resumo['filhos'] = [no.filhos[chave].resumo() for chave in sorted(no.filhos)]
+        return resumo
+
+    def risco_maximo(self, codigo):
+        """(maior risco sanitário, maior risco ambiental) abaixo do código, ou None se não existir."""
+        no = self.resolver(codigo)
+        if no is None:
+            return None
+        return no.risco_ses, no.risco_ambiental
+
+
+def carregar_hierarquia(versao):
+    """Monta a árvore a partir das versões ativas das bases SES e ambiental."""
+    ses = dados_base(BASE_SES)
+    pior_resposta = {}
+    for numero, _, opcoes in ses['perguntas']:
+        for _, risco in opcoes:
+            pior_resposta[numero] = _pior(pior_resposta.get(numero), risco, GRAVIDADE_SES)
+
+    ambiental = {}
+    for item in dados_base(base_ambiental(municipio_padrao()))['itens']:
+        cnae, risco = item[0], item[-1]
+        ambiental[cnae] = _pior(ambiental.get(cnae), risco, RISCO_MAP_AMBIENTAL)
+
+    cnaes = []
+    for codigo, descricao, risco_base, _, numeros in ses['cnaes']:
+        risco_ses = None
+        if risco_base == 'P':
+            for numero in numeros:
+                risco_ses = _pior(risco_ses, pior_resposta.get(numero), GRAVIDADE_SES)
+        else:
+            risco_ses = risco_base
+        # Sem item no decreto, vale a regra geral do simulador ambiental (risco I)
+        risco_ambiental = ambiental.get(codigo) or 'I'
+        cnaes.append((codigo, descricao, risco_base, risco_ses, risco_ambiental))
+    return HierarquiaCNAE(versao, cnaes)
+
+
+hierarquia_cnae = SnapshotVersionado((BASE_SES, base_ambiental(municipio_padrao())), carregar_hierarquia)
+
+
+def obter_hierarquia():
+    """Atalho para a árvore corrente deste worker."""
+    return hierarquia_cnae.obter()
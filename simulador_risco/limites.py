@@ -0,0 +1,237 @@
+# simulador_risco/limites.py
+"""
+Controle de admissão das APIs públicas do simulador.
+
+1. Limite de taxa por IP (balde de fichas): cada cliente tem
+   SIMULADOR_LIMITE_RAJADA fichas, repostas à taxa de SIMULADOR_LIMITE_TAXA por
+   segundo. Sem fichas, a resposta é um 429 imediato com Retry-After.
+   Vem desligado (SIMULADOR_LIMITE_TAXA=0): atrás de um proxy reverso, todos
+   os clientes chegam com o IP do proxy e dividiriam um único balde. Ligue-o
+   depois de definir SIMULADOR_PROXIES_CONFIAVEIS (ver `ip_cliente`).
+   Por padrão os baldes ficam na memória do processo; com
+   SIMULADOR_LIMITE_CACHE apontando para um cache compartilhado (Redis,
+   Memcached) o limite vale para todos os workers, contado em janelas fixas.
+2. Portão de concorrência: no máximo SIMULADOR_CONCORRENCIA_MAX requisições do
+   simulador em andamento por processo. Acima disso a requisição recebe um 503
+   na hora, em vez de ocupar mais um slot do processo, e os slots restantes
+   continuam livres para o resto do sistema (ex: /hospital/).
+   Só atua em processos que atendem várias requisições ao mesmo tempo: ASGI
+   (SIMULADOR_ASGI) ou gunicorn com `--worker-class gthread --threads N`, com
+   N maior que o limite. Um worker síncrono de uma thread nunca tem mais de uma
+   requisição em andamento e o portão não chega a recusar nada; nesse modo, o
+   tráfego do simulador precisa ser limitado no proxy reverso.
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+# Acima deste número de IPs em memória, os baldes já cheios são descartados
+MAX_BALDES = 10000
+
+
+def ip_cliente(request):
+    """
+    IP do cliente. Com SIMULADOR_PROXIES_CONFIAVEIS = n proxies reversos na
+    frente da aplicação, cada um acrescentando o IP de quem o chamou ao final do
+    X-Forwarded-For, o cliente é a n-ésima entrada a partir da direita; as
+    entradas mais à esquerda vêm do próprio cliente e podem ser forjadas.
+    """
+    proxies = getattr(settings, 'SIMULADOR_PROXIES_CONFIAVEIS', 0)
+    if proxies:
+        entradas = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(entradas) >= proxies:
+            return entradas[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LimitadorMemoria:
+    """Baldes de fichas por chave, na memória do processo."""
+
+    compartilhado = False
+
+    def __init__(self, taxa, rajada):
+        self.taxa = taxa
+        self.rajada = rajada
+        self._baldes = {}
+        self._lock = threading.Lock()
+
+    def permitir(self, chave, custo=1):
+        """Retorna 0 se a requisição pode seguir, senão os segundos até haver fichas suficientes."""
+        agora = time.monotonic()
+        with self._lock:
+            fichas, ultimo = self._baldes.get(chave, (self.rajada, agora))
+            fichas = min(self.rajada, fichas + (agora - ultimo) * self.taxa)
+            if fichas >= custo:
+                self._baldes[chave] = (fichas - custo, agora)
+                espera = 0
+            else:
+                self._baldes[chave] = (fichas, agora)
+                espera = (custo - fichas) / self.taxa
+            if len(self._baldes) > MAX_BALDES:
+                self._descartar_cheios(agora)
+        return espera
+
+    def _descartar_cheios(self, agora):
+        cheio_apos = self.rajada / self.taxa
+        for chave, (_, ultimo) in list(self._baldes.items()):
+            if agora - ultimo >= cheio_apos:
+                del self._baldes[chave]
+
+
+class LimitadorDesligado:
+    """Sem limite de taxa (SIMULADOR_LIMITE_TAXA=0)."""
+
+    compartilhado = False
+
+    def permitir(self, chave, custo=1):
+        return 0
+
+
+class LimitadorCache:
+    """
+    Limite compartilhado entre workers via cache do Django. Usa janelas fixas de
+    rajada/taxa segundos com até `rajada` fichas cada: mesma taxa média do balde,
+    com operações atômicas (add/incr) disponíveis em qualquer backend de cache.
+    """
+
+    compartilhado = True
+
+    def __init__(self, taxa, rajada, alias):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.janela = max(1, math.ceil(rajada / taxa))
+        self.alias = alias
+
+    def permitir(self, chave, custo=1):
+        cache = caches[self.alias]
+        agora = time.time()
+        indice = int(agora // self.janela)
+        chave_cache = f'simulador:limite:{chave}:{indice}'
+        cache.add(chave_cache, 0, timeout=self.janela + 1)
+        try:
+            usado = cache.incr(chave_cache, custo)
+        except ValueError:  # expirou entre o add e o incr
+            cache.add(chave_cache, custo, timeout=self.janela + 1)
+            usado = custo
+        if usado <= self.rajada:
+            return 0
+        return (indice + 1) * self.janela - agora
+
+
+class PortaoConcorrencia:
+    """Contador de requisições em andamento; recusa (sem esperar) quando o limite é atingido."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._em_andamento = 0
+        self._lock = threading.Lock()
+
+    def entrar(self):
+        with self._lock:
+            if self._em_andamento >= self.maximo:
+                return False
+            self._em_andamento += 1
+            return True
+
+    def sair(self):
+        with self._lock:
+            self._em_andamento -= 1
+
+    @property
+    def em_andamento(self):
+        return self._em_andamento
+
+
+class _Contadores:
+    def __init__(self):
+        self.limitadas = 0
+        self.recusadas_concorrencia = 0
+        self._lock = threading.Lock()
+
+    def somar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+
+def _criar_limitador():
+    taxa = getattr(settings, 'SIMULADOR_LIMITE_TAXA', 0)
+    rajada = getattr(settings, 'SIMULADOR_LIMITE_RAJADA', 20)
+    alias = getattr(settings, 'SIMULADOR_LIMITE_CACHE', '')
+    if taxa <= 0:
+        return LimitadorDesligado()
+    return LimitadorCache(taxa, rajada, alias) if alias else LimitadorMemoria(taxa, rajada)
+
+
+limitador = _criar_limitador()
+portao = PortaoConcorrencia(getattr(settings, 'SIMULADOR_CONCORRENCIA_MAX', 4))
+contadores = _Contadores()
+
+
+def _resposta_limitada(espera):
+    contadores.somar('limitadas')
+    response = JsonResponse({'erro': 'Muitas requisições. Aguarde alguns segundos e tente novamente.'}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(espera)))
+    return response
+
+
+def _resposta_sobrecarga():
+    contadores.somar('recusadas_concorrencia')
+    response = JsonResponse({'erro': 'Simulador temporariamente sobrecarregado. Tente novamente.'}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
+def controlar_admissao(custo=1):
+    """
+    Decorator das APIs públicas do simulador: limite de taxa por IP (429) e
+    portão de concorrência do processo (503). Funciona em views síncronas e assíncronas.
+    `custo` é o número de fichas consumidas (consultas externas custam mais).
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrap(request, *args, **kwargs):
+                if limitador.compartilhado:
+                    espera = await sync_to_async(limitador.permitir)(ip_cliente(request), custo)
+                else:
+                    espera = limitador.permitir(ip_cliente(request), custo)
+                if espera:
+                    return _resposta_limitada(espera)
+                if not portao.entrar():
+                    return _resposta_sobrecarga()
+                try:
+                    return await view(request, *args, **kwargs)
+                finally:
+                    portao.sair()
+        else:
+            @wraps(view)
+            def wrap(request, *args, **kwargs):
+                espera = limitador.permitir(ip_cliente(request), custo)
+                if espera:
+                    return _resposta_limitada(espera)
+                if not portao.entrar():
+                    return _resposta_sobrecarga()
+                try:
+                    return view(request, *args, **kwargs)
+                finally:
+                    portao.sair()
+        return wrap
+    return decorator
+
+
+def metricas():
+    """Contadores de admissão deste worker."""
+    return {
+        'limitadas': contadores.limitadas,
+        'recusadas_concorrencia': contadores.recusadas_concorrencia,
+        'em_andamento': portao.em_andamento,
+        'concorrencia_max': portao.maximo,
+        'limite_ativo': not isinstance(limitador, LimitadorDesligado),
+        'limite_compartilhado': limitador.compartilhado,
+    }
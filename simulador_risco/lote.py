@@ -0,0 +1,130 @@
+# simulador_risco/lote.py
+"""
+Triagem em lote de CNPJs: consulta os dados cadastrais de vários CNPJs em
+paralelo (pool limitado de threads) e classifica cada CNAE nas bases
+sanitária (Resolução SES) e ambiental (município padrão).
+
+Os resultados são entregues à medida que ficam prontos, um por linha (NDJSON),
+tanto pelo endpoint `api_consultar_lote` quanto pelo comando `consultar_cnpjs_lote`.
+
+Para auditorias grandes (dezenas de milhares de linhas) o comando
+`classificar_lote` divide o arquivo em blocos entre processos, cada um com as
+bases já carregadas em memória (`inicializar_processo` + `classificar_bloco`).
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+from django.db import connections
+
+from .ambiental import obter_indice_ambiental
+from .cnpj import consultar_cnpj
+from .snapshot import obter_snapshot_ses, resumo_sanitario
+from .utils import limpar_cnae
+
+
+def _max_workers():
+    return getattr(settings, 'SIMULADOR_LOTE_WORKERS', 8)
+
+
+def classificar_cnaes(codigos, respostas=None, municipio=None):
+    """
+    Classifica a lista de CNAEs nas duas bases, devolvendo o detalhamento e o resumo de cada uma.
+    `respostas` ({codigo: {numero: resposta}}) resolve os CNAEs de risco 'P'; `municipio`
+    escolhe a base ambiental (padrão: SIMULADOR_MUNICIPIO_PADRAO).
+    """
+    codigos_limpos = [limpar_cnae(c) for c in codigos]
+    snapshot = obter_snapshot_ses()
+    sanitario = snapshot.classificar(codigos_limpos)
+    riscos_resolvidos, respostas_invalidas = snapshot.resolver_respostas(codigos_limpos, respostas)
+    sanitario.update(riscos_resolvidos=riscos_resolvidos, respostas_invalidas=respostas_invalidas)
+    ambiental = obter_indice_ambiental(municipio).classificar(codigos_limpos)
+    return {
+        'sanitario': {**resumo_sanitario(sanitario, riscos_resolvidos), **sanitario},
+        'ambiental': {
+            'risco': ambiental['risco_geral'],
+            'cnaes_processados': ambiental['cnaes_processados'],
+            'nao_encontrados': ambiental['nao_encontrados'],
+        },
+    }
+
+
+def classificar_cnpj(cnpj):
+    """Consulta um CNPJ (via cache) e classifica seus CNAEs. Erros viram um campo 'erro'."""
+    cnpj_limpo = ''.join(filter(str.isdigit, str(cnpj)))
+    if len(cnpj_limpo) != 14:
+        return {'cnpj': cnpj_limpo, 'erro': 'CNPJ inválido.'}
+    try:
+        dados = consultar_cnpj(cnpj_limpo)
+        return {'cnpj': cnpj_limpo, 'empresa_data': dados['empresa_data'], 'cnaes': dados['cnaes'],
+                **classificar_cnaes(dados['cnaes'])}
+    except requests.RequestException as e:
+        return {'cnpj': cnpj_limpo, 'erro': f'Falha ao consultar API externa: {str(e)}'}
+    except Exception as e:
+        return {'cnpj': cnpj_limpo, 'erro': str(e)}
+    finally:
+        # Cada thread do pool abre a própria conexão com o banco
+        connections.close_all()
+
+
+def classificar_cnpjs(cnpjs, max_workers=None):
+    """
+    Gera os resultados de `classificar_cnpj` na ordem em que ficam prontos.
+    No máximo `max_workers` consultas externas ficam em andamento ao mesmo tempo.
+    """
+    cnpjs = list(dict.fromkeys(cnpjs))  # remove repetidos mantendo a ordem
+    executor = ThreadPoolExecutor(max_workers=max_workers or _max_workers(), thread_name_prefix='lote-cnpj')
+    try:
+        futuros = [executor.submit(classificar_cnpj, cnpj) for cnpj in cnpjs]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+    finally:
+        # Se o consumidor parar no meio (ex: cliente desconectou), descarta o que não começou
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def gerar_ndjson(resultados):
+    for resultado in resultados:
+        yield json.dumps(resultado, ensure_ascii=False) + '\n'
+
+
+def inicializar_processo():
+    """
+    Inicializador dos processos de `classificar_lote`: configura o Django e carrega
+    as bases uma vez. O processo pai deve fechar as conexões antes de criar o pool.
+    """
+    import django
+    django.setup()  # necessário quando o processo é criado por 'spawn'; inofensivo com 'fork'
+    obter_snapshot_ses()
+    obter_indice_ambiental()
+
+
+def classificar_linha(linha):
+    """
+    Classifica uma linha do lote: {'id', 'cnpj', 'cnaes', 'respostas'}. Se a linha
+    trouxer a lista de CNAEs ela é usada diretamente; senão, os CNAEs vêm da
+    consulta do CNPJ. As respostas opcionais resolvem os CNAEs de risco 'P'.
+    Uma linha que já chega com 'erro' (ex: respostas ilegíveis) não é classificada.
+    """
+    resultado = {'id': linha.get('id', ''), 'cnpj': linha.get('cnpj', '')}
+    if linha.get('erro'):
+        return {**resultado, 'erro': linha['erro']}
+    codigos = linha.get('cnaes') or []
+    try:
+        if not codigos:
+            cnpj_limpo = ''.join(filter(str.isdigit, resultado['cnpj']))
+            if len(cnpj_limpo) != 14:
+                return {**resultado, 'erro': 'Linha sem CNAEs e sem CNPJ válido.'}
+            dados = consultar_cnpj(cnpj_limpo)
+            resultado.update(cnpj=cnpj_limpo, empresa_data=dados['empresa_data'])
+            codigos = dados['cnaes']
+        return {**resultado, 'cnaes': codigos, **classificar_cnaes(codigos, linha.get('respostas'))}
+    except requests.RequestException as e:
+        return {**resultado, 'erro': f'Falha ao consultar API externa: {str(e)}'}
+    except Exception as e:
+        return {**resultado, 'erro': str(e)}
+
+
+def classificar_bloco(linhas):
+    return [classificar_linha(linha) for linha in linhas]
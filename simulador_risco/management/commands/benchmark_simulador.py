@@ -0,0 +1,145 @@
+# simulador_risco/management/commands/benchmark_simulador.py
+import io
+import json
+import platform
+import subprocess
+from datetime import datetime
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from simulador_risco import limites
+from simulador_risco.ambiental import indices_ambientais
+from simulador_risco.benchmark import ServidorExterno, comparar, medir, montar_cenarios
+from simulador_risco.busca import indice_busca
+from simulador_risco.cache_respostas import cache_respostas
+from simulador_risco.cnpj import cache_cnpj
+from simulador_risco.models import CNAE
+from simulador_risco.snapshot import snapshot_ses
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (p50/p95/p99), consultas ao banco por requisição e requisições por segundo das '
+        'APIs do simulador, num banco de teste carregado com os CSVs de simulador_risco/dados e com '
+        'servidores locais no lugar do reCAPTCHA e da BrasilAPI. Grava o resultado em JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteracoes', type=int, default=200, help='Requisições medidas por cenário.')
+        parser.add_argument('--aquecimento', type=int, default=5, help='Requisições descartadas antes de medir.')
+        parser.add_argument('--cenario', action='append', default=None,
+                            help='Roda apenas este cenário (pode repetir). Padrão: todos.')
+        parser.add_argument('--latencia-externa', type=float, default=0.0,
+                            help='Atraso (ms) simulado em cada resposta do reCAPTCHA/BrasilAPI.')
+        parser.add_argument('--saida', default=None, help='Arquivo JSON (padrão: benchmark-simulador-<commit>.json).')
+        parser.add_argument('--comparar', default=None, help='JSON de uma execução anterior para comparar.')
+        parser.add_argument('--tolerancia', type=float, default=0.10,
+                            help='Aumento do p95 aceito na comparação antes de acusar regressão (fração).')
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as f:
+                    anterior = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Não foi possível ler {options['comparar']}: {e}")
+
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            resultado = self.executar(options)
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        saida = options['saida'] or f"benchmark-simulador-{resultado['commit'] or 'local'}.json"
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+        for nome, dados in resultado['cenarios'].items():
+            self.stdout.write(
+                f"{nome:<22} p50 {dados['p50_ms']:>8.2f} ms  p95 {dados['p95_ms']:>8.2f} ms  "
+                f"p99 {dados['p99_ms']:>8.2f} ms  {dados['consultas_por_requisicao']:>5.1f} consultas  "
+                f"{dados['requisicoes_por_segundo']:>7.1f} req/s  erros {dados['erros']}")
+        self.stdout.write(self.style.SUCCESS(f'Resultado gravado em {saida}'))
+
+        if anterior:
+            linhas, regressoes = comparar(resultado, anterior, options['tolerancia'])
+            self.stdout.write(f"Comparação com {anterior.get('commit') or options['comparar']}:")
+            for linha in linhas:
+                self.stdout.write(f'  {linha}')
+            if regressoes:
+                raise CommandError(f"Regressão em: {', '.join(regressoes)}")
+
+    def carregar_bases(self):
+        """Carrega as bases reais dos CSVs no banco de teste e descarta o estado em memória."""
+        silencio = io.StringIO()
+        call_command('importar_dados_ses', stdout=silencio)
+        call_command('popular_dispensa_projeto', stdout=silencio)
+        call_command('importar_dados_ambientais', stdout=silencio)
+        for snapshot in (snapshot_ses, indices_ambientais, indice_busca):
+            snapshot.invalidar()
+        cache_respostas.limpar()
+        cache_cnpj.limpar_memoria()
+
+    def executar(self, options):
+        self.carregar_bases()
+        cnaes = list(CNAE.objects.order_by('codigo').values_list('codigo', flat=True))
+        cnaes_risco_p = list(CNAE.objects.filter(risco_base='P').order_by('codigo').values_list('codigo', flat=True))
+        if not cnaes:
+            raise CommandError('Nenhum CNAE carregado dos CSVs.')
+
+        cenarios = montar_cenarios(cnaes, cnaes_risco_p or cnaes)
+        selecionados = options['cenario'] or list(cenarios)
+        desconhecidos = set(selecionados) - cenarios.keys()
+        if desconhecidos:
+            raise CommandError(f"Cenários inexistentes: {', '.join(sorted(desconhecidos))}. "
+                               f"Disponíveis: {', '.join(cenarios)}")
+
+        # Todas as requisições saem do mesmo IP: o limite por cliente fica desligado durante a medição
+        limitador_original = limites.limitador
+        limites.limitador = limites.LimitadorMemoria(taxa=1e9, rajada=1e9)
+        try:
+            resultados = self.medir_cenarios(options, cenarios, selecionados, cnaes)
+        finally:
+            limites.limitador = limitador_original
+
+        return {
+            'commit': _commit_atual(),
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+            'parametros': {
+                'iteracoes': options['iteracoes'],
+                'aquecimento': options['aquecimento'],
+                'latencia_externa_ms': options['latencia_externa'],
+            },
+            'cenarios': resultados,
+        }
+
+    def medir_cenarios(self, options, cenarios, selecionados, cnaes):
+        resultados = {}
+        with ServidorExterno(cnaes, atraso=options['latencia_externa'] / 1000) as externo:
+            with override_settings(
+                    SIMULADOR_RECAPTCHA_URL=f'{externo.url}/recaptcha/api/siteverify',
+                    SIMULADOR_BRASILAPI_CNPJ_URL=f'{externo.url}/api/cnpj/v1/'):
+                client = Client()
+                for nome in selecionados:
+                    self.stderr.write(f'Medindo {nome}...')
+                    resultados[nome] = medir(client, cenarios[nome], options['iteracoes'], options['aquecimento'])
+        return resultados
@@ -0,0 +1,89 @@
+# simulador_risco/management/commands/carteira_risco.py
+from django.core.management.base import BaseCommand, CommandError
+from gestao.models import Empresa
+from simulador_risco.carteira import adicionar_item, classificar_item, linhas_relatorio, recalcular_carteira
+from simulador_risco.management.commands.versoes_dados import nome_base
+from simulador_risco.models import ItemCarteira, Municipio, RelatorioCarteira
+from simulador_risco.utils import limpar_cnae
+
+
+class Command(BaseCommand):
+    help = (
+        'Carteira de empresas acompanhadas por cliente: inclui CNPJs ou conjuntos de CNAEs, lista a '
+        'classificação gravada, reclassifica e mostra os relatórios de mudança. Os comandos de importação '
+        'e o `versoes_dados` já reclassificam sozinhos os itens afetados.'
+    )
+
+    def add_arguments(self, parser):
+        acoes = parser.add_subparsers(dest='acao', required=True)
+
+        adicionar = acoes.add_parser('adicionar', help='Inclui um CNPJ ou um conjunto de CNAEs na carteira do cliente.')
+        adicionar.add_argument('empresa', type=int, help='id da gestao.Empresa (cliente).')
+        adicionar.add_argument('--cnpj', default='')
+        adicionar.add_argument('--cnaes', nargs='+', default=[])
+        adicionar.add_argument('--nome', default='')
+        adicionar.add_argument('--municipio', default=None, help='Slug do município (padrão: SIMULADOR_MUNICIPIO_PADRAO).')
+
+        listar = acoes.add_parser('listar', help='Lista os itens com a classificação gravada.')
+        listar.add_argument('--empresa', type=int, default=None)
+
+        recalcular = acoes.add_parser('recalcular', help='Reclassifica os itens com os CNAEs informados (ou todos).')
+        recalcular.add_argument('--base', type=nome_base, default='ses',
+                                help="Base que mudou: 'ses' ou 'ambiental:<município>'.")
+        recalcular.add_argument('--cnaes', nargs='+', default=[])
+        recalcular.add_argument('--todos', action='store_true', help='Reclassifica a carteira inteira.')
+
+        relatorio = acoes.add_parser('relatorio', help='Mostra um relatório de reclassificação (padrão: o último).')
+        relatorio.add_argument('id', type=int, nargs='?')
+
+    def handle(self, *args, **options):
+        getattr(self, options['acao'])(options)
+
+    def adicionar(self, options):
+        if bool(options['cnpj']) == bool(options['cnaes']):
+            raise CommandError('Informe --cnpj ou --cnaes.')
+        try:
+            empresa = Empresa.objects.get(pk=options['empresa'])
+        except Empresa.DoesNotExist:
+            raise CommandError(f"Empresa {options['empresa']} não encontrada.")
+        municipio = None
+        if options['municipio']:
+            municipio = Municipio.objects.filter(slug=options['municipio']).first()
+            if municipio is None:
+                raise CommandError(f"Município '{options['municipio']}' não cadastrado.")
+
+        item = adicionar_item(empresa, cnpj=options['cnpj'], cnaes=options['cnaes'],
+                              nome=options['nome'], municipio=municipio)
+        self.stdout.write(self.style.SUCCESS(
+            f'Item {item.pk} incluído: sanitário {item.risco_sanitario}, ambiental {item.risco_ambiental}.'))
+
+    def listar(self, options):
+        itens = ItemCarteira.objects.select_related('empresa', 'municipio')
+        if options['empresa']:
+            itens = itens.filter(empresa_id=options['empresa'])
+        for item in itens:
+            marcas = ' (projeto)' if item.projeto_obrigatorio else ''
+            marcas += ' (pendente)' if item.pendente else ''
+            self.stdout.write(
+                f"[{item.pk}] {item.empresa} / {item.nome or item.cnpj or '-'}  CNAEs: {len(item.cnaes)}  "
+                f"sanitário {item.risco_sanitario}{marcas}  ambiental {item.risco_ambiental}")
+
+    def recalcular(self, options):
+        if options['todos']:
+            mudancas = sum(1 for item in ItemCarteira.objects.select_related('municipio') if classificar_item(item))
+            self.stdout.write(self.style.SUCCESS(f'Carteira reclassificada: {mudancas} itens com mudança.'))
+            return
+        if not options['cnaes']:
+            raise CommandError('Informe --cnaes ou --todos.')
+        relatorio = recalcular_carteira(options['base'], {limpar_cnae(c) for c in options['cnaes']})
+        for linha in linhas_relatorio(relatorio):
+            self.stdout.write(linha)
+
+    def relatorio(self, options):
+        relatorios = RelatorioCarteira.objects.all()
+        relatorio = relatorios.filter(pk=options['id']).first() if options['id'] else relatorios.first()
+        if relatorio is None:
+            raise CommandError('Relatório não encontrado.')
+        self.stdout.write(f'{relatorio.criado_em:%d/%m/%Y %H:%M}  base {relatorio.base} v{relatorio.versao}')
+        for linha in linhas_relatorio(relatorio):
+            self.stdout.write(linha)
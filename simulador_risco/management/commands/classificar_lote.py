@@ -0,0 +1,128 @@
+# simulador_risco/management/commands/classificar_lote.py
+import csv
+import json
+import multiprocessing
+import re
+import sys
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from simulador_risco.lote import classificar_bloco, inicializar_processo
+
+COLUNAS_CSV = [
+    'id', 'cnpj', 'razao_social', 'cnaes', 'risco_sanitario', 'projeto_obrigatorio', 'pendente',
+    'risco_ambiental', 'cnaes_nao_encontrados', 'erro',
+]
+
+
+def linha_csv(resultado):
+    """Achata o resultado de `classificar_linha` numa linha do CSV de saída."""
+    sanitario = resultado.get('sanitario', {})
+    ambiental = resultado.get('ambiental', {})
+    nao_encontrados = [c['codigo'] for c in sanitario.get('cnaes_processados', []) if c['risco_base'] == 'N/A']
+    return {
+        'id': resultado.get('id', ''),
+        'cnpj': resultado.get('cnpj', ''),
+        'razao_social': (resultado.get('empresa_data') or {}).get('razao_social') or '',
+        'cnaes': ' '.join(resultado.get('cnaes', [])),
+        'risco_sanitario': sanitario.get('risco', ''),
+        'projeto_obrigatorio': 'sim' if sanitario.get('projeto_obrigatorio') else '',
+        'pendente': 'sim' if sanitario.get('pendente') else '',
+        'risco_ambiental': ambiental.get('risco', ''),
+        'cnaes_nao_encontrados': ' '.join(nao_encontrados),
+        'erro': resultado.get('erro', '') or '; '.join(sanitario.get('respostas_invalidas', [])),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Classifica um CSV grande de CNPJs ou listas de CNAEs nas bases sanitária e ambiental, '
+        'dividindo o arquivo em blocos entre processos. A saída (CSV ou NDJSON) sai na ordem da entrada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'arquivo',
+            help='CSV com cabeçalho contendo as colunas "cnpj" e/ou "cnaes" (e opcionalmente "id"). '
+                 'Os CNAEs de uma linha podem vir separados por espaço, vírgula ou ponto e vírgula. '
+                 'A coluna opcional "respostas" (JSON {"cnae": {"pergunta": "SIM"}}) resolve os CNAEs de risco P. '
+                 '"-" lê da entrada padrão.'
+        )
+        parser.add_argument('--saida', default=None, help='Arquivo de saída (padrão: saída padrão).')
+        parser.add_argument('--formato', choices=['csv', 'ndjson'], default='csv', help='Formato da saída.')
+        parser.add_argument('--processos', type=int, default=None, help='Processos de trabalho (padrão: nº de CPUs).')
+        parser.add_argument('--tamanho-bloco', type=int, default=500, help='Linhas enviadas a cada processo por vez.')
+
+    def handle(self, *args, **options):
+        if options['arquivo'] == '-':
+            entrada = sys.stdin
+        else:
+            try:
+                entrada = open(options['arquivo'], encoding='utf-8-sig', newline='')
+            except FileNotFoundError:
+                raise CommandError(f"Arquivo não encontrado: {options['arquivo']}")
+
+        blocos = self.ler_blocos(entrada, options['tamanho_bloco'])
+        saida = open(options['saida'], 'w', encoding='utf-8', newline='') if options['saida'] else self.stdout
+        escritor = None
+        if options['formato'] == 'csv':
+            escritor = csv.DictWriter(saida, fieldnames=COLUNAS_CSV)
+            escritor.writeheader()
+
+        # Conexões abertas aqui não podem ser herdadas pelos processos filhos
+        connections.close_all()
+        total = erros = 0
+        try:
+            with multiprocessing.Pool(options['processos'], initializer=inicializar_processo) as pool:
+                # imap mantém a ordem da entrada e entrega cada bloco assim que ele (e os anteriores) termina
+                for resultados in pool.imap(classificar_bloco, blocos):
+                    for resultado in resultados:
+                        if escritor:
+                            escritor.writerow(linha_csv(resultado))
+                        else:
+                            saida.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+                        total += 1
+                        erros += 'erro' in resultado
+        finally:
+            if entrada is not sys.stdin:
+                entrada.close()
+            if saida is not self.stdout:
+                saida.close()
+
+        self.stderr.write(self.style.SUCCESS(f'{total} linhas classificadas ({erros} com erro).'))
+
+    def ler_blocos(self, entrada, tamanho_bloco):
+        """Valida o cabeçalho e devolve um gerador preguiçoso de blocos de linhas já normalizadas."""
+        reader = csv.DictReader(entrada)
+        reader.fieldnames = [nome.strip().lower() for nome in reader.fieldnames or []]
+        if 'cnpj' not in reader.fieldnames and 'cnaes' not in reader.fieldnames:
+            raise CommandError('O CSV precisa ter a coluna "cnpj" ou a coluna "cnaes".')
+
+        linhas = (self.ler_linha(row) for row in reader)
+        return iter(lambda: list(islice(linhas, tamanho_bloco)), [])
+
+    def ler_linha(self, row):
+        linha = {
+            'id': (row.get('id') or '').strip(),
+            'cnpj': (row.get('cnpj') or '').strip(),
+            'cnaes': [c for c in re.split(r'[\s,;]+', row.get('cnaes') or '') if c],
+            'respostas': None,
+        }
+        try:
+            linha['respostas'] = self.ler_respostas(row.get('respostas'))
+        except ValueError as e:
+            # A linha sai com o erro, em vez de ser classificada como se não tivesse respostas
+            linha['erro'] = str(e)
+        return linha
+
+    def ler_respostas(self, texto):
+        """JSON da coluna "respostas" (None se vazia); ValueError se não for um objeto JSON válido."""
+        if not texto or not texto.strip():
+            return None
+        try:
+            respostas = json.loads(texto)
+        except ValueError as e:
+            raise ValueError(f'Coluna "respostas" com JSON inválido: {e}')
+        if not isinstance(respostas, dict):
+            raise ValueError('Coluna "respostas" deve ser um objeto JSON {"cnae": {"pergunta": "SIM"}}.')
+        return respostas
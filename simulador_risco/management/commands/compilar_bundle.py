@@ -0,0 +1,21 @@
+# simulador_risco/management/commands/compilar_bundle.py
+from django.core.management.base import BaseCommand
+from simulador_risco.bundle import diretorio_bundle, gravar_bundle
+
+
+class Command(BaseCommand):
+    help = (
+        'Compila as bases SES e ambiental num pacote JSON estático, nomeado pelo hash do conteúdo, '
+        'para que as páginas do simulador classifiquem no navegador. Rode após cada importação.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--diretorio', default=None, help='Destino (padrão: SIMULADOR_BUNDLE_DIR).')
+        parser.add_argument('--manter', type=int, default=3, help='Quantos pacotes (incluindo o novo) manter no diretório.')
+
+    def handle(self, *args, **options):
+        diretorio = options['diretorio'] or diretorio_bundle()
+        manifesto = gravar_bundle(diretorio, manter=options['manter'])
+        self.stdout.write(f"Bases na versão {manifesto['versao']}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Pacote {manifesto['hash']}.json gravado em {diretorio} ({manifesto['bytes'] / 1024:.0f} KB)."))
@@ -0,0 +1,45 @@
+# simulador_risco/management/commands/consultar_cnpjs_lote.py
+import json
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from simulador_risco.lote import classificar_cnpjs
+
+
+class Command(BaseCommand):
+    help = (
+        'Consulta uma lista de CNPJs em paralelo e classifica os CNAEs nas bases sanitária e ambiental. '
+        'Escreve uma linha NDJSON por CNPJ, na ordem em que as consultas terminam.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo texto com um CNPJ por linha ("-" para ler da entrada padrão).')
+        parser.add_argument('--workers', type=int, default=None, help='Consultas simultâneas (padrão: SIMULADOR_LOTE_WORKERS).')
+        parser.add_argument('--saida', default=None, help='Arquivo NDJSON de saída (padrão: saída padrão).')
+
+    def handle(self, *args, **options):
+        if options['arquivo'] == '-':
+            linhas = sys.stdin.read().splitlines()
+        else:
+            try:
+                with open(options['arquivo'], encoding='utf-8-sig') as f:
+                    linhas = f.read().splitlines()
+            except FileNotFoundError:
+                raise CommandError(f"Arquivo não encontrado: {options['arquivo']}")
+
+        cnpjs = [linha.strip() for linha in linhas if linha.strip()]
+        saida = open(options['saida'], 'w', encoding='utf-8') if options['saida'] else None
+        total = erros = 0
+        try:
+            for resultado in classificar_cnpjs(cnpjs, max_workers=options['workers']):
+                linha = json.dumps(resultado, ensure_ascii=False)
+                if saida:
+                    saida.write(linha + '\n')
+                else:
+                    self.stdout.write(linha)
+                total += 1
+                erros += 'erro' in resultado
+        finally:
+            if saida:
+                saida.close()
+
+        self.stderr.write(self.style.SUCCESS(f'{total} CNPJs processados ({erros} com erro).'))
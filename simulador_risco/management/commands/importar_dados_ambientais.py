@@ -1,86 +1,162 @@
 import csv
 import os
-import re  # Importando regex para limpar o código
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from simulador_risco.models import CNAE, ClassificacaoAmbiental
+from django.db import transaction
+from simulador_risco.ambiental import BASE_MUNICIPIOS, base_ambiental, municipio_padrao
+from simulador_risco.carteira import conteudo_atual, linhas_relatorio, recalcular_apos_mudanca
+from simulador_risco.models import CNAE, CarimboVersao, ClassificacaoAmbiental, Municipio
+from simulador_risco.utils import limpar_cnae
+from simulador_risco.versoes import dados_base, preparar_versao, versao_ativa
+
+TAMANHO_LOTE = 500
+
 
 class Command(BaseCommand):
-    help = 'Importa os dados de Classificação Ambiental do Decreto 6.615 a partir de um CSV'
+    help = (
+        'Importa a Classificação Ambiental de um município a partir de um CSV '
+        '(padrão: Decreto 6.615 de São Sebastião do Paraíso). Substitui apenas os registros do município.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--arquivo',
+            default=os.path.join(settings.BASE_DIR, 'simulador_risco', 'dados', 'dados_ambientais.csv'),
+            help='CSV (delimitado por ;) com a classificação ambiental.'
+        )
+        parser.add_argument('--preparar', action='store_true',
+                            help='Grava o CSV como nova versão (inativa) da base, sem alterar a tabela. '
+                                 'Veja as diferenças e ative com `versoes_dados`.')
+        parser.add_argument('--descricao', default='', help='Descrição da versão preparada (ex: "Decreto 6.615").')
+        parser.add_argument('--municipio', default=None,
+                            help='Slug do município (padrão: SIMULADOR_MUNICIPIO_PADRAO).')
+        parser.add_argument('--nome-municipio', default=None,
+                            help='Nome do município; obrigatório para cadastrar um município novo.')
+        parser.add_argument('--uf', default='MG')
+        parser.add_argument('--norma', default='', help='Norma municipal da classificação (ex: "Decreto Municipal nº 6.615/2024").')
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
         # Caminho do arquivo CSV
-        file_path = os.path.join(settings.BASE_DIR, 'simulador_risco', 'dados', 'dados_ambientais.csv')
+        file_path = options['arquivo']
 
         if not os.path.exists(file_path):
             self.stdout.write(self.style.ERROR(f'Arquivo não encontrado em: {file_path}'))
             return
 
-        self.stdout.write(self.style.WARNING('Iniciando importação...'))
+        municipio = self.obter_municipio(options)
+        base = base_ambiental(municipio.slug)
 
-        # Limpa os dados antigos da tabela ambiental
-        ClassificacaoAmbiental.objects.all().delete()
-        self.stdout.write('Dados antigos apagados.')
+        self.stdout.write(self.style.WARNING(f'Iniciando importação ({municipio.nome})...'))
+
+        if options['preparar']:
+            self.preparar(file_path, base, options['descricao'])
+            return
+
+        # Carrega uma única vez o conjunto de códigos válidos (evita um SELECT por linha)
+        codigos_cnae = set(CNAE.objects.values_list('codigo', flat=True))
 
         cont_sucesso = 0
         cont_erro = 0
 
-        # Função auxiliar para deixar apenas números
-        def limpar_cnae(valor):
-            if not valor:
-                return ""
-            return re.sub(r'[^0-9]', '', str(valor))
+        antes = conteudo_atual(base)
+
+        # Tudo numa única transação: os dados antigos só somem quando os novos forem
+        # confirmados, então quem lê a tabela nunca vê a base vazia ou pela metade.
+        with transaction.atomic():
+            apagados, _ = ClassificacaoAmbiental.objects.filter(municipio=municipio).delete()
+
+            lote = []
+            for objeto in self.ler_linhas(file_path):
+                if objeto.cnae_id not in codigos_cnae:
+                    cont_erro += 1
+                    continue
+                objeto.municipio = municipio
+                lote.append(objeto)
+                if len(lote) >= TAMANHO_LOTE:
+                    ClassificacaoAmbiental.objects.bulk_create(lote)
+                    cont_sucesso += len(lote)
+                    lote = []
+            if lote:
+                ClassificacaoAmbiental.objects.bulk_create(lote)
+                cont_sucesso += len(lote)
+
+            # Avisa os workers que o índice ambiental do município deve ser recarregado
+            versao = CarimboVersao.incrementar(base)
 
+        self.stdout.write(f'{apagados} registros antigos substituídos.')
+        self.stdout.write(f"Base {base} agora na versão {versao}.")
+        if versao_ativa(base):
+            self.stdout.write(self.style.WARNING(
+                f'Há uma versão ativa da base {base}: os simuladores continuam lendo a versão, não as tabelas. '
+                f'Use --preparar ou `versoes_dados desativar {base}`.'))
+        for linha in linhas_relatorio(recalcular_apos_mudanca(base, antes)):
+            self.stdout.write(linha)
+
+        self.stdout.write(self.style.SUCCESS(f'Concluído! Importados: {cont_sucesso}. Não encontrados/Erros: {cont_erro}'))
+
+    def obter_municipio(self, options):
+        """Município da importação; cadastra-o (e avisa os workers) se vier com --nome-municipio."""
+        slug = options['municipio'] or municipio_padrao()
+        if options['nome_municipio']:
+            municipio, criado = Municipio.objects.update_or_create(slug=slug, defaults={
+                'nome': options['nome_municipio'], 'uf': options['uf'], 'norma': options['norma']})
+            CarimboVersao.incrementar(BASE_MUNICIPIOS)
+            if criado:
+                self.stdout.write(f'Município {municipio.nome}/{municipio.uf} cadastrado ({slug}).')
+            return municipio
+        try:
+            return Municipio.objects.get(slug=slug)
+        except Municipio.DoesNotExist:
+            raise CommandError(f"Município '{slug}' não cadastrado. Informe --nome-municipio para cadastrá-lo.")
+
+    def preparar(self, file_path, base, descricao):
+        """Grava o CSV como versão da base ambiental do município, validando os CNAEs contra a base SES em uso."""
+        codigos_cnae = {cnae[0] for cnae in dados_base('ses')['cnaes']}
+        itens, cont_erro = [], 0
+        for objeto in self.ler_linhas(file_path):
+            if objeto.cnae_id not in codigos_cnae:
+                cont_erro += 1
+                continue
+            itens.append([objeto.cnae_id, objeto.nivel_agregacao, objeto.descricao_cnae, objeto.codigo_dn_copam,
+                          objeto.descricao_atividade, objeto.exigencia_municipal, objeto.nivel_risco])
+
+        versao = preparar_versao(base, {'itens': itens}, descricao)
+        diferencas = versao.diferencas
+        self.stdout.write(f'{len(itens)} itens lidos. Não encontrados/Erros: {cont_erro}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Versão {base} #{versao.numero} preparada: {len(diferencas['novos'])} CNAEs novos, "
+            f"{len(diferencas['removidos'])} removidos, {len(diferencas['alterados'])} alterados. "
+            f"Ative com: manage.py versoes_dados ativar {versao.pk}"))
+
+    def ler_linhas(self, file_path):
+        """Lê o CSV linha a linha, gerando objetos ClassificacaoAmbiental ainda não salvos."""
         with open(file_path, mode='r', encoding='utf-8-sig') as csvfile:
             reader = csv.DictReader(csvfile, delimiter=';')
-            
+
             # Normaliza os nomes das colunas do CSV (remove espaços e joga para maiúsculo)
             reader.fieldnames = [name.strip().upper() if name else '' for name in reader.fieldnames]
 
+            # Tenta pegar a coluna de descrição (lida com possíveis variações no cabeçalho)
+            coluna_descricao = 'DESCRIÇÃO DO CÓDIGO'
+            if coluna_descricao not in reader.fieldnames:
+                coluna_descricao = next(
+                    (key for key in reader.fieldnames if 'DESCRIÇÃO' in key and 'CÓDIGO' in key), coluna_descricao)
+
             for row in reader:
                 # Pega o valor bruto do CSV
-                codigo_cnae_bruto = row.get('CÓDIGO CNAE', '').strip()
-                
+                codigo_cnae_bruto = (row.get('CÓDIGO CNAE') or '').strip()
+
                 # LIMPEZA FUNDAMENTAL: Transforma "01.11-3/01" em "0111301"
                 codigo_cnae_limpo = limpar_cnae(codigo_cnae_bruto)
+                if not codigo_cnae_limpo:
+                    continue
 
-                # Mapeamento das outras colunas
-                nivel_agregacao = row.get('NÍVEL AGREGAÇÃO', row.get('NÍVEL AGREGAÇÃO CNAE', '')).strip()
-                codigo_dn_copam = row.get('CÓDIGO DN COPAM', '').strip()
-                
-                # Tenta pegar a descrição (lida com possíveis variações no cabeçalho)
-                descricao_atividade = row.get('DESCRIÇÃO DO CÓDIGO', '').strip()
-                if not descricao_atividade:
-                     for key in row.keys():
-                         if key and 'DESCRIÇÃO' in key and 'CÓDIGO' in key:
-                             descricao_atividade = row[key].strip()
-                             break
-
-                exigencia = row.get('EXIGÊNCIA AMBIENTAL', row.get('EXIGÊNCIA AMBIENTAL MUNICIPAL', '')).strip()
-                
-                risco = row.get('NÍVEL DE RISCO', '').strip()
-
-                if codigo_cnae_limpo:
-                    try:
-                        # Agora busca pelo código limpo (igual ao banco)
-                        cnae_obj = CNAE.objects.get(codigo=codigo_cnae_limpo)
-                        
-                        ClassificacaoAmbiental.objects.create(
-                            cnae=cnae_obj,
-                            nivel_agregacao=nivel_agregacao,
-                            codigo_dn_copam=codigo_dn_copam,
-                            descricao_atividade=descricao_atividade,
-                            exigencia_municipal=exigencia,
-                            nivel_risco=risco
-                        )
-                        cont_sucesso += 1
-
-                    except CNAE.DoesNotExist:
-                        # Mostra o código formatado no erro para facilitar sua leitura, mas avisa do limpo
-                        # self.stdout.write(self.style.WARNING(f'CNAE não encontrado: {codigo_cnae_bruto} (Limpo: {codigo_cnae_limpo})'))
-                        cont_erro += 1
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'Erro linha {codigo_cnae_bruto}: {e}'))
-                        cont_erro += 1
-
-        self.stdout.write(self.style.SUCCESS(f'Concluído! Importados: {cont_sucesso}. Não encontrados/Erros: {cont_erro}'))
\ No newline at end of file
+                yield ClassificacaoAmbiental(
+                    cnae_id=codigo_cnae_limpo,
+                    nivel_agregacao=(row.get('NÍVEL AGREGAÇÃO') or row.get('NÍVEL AGREGAÇÃO CNAE') or '').strip(),
+                    descricao_cnae=(row.get('DESCRIÇÃO CNAE') or '').strip(),
+                    codigo_dn_copam=(row.get('CÓDIGO DN COPAM') or '').strip(),
+                    descricao_atividade=(row.get(coluna_descricao) or '').strip(),
+                    exigencia_municipal=(row.get('EXIGÊNCIA AMBIENTAL') or row.get('EXIGÊNCIA AMBIENTAL MUNICIPAL') or '').strip(),
+                    nivel_risco=(row.get('NÍVEL DE RISCO') or '').strip()
+                )
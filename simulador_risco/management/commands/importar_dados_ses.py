@@ -1,77 +1,207 @@
-# Dentro de importar_dados_ses.py
+# simulador_risco/management/commands/importar_dados_ses.py
 import csv
 from pathlib import Path
-from django.core.management.base import BaseCommand
-from simulador_risco.models import CNAE, Pergunta, OpcaoResposta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from simulador_risco.carteira import conteudo_atual, linhas_relatorio, recalcular_apos_mudanca
+from simulador_risco.models import CNAE, CarimboVersao, Pergunta, OpcaoResposta
+from simulador_risco.utils import limpar_cnae
+from simulador_risco.versoes import dados_base, preparar_versao, versao_ativa
+
+APP_DIR = Path(__file__).resolve().parent.parent.parent
+
 
 class Command(BaseCommand):
-    help = 'Importa dados dos arquivos CSV da Resolução SES'
+    help = (
+        'Importa dados dos arquivos CSV da Resolução SES. Lê os quatro CSVs, compara com o banco '
+        'em memória e aplica inserções/atualizações em lote numa única transação.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Apenas mostra o resumo das alterações, sem gravar.')
+        parser.add_argument('--dados', default=str(APP_DIR / 'dados'), help='Diretório com os CSVs da Resolução.')
+        parser.add_argument('--preparar', action='store_true',
+                            help='Grava os CSVs como nova versão (inativa) da base, sem alterar as tabelas. '
+                                 'Veja as diferenças e ative com `versoes_dados`.')
+        parser.add_argument('--descricao', default='', help='Descrição da versão preparada (ex: "Resolução SES 2026").')
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Iniciando importação...'))
+        dados = self.ler_csvs(Path(options['dados']))
+        if options['preparar']:
+            versao = preparar_versao('ses', self.montar_versao(dados), options['descricao'])
+            diferencas = versao.diferencas
+            self.stdout.write(self.style.SUCCESS(
+                f"Versão ses #{versao.numero} preparada: {len(diferencas['novos'])} CNAEs novos, "
+                f"{len(diferencas['removidos'])} removidos, {len(diferencas['alterados'])} alterados. "
+                f"Ative com: manage.py versoes_dados ativar {versao.pk}"))
+            return
+        alteracoes = self.calcular_alteracoes(dados)
+        self.mostrar_resumo(alteracoes)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry-run: nenhuma alteração foi gravada.'))
+            return
+        if not any(alteracoes[chave] for chave in alteracoes if chave != 'avisos'):
+            self.stdout.write(self.style.SUCCESS('Base já está atualizada. Nada a fazer.'))
+            return
+
+        antes = conteudo_atual('ses')
+        with transaction.atomic():
+            self.aplicar(alteracoes)
+            # Avisa os workers que o snapshot em memória deve ser recarregado
+            versao = CarimboVersao.incrementar('ses')
+        self.stdout.write(f"Base SES agora na versão {versao}.")
+        if versao_ativa('ses'):
+            self.stdout.write(self.style.WARNING(
+                'Há uma versão ativa da base ses: os simuladores continuam lendo a versão, não as tabelas. '
+                'Use --preparar ou `versoes_dados desativar ses`.'))
+        for linha in linhas_relatorio(recalcular_apos_mudanca('ses', antes)):
+            self.stdout.write(linha)
+
+        self.stdout.write(self.style.SUCCESS('Importação concluída com sucesso!'))
+
+    # --- 1. Leitura ---
+
+    def ler_csvs(self, diretorio):
+        """Lê os quatro CSVs para dicionários indexados pelas chaves naturais."""
+        def linhas(nome):
+            caminho = diretorio / nome
+            if not caminho.exists():
+                raise CommandError(f'Arquivo não encontrado em: {caminho}')
+            with open(caminho, 'r', encoding='utf-8-sig') as f:
+                yield from csv.DictReader(f)
+
+        perguntas = {int(row['numero']): ' '.join(row['texto'].split()) for row in linhas('perguntas.csv')}
+
+        opcoes = {}
+        for row in linhas('opcoes_resposta.csv'):
+            opcoes[(int(row['numero_pergunta']), row['texto_resposta'])] = row['risco_resultante']
+
+        cnaes = {}
+        for row in linhas('cnaes.csv'):
+            codigo_limpo = limpar_cnae(row['codigo'])
+            if not codigo_limpo:  # Pula linhas vazias se houver
+                continue
+            cnaes[codigo_limpo] = (row['descricao'], row['risco_base'])
+
+        links = set()
+        for row in linhas('cnae_perguntas.csv'):
+            codigo_cnae_limpo = limpar_cnae(row['codigo_cnae'])
+            if codigo_cnae_limpo:
+                links.add((codigo_cnae_limpo, int(row['numero_pergunta'])))
+
+        return {'perguntas': perguntas, 'opcoes': opcoes, 'cnaes': cnaes, 'links': links}
+
+    def montar_versao(self, dados):
+        """Conteúdo da versão (formato de simulador_risco.versoes); a dispensa de projeto vem da base em uso."""
+        dispensados = {cnae[0] for cnae in dados_base('ses')['cnaes'] if cnae[3]}
+        opcoes = {}
+        for (numero, texto), risco in dados['opcoes'].items():
+            opcoes.setdefault(numero, []).append([texto, risco])
+        numeros_por_cnae = {}
+        for codigo, numero in dados['links']:
+            if numero in dados['perguntas']:
+                numeros_por_cnae.setdefault(codigo, []).append(numero)
+        return {
+            'perguntas': [[numero, texto, opcoes.get(numero, [])] for numero, texto in sorted(dados['perguntas'].items())],
+            'cnaes': [
+                [codigo, descricao, risco_base, codigo in dispensados, sorted(numeros_por_cnae.get(codigo, ()))]
+                for codigo, (descricao, risco_base) in sorted(dados['cnaes'].items())
+            ],
+        }
+
+    # --- 2. Diferença em memória ---
+
+    def calcular_alteracoes(self, dados):
+        atuais_perguntas = {p.numero: p for p in Pergunta.objects.all()}
+        atuais_opcoes = {(o.pergunta.numero, o.texto): o for o in OpcaoResposta.objects.select_related('pergunta')}
+        atuais_cnaes = {c.codigo: c for c in CNAE.objects.all()}
+        atuais_links = set(CNAE.perguntas.through.objects.values_list('cnae_id', 'pergunta__numero'))
+
+        alteracoes = {
+            'perguntas_novas': [], 'perguntas_alteradas': [],
+            'opcoes_novas': [], 'opcoes_alteradas': [],
+            'cnaes_novos': [], 'cnaes_alterados': [],
+            'links_novos': set(), 'links_removidos': set(),
+            'avisos': [],
+        }
+
+        for numero, texto in dados['perguntas'].items():
+            pergunta = atuais_perguntas.get(numero)
+            if pergunta is None:
+                alteracoes['perguntas_novas'].append(Pergunta(numero=numero, texto=texto))
+            elif pergunta.texto != texto:
+                pergunta.texto = texto
+                alteracoes['perguntas_alteradas'].append(pergunta)
+
+        for (numero, texto), risco in dados['opcoes'].items():
+            if numero not in dados['perguntas'] and numero not in atuais_perguntas:
+                alteracoes['avisos'].append(f"Opção '{texto}' aponta para a pergunta {numero}, que não existe.")
+                continue
+            opcao = atuais_opcoes.get((numero, texto))
+            if opcao is None:
+                alteracoes['opcoes_novas'].append((numero, OpcaoResposta(texto=texto, risco_resultante=risco)))
+            elif opcao.risco_resultante != risco:
+                opcao.risco_resultante = risco
+                alteracoes['opcoes_alteradas'].append(opcao)
+
+        for codigo, (descricao, risco_base) in dados['cnaes'].items():
+            cnae = atuais_cnaes.get(codigo)
+            if cnae is None:
+                alteracoes['cnaes_novos'].append(CNAE(codigo=codigo, descricao=descricao, risco_base=risco_base))
+            elif (cnae.descricao, cnae.risco_base) != (descricao, risco_base):
+                cnae.descricao, cnae.risco_base = descricao, risco_base
+                alteracoes['cnaes_alterados'].append(cnae)
+
+        codigos_validos = dados['cnaes'].keys() | atuais_cnaes.keys()
+        numeros_validos = dados['perguntas'].keys() | atuais_perguntas.keys()
+        for codigo, numero in dados['links']:
+            if codigo not in codigos_validos or numero not in numeros_validos:
+                alteracoes['avisos'].append(f"Erro ao relacionar {codigo} e {numero}: CNAE ou pergunta inexistente.")
+            elif (codigo, numero) not in atuais_links:
+                alteracoes['links_novos'].add((codigo, numero))
+        alteracoes['links_removidos'] = atuais_links - dados['links']
+
+        return alteracoes
+
+    def mostrar_resumo(self, alteracoes):
+        self.stdout.write('Resumo das alterações:')
+        for rotulo, chave in (
+                ('Perguntas novas', 'perguntas_novas'), ('Perguntas alteradas', 'perguntas_alteradas'),
+                ('Opções novas', 'opcoes_novas'), ('Opções alteradas', 'opcoes_alteradas'),
+                ('CNAEs novos', 'cnaes_novos'), ('CNAEs alterados', 'cnaes_alterados'),
+                ('Relações CNAE-pergunta novas', 'links_novos'),
+                ('Relações CNAE-pergunta removidas', 'links_removidos')):
+            self.stdout.write(f'  {rotulo}: {len(alteracoes[chave])}')
+        for aviso in alteracoes['avisos']:
+            self.stdout.write(self.style.WARNING(aviso))
+
+    # --- 3. Aplicação em lote ---
+
+    def aplicar(self, alteracoes):
+        Pergunta.objects.bulk_create(alteracoes['perguntas_novas'])
+        Pergunta.objects.bulk_update(alteracoes['perguntas_alteradas'], ['texto'])
+        ids_perguntas = dict(Pergunta.objects.values_list('numero', 'id'))
+
+        opcoes_novas = []
+        for numero, opcao in alteracoes['opcoes_novas']:
+            opcao.pergunta_id = ids_perguntas[numero]
+            opcoes_novas.append(opcao)
+        OpcaoResposta.objects.bulk_create(opcoes_novas)
+        OpcaoResposta.objects.bulk_update(alteracoes['opcoes_alteradas'], ['risco_resultante'])
+
+        CNAE.objects.bulk_create(alteracoes['cnaes_novos'], batch_size=500)
+        CNAE.objects.bulk_update(alteracoes['cnaes_alterados'], ['descricao', 'risco_base'], batch_size=500)
 
-        APP_DIR = Path(__file__).resolve().parent.parent.parent
-        
-        perguntas_csv = APP_DIR / 'dados' / 'perguntas.csv'
-        opcoes_csv = APP_DIR / 'dados' / 'opcoes_resposta.csv'
-        cnaes_csv = APP_DIR / 'dados' / 'cnaes.csv'
-        cnae_perguntas_csv = APP_DIR / 'dados' / 'cnae_perguntas.csv'
-
-        # Função auxiliar para limpar CNAEs
-        def limpar_cnae(codigo_sujo):
-            return ''.join(filter(str.isdigit, codigo_sujo))
-
-        # 1. Importar Perguntas (sem alterações)
-        with open(perguntas_csv, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                Pergunta.objects.get_or_create(
-                    numero=row['numero'],
-                    defaults={'texto': ' '.join(row['texto'].split())}
-                )
-
-        # 2. Importar Opções de Resposta (sem alterações)
-        with open(opcoes_csv, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                pergunta = Pergunta.objects.get(numero=row['numero_pergunta'])
-                OpcaoResposta.objects.get_or_create(
-                    pergunta=pergunta,
-                    texto=row['texto_resposta'],
-                    defaults={'risco_resultante': row['risco_resultante']}
-                )
-
-        # 3. Importar CNAEs (COM CORREÇÃO)
-        self.stdout.write("Importando CNAEs com códigos limpos...")
-        with open(cnaes_csv, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                codigo_limpo = limpar_cnae(row['codigo'])
-                if not codigo_limpo: # Pula linhas vazias se houver
-                    continue
-                
-                CNAE.objects.get_or_create(
-                    codigo=codigo_limpo, # SALVA O CÓDIGO SÓ COM NÚMEROS
-                    defaults={
-                        'descricao': row['descricao'],
-                        'risco_base': row['risco_base']
-                    }
-                )
-
-        # 4. Importar Relações M2M (COM CORREÇÃO)
-        self.stdout.write("Importando relações com códigos limpos...")
-        with open(cnae_perguntas_csv, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    codigo_cnae_limpo = limpar_cnae(row['codigo_cnae'])
-                    if not codigo_cnae_limpo:
-                        continue
-
-                    cnae = CNAE.objects.get(codigo=codigo_cnae_limpo) # BUSCA PELO CÓDIGO LIMPO
-                    pergunta = Pergunta.objects.get(numero=row['numero_pergunta'])
-                    cnae.perguntas.add(pergunta)
-                except (CNAE.DoesNotExist, Pergunta.DoesNotExist) as e:
-                    self.stdout.write(self.style.WARNING(f"Erro ao relacionar {row['codigo_cnae']} e {row['numero_pergunta']}: {e}"))
-
-        self.stdout.write(self.style.SUCCESS('Importação concluída com sucesso!'))
\ No newline at end of file
+        Through = CNAE.perguntas.through
+        if alteracoes['links_removidos']:
+            filtro = Q()
+            for codigo, numero in alteracoes['links_removidos']:
+                filtro |= Q(cnae_id=codigo, pergunta_id=ids_perguntas[numero])
+            Through.objects.filter(filtro).delete()
+        Through.objects.bulk_create(
+            [Through(cnae_id=codigo, pergunta_id=ids_perguntas[numero]) for codigo, numero in alteracoes['links_novos']],
+            ignore_conflicts=True,
+        )
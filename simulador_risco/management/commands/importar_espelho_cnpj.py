@@ -0,0 +1,62 @@
+# simulador_risco/management/commands/importar_espelho_cnpj.py
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from simulador_risco.espelho_cnpj import (
+    ARQUIVO_EMPRESAS, ARQUIVO_ESTABELECIMENTOS, diretorio_espelho, gerar_sintetico,
+    gravar_arquivo_ordenado, ler_empresas, ler_estabelecimentos,
+)
+from simulador_risco.models import CNAE
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa os Dados Abertos do CNPJ da Receita Federal (arquivos de Estabelecimentos e, opcionalmente, '
+        'de Empresas, em .zip ou .csv) para o espelho local consultado antes da BrasilAPI. '
+        'Com --sintetico N gera e importa uma base artificial de N estabelecimentos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--estabelecimentos', nargs='+', default=[],
+                            help='Arquivos *ESTABELE* da Receita Federal.')
+        parser.add_argument('--empresas', nargs='+', default=[], help='Arquivos *EMPRECSV* (razão social).')
+        parser.add_argument('--destino', default=None, help='Diretório do espelho (padrão: SIMULADOR_ESPELHO_CNPJ_DIR).')
+        parser.add_argument('--sintetico', type=int, default=0,
+                            help='Gera N estabelecimentos sintéticos (CNAEs da base) em vez de ler arquivos.')
+        parser.add_argument('--tamanho-bloco', type=int, default=1_000_000,
+                            help='Registros ordenados em memória por vez.')
+
+    def handle(self, *args, **options):
+        destino = options['destino'] or diretorio_espelho()
+        if not destino:
+            raise CommandError('Informe --destino ou configure SIMULADOR_ESPELHO_CNPJ_DIR.')
+        if not options['sintetico'] and not options['estabelecimentos']:
+            raise CommandError('Informe os arquivos em --estabelecimentos ou use --sintetico N.')
+        for caminho in options['estabelecimentos'] + options['empresas']:
+            if not os.path.exists(caminho):
+                raise CommandError(f'Arquivo não encontrado: {caminho}')
+        os.makedirs(destino, exist_ok=True)
+
+        with tempfile.TemporaryDirectory() as temporario:
+            estabelecimentos, empresas = options['estabelecimentos'], options['empresas']
+            if options['sintetico']:
+                cnaes = list(CNAE.objects.values_list('codigo', flat=True))
+                caminho_estab, caminho_empresas = gerar_sintetico(temporario, options['sintetico'], cnaes)
+                estabelecimentos, empresas = [caminho_estab], [caminho_empresas]
+
+            inicio = time.monotonic()
+            total = gravar_arquivo_ordenado(
+                ler_estabelecimentos(estabelecimentos), os.path.join(destino, ARQUIVO_ESTABELECIMENTOS),
+                options['tamanho_bloco'])
+            self.stdout.write(f'{total} estabelecimentos gravados ({time.monotonic() - inicio:.1f}s).')
+
+            if empresas:
+                inicio = time.monotonic()
+                total = gravar_arquivo_ordenado(
+                    ler_empresas(empresas), os.path.join(destino, ARQUIVO_EMPRESAS), options['tamanho_bloco'])
+                self.stdout.write(f'{total} empresas gravadas ({time.monotonic() - inicio:.1f}s).')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Espelho gravado em {destino}. Os workers passam a usá-lo na próxima verificação.'))
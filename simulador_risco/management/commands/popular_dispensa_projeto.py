@@ -1,11 +1,19 @@
 # simulador_risco/management/commands/popular_dispensa_projeto.py
 
 from django.core.management.base import BaseCommand
-from simulador_risco.models import CNAE
+from simulador_risco.carteira import conteudo_atual, linhas_relatorio, recalcular_apos_mudanca
+from simulador_risco.models import CNAE, CarimboVersao
+from simulador_risco.versoes import dados_base, preparar_versao, versao_ativa
 
 class Command(BaseCommand):
     help = 'Atualiza os CNAEs de Risco III que são dispensados da aprovação de projeto arquitetônico, com base no Anexo III da Resolução.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--preparar', action='store_true',
+                            help='Grava a base SES em uso com a lista de dispensa aplicada como nova versão '
+                                 '(inativa), sem alterar as tabelas. Ative com `versoes_dados`.')
+        parser.add_argument('--descricao', default='', help='Descrição da versão preparada.')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Iniciando atualização de dispensa de projeto arquitetônico...'))
 
@@ -20,6 +28,18 @@ class Command(BaseCommand):
             '9430800', '9602502'
         ]
 
+        if options['preparar']:
+            dados = dados_base('ses')
+            for cnae in dados['cnaes']:
+                cnae[3] = cnae[0] in cnaes_dispensados
+            versao = preparar_versao('ses', dados, options['descricao'] or 'Dispensa de projeto (Anexo III)')
+            self.stdout.write(self.style.SUCCESS(
+                f"Versão ses #{versao.numero} preparada com {len(versao.diferencas['alterados'])} CNAEs alterados. "
+                f"Ative com: manage.py versoes_dados ativar {versao.pk}"))
+            return
+
+        antes = conteudo_atual('ses')
+
         # Primeiro, garantimos que todos os CNAEs comecem com 'dispensado_de_projeto = False' para limpar dados antigos
         CNAE.objects.all().update(dispensado_de_projeto=False)
         self.stdout.write(self.style.NOTICE('Todos os CNAEs foram resetados para "não dispensado".'))
@@ -42,4 +62,14 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.SUCCESS('Todos os CNAEs da lista de dispensa foram encontrados e atualizados.'))
 
+        # Avisa os workers que o snapshot em memória deve ser recarregado
+        versao = CarimboVersao.incrementar('ses')
+        self.stdout.write(f"Base SES agora na versão {versao}.")
+        if versao_ativa('ses'):
+            self.stdout.write(self.style.WARNING(
+                'Há uma versão ativa da base ses: os simuladores continuam lendo a versão, não as tabelas. '
+                'Use --preparar ou `versoes_dados desativar ses`.'))
+        for linha in linhas_relatorio(recalcular_apos_mudanca('ses', antes)):
+            self.stdout.write(linha)
+
         self.stdout.write(self.style.SUCCESS('Atualização concluída!'))
\ No newline at end of file
@@ -0,0 +1,110 @@
+# simulador_risco/management/commands/versoes_dados.py
+import argparse
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from simulador_risco.carteira import conteudo_atual, linhas_relatorio, recalcular_apos_mudanca
+from simulador_risco.models import VersaoDados
+from simulador_risco.versoes import (
+    ativar_versao, desativar_versoes, exportar, preparar_versao, recalcular_diferencas, tipo_base, versao_ativa,
+)
+
+
+def nome_base(valor):
+    try:
+        tipo_base(valor)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return valor
+
+
+class Command(BaseCommand):
+    help = (
+        'Versões das bases do simulador (ses, ambiental:<município>): lista, mostra as diferenças de uma versão preparada, '
+        'ativa (ou volta para) uma versão e congela o conteúdo atual das tabelas como versão.'
+    )
+
+    def add_arguments(self, parser):
+        acoes = parser.add_subparsers(dest='acao', required=True)
+
+        listar = acoes.add_parser('listar', help='Lista as versões.')
+        listar.add_argument('--base', type=nome_base, default=None)
+
+        diferencas = acoes.add_parser('diferencas', help='CNAEs novos, removidos e alterados de uma versão.')
+        diferencas.add_argument('id', type=int)
+        diferencas.add_argument('--json', action='store_true', help='Imprime as diferenças completas em JSON.')
+        diferencas.add_argument('--recalcular', action='store_true',
+                                help='Refaz as diferenças gravadas (ex: versões preparadas antes de uma correção do cálculo).')
+
+        ativar = acoes.add_parser('ativar', help='Passa a servir a versão (também usado para voltar atrás).')
+        ativar.add_argument('id', type=int)
+
+        desativar = acoes.add_parser('desativar', help='Volta a servir as tabelas da base.')
+        desativar.add_argument('base', type=nome_base, help="'ses' ou 'ambiental:<município>'")
+
+        congelar = acoes.add_parser('congelar', help='Grava o conteúdo atual das tabelas como nova versão.')
+        congelar.add_argument('base', type=nome_base, help="'ses' ou 'ambiental:<município>'")
+        congelar.add_argument('--descricao', default='')
+
+    def handle(self, *args, **options):
+        getattr(self, options['acao'])(options)
+
+    def _versao(self, pk):
+        try:
+            return VersaoDados.objects.get(pk=pk)
+        except VersaoDados.DoesNotExist:
+            raise CommandError(f'Versão {pk} não encontrada.')
+
+    def listar(self, options):
+        versoes = VersaoDados.objects.defer('dados', 'diferencas')
+        if options['base']:
+            versoes = versoes.filter(base=options['base'])
+        for versao in versoes:
+            marca = '*' if versao.ativa else ' '
+            self.stdout.write(
+                f"{marca} [{versao.pk}] {versao.base} #{versao.numero}  {versao.criada_em:%d/%m/%Y %H:%M}  {versao.descricao}")
+
+    def diferencas(self, options):
+        versao = self._versao(options['id'])
+        diferencas = recalcular_diferencas(versao) if options['recalcular'] else versao.diferencas
+        if options['json']:
+            self.stdout.write(json.dumps(diferencas, ensure_ascii=False, indent=2))
+            return
+
+        ativa = versao_ativa(versao.base)
+        referencia = f'#{versao.comparada_com.numero}' if versao.comparada_com else 'as tabelas'
+        self.stdout.write(f'Versão {versao.base} #{versao.numero} comparada com {referencia}:')
+        if ativa and ativa != versao and ativa != versao.comparada_com:
+            self.stdout.write(self.style.WARNING(
+                f'A versão ativa agora é #{ativa.numero}; as diferenças foram calculadas contra {referencia}.'))
+        self.stdout.write(f"  CNAEs novos: {len(diferencas['novos'])}  {' '.join(diferencas['novos'][:20])}")
+        self.stdout.write(f"  CNAEs removidos: {len(diferencas['removidos'])}  {' '.join(diferencas['removidos'][:20])}")
+        self.stdout.write(f"  CNAEs alterados: {len(diferencas['alterados'])}")
+        for item in diferencas['alterados']:
+            campos = '; '.join(f'{campo}: {antes} -> {depois}' for campo, (antes, depois) in item['campos'].items())
+            self.stdout.write(f"    {item['codigo']}  {campos}")
+
+    def ativar(self, options):
+        versao = self._versao(options['id'])
+        antes = conteudo_atual(versao.base)
+        carimbo = ativar_versao(versao)
+        self.stdout.write(self.style.SUCCESS(
+            f'Versão {versao.base} #{versao.numero} ativa (carimbo {carimbo}). '
+            f'Os workers recarregam na próxima verificação.'))
+        self.relatar_carteira(versao.base, antes)
+
+    def desativar(self, options):
+        antes = conteudo_atual(options['base'])
+        carimbo = desativar_versoes(options['base'])
+        self.stdout.write(self.style.SUCCESS(f"Base {options['base']} volta a ser lida das tabelas (carimbo {carimbo})."))
+        self.relatar_carteira(options['base'], antes)
+
+    def relatar_carteira(self, base, antes):
+        """Reclassifica os itens da carteira afetados pela troca de conteúdo da base."""
+        for linha in linhas_relatorio(recalcular_apos_mudanca(base, antes)):
+            self.stdout.write(linha)
+
+    def congelar(self, options):
+        versao = preparar_versao(options['base'], exportar(options['base']), options['descricao'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Tabelas gravadas como versão {versao.base} #{versao.numero} (id {versao.pk}).'))
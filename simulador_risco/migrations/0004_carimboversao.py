@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador_risco', '0003_classificacaoambiental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarimboVersao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=30, unique=True)),
+                ('versao', models.PositiveIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador_risco', '0004_carimboversao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaCNPJ',
+            fields=[
+                ('cnpj', models.CharField(max_length=14, primary_key=True, serialize=False)),
+                ('dados', models.JSONField()),
+                ('consultado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Consulta de CNPJ',
+                'verbose_name_plural': 'Consultas de CNPJ',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador_risco', '0005_consultacnpj'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificacaoambiental',
+            name='descricao_cnae',
+            field=models.TextField(blank=True, default='', verbose_name='Descrição CNAE (sinônimo)'),
+        ),
+    ]
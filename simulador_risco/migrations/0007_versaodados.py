@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador_risco', '0006_classificacaoambiental_descricao_cnae'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoDados',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=30)),
+                ('numero', models.PositiveIntegerField()),
+                ('descricao', models.CharField(blank=True, default='', max_length=255)),
+                ('dados', models.JSONField()),
+                ('diferencas', models.JSONField(default=dict)),
+                ('ativa', models.BooleanField(default=False)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('ativada_em', models.DateTimeField(blank=True, null=True)),
+                ('comparada_com', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='simulador_risco.versaodados')),
+            ],
+            options={
+                'verbose_name': 'Versão de base',
+                'verbose_name_plural': 'Versões de bases',
+                'ordering': ['base', '-numero'],
+                'constraints': [models.UniqueConstraint(fields=('base', 'numero'), name='versao_dados_numero_unico'), models.UniqueConstraint(condition=models.Q(('ativa', True)), fields=('base',), name='versao_dados_uma_ativa')],
+            },
+        ),
+    ]
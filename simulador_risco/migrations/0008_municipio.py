@@ -0,0 +1,61 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+MUNICIPIO_INICIAL = {
+    'slug': 'ssparaiso',
+    'nome': 'São Sebastião do Paraíso',
+    'uf': 'MG',
+    'norma': 'Decreto Municipal nº 6.615/2024',
+}
+
+
+def atribuir_municipio_inicial(apps, schema_editor):
+    """A classificação existente é a do decreto de São Sebastião do Paraíso; as bases passam a ser por município."""
+    Municipio = apps.get_model('simulador_risco', 'Municipio')
+    ClassificacaoAmbiental = apps.get_model('simulador_risco', 'ClassificacaoAmbiental')
+    CarimboVersao = apps.get_model('simulador_risco', 'CarimboVersao')
+    VersaoDados = apps.get_model('simulador_risco', 'VersaoDados')
+
+    municipio, _ = Municipio.objects.get_or_create(slug=MUNICIPIO_INICIAL['slug'], defaults=MUNICIPIO_INICIAL)
+    ClassificacaoAmbiental.objects.update(municipio=municipio)
+    base = f"ambiental:{municipio.slug}"
+    CarimboVersao.objects.filter(base='ambiental').update(base=base)
+    VersaoDados.objects.filter(base='ambiental').update(base=base)
+
+
+def reverter_municipio_inicial(apps, schema_editor):
+    CarimboVersao = apps.get_model('simulador_risco', 'CarimboVersao')
+    VersaoDados = apps.get_model('simulador_risco', 'VersaoDados')
+    base = f"ambiental:{MUNICIPIO_INICIAL['slug']}"
+    CarimboVersao.objects.filter(base=base).update(base='ambiental')
+    VersaoDados.objects.filter(base=base).update(base='ambiental')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador_risco', '0007_versaodados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Municipio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=20, unique=True)),
+                ('nome', models.CharField(max_length=120)),
+                ('uf', models.CharField(default='MG', max_length=2)),
+                ('norma', models.CharField(blank=True, default='', help_text="Ex: 'Decreto Municipal nº 6.615/2024'", max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Município',
+                'ordering': ['nome'],
+            },
+        ),
+        migrations.AddField(
+            model_name='classificacaoambiental',
+            name='municipio',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='classificacoes_ambientais', to='simulador_risco.municipio'),
+        ),
+        migrations.RunPython(atribuir_municipio_inicial, reverter_municipio_inicial),
+    ]
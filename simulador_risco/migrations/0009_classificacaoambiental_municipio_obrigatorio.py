@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # Separada da 0008: no PostgreSQL o ALTER TABLE não pode ocorrer na mesma transação do UPDATE
+
+    dependencies = [
+        ('simulador_risco', '0008_municipio'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='classificacaoambiental',
+            name='municipio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='classificacoes_ambientais', to='simulador_risco.municipio'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao', '0002_ferramenta_empresa_ferramentas_contratadas'),
+        ('simulador_risco', '0009_classificacaoambiental_municipio_obrigatorio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioCarteira',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=30)),
+                ('versao', models.PositiveIntegerField(default=0)),
+                ('cnaes_alterados', models.JSONField(default=list)),
+                ('itens_recalculados', models.PositiveIntegerField(default=0)),
+                ('mudancas', models.JSONField(default=list)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Relatório da carteira',
+                'verbose_name_plural': 'Relatórios da carteira',
+                'ordering': ['-criado_em'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemCarteira',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cnpj', models.CharField(blank=True, default='', max_length=14)),
+                ('nome', models.CharField(blank=True, default='', max_length=150)),
+                ('cnaes', models.JSONField(default=list)),
+                ('respostas', models.JSONField(blank=True, default=dict)),
+                ('risco_sanitario', models.CharField(blank=True, default='', max_length=10)),
+                ('projeto_obrigatorio', models.BooleanField(default=False)),
+                ('pendente', models.BooleanField(default=False)),
+                ('risco_ambiental', models.CharField(blank=True, default='', max_length=10)),
+                ('classificacao', models.JSONField(blank=True, default=dict)),
+                ('versoes', models.JSONField(blank=True, default=dict)),
+                ('classificado_em', models.DateTimeField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='carteira_risco', to='gestao.empresa')),
+                ('municipio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='simulador_risco.municipio')),
+            ],
+            options={
+                'verbose_name': 'Item da carteira',
+                'verbose_name_plural': 'Carteira de empresas',
+                'ordering': ['empresa', 'nome', 'cnpj'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CNAECarteira',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(db_index=True, max_length=7)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indice_cnaes', to='simulador_risco.itemcarteira')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'codigo'), name='cnae_carteira_unico')],
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
 class Pergunta(models.Model):
     numero = models.IntegerField(unique=True, help_text="Número da pergunta (ex: 1, 2, 3)")
@@ -30,17 +32,37 @@ class CNAE(models.Model):
     def __str__(self):
         return f"{self.codigo} - {self.risco_base}"
     
+class Municipio(models.Model):
+    """Jurisdição com classificação ambiental própria (ex: 'ssparaiso' -> Decreto Municipal nº 6.615/2024)."""
+    # Usado nas URLs, na API e no carimbo da base ('ambiental:<slug>')
+    slug = models.SlugField(max_length=20, unique=True)
+    nome = models.CharField(max_length=120)
+    uf = models.CharField(max_length=2, default='MG')
+    norma = models.CharField(max_length=255, blank=True, default='', help_text="Ex: 'Decreto Municipal nº 6.615/2024'")
+
+    class Meta:
+        verbose_name = "Município"
+        ordering = ['nome']
+
+    def __str__(self):
+        return f"{self.nome}/{self.uf}"
+
+
 class ClassificacaoAmbiental(models.Model):
     """
-    Tabela específica para o Decreto Municipal nº 6615 (Ambiental).
-    Um único CNAE pode ter várias entradas aqui se tiver diferentes
+    Classificação ambiental municipal (ex: Decreto Municipal nº 6615 de São Sebastião do Paraíso).
+    Um único CNAE pode ter várias entradas aqui, por município, se tiver diferentes
     códigos DN COPAM ou especificidades.
     """
+    municipio = models.ForeignKey(Municipio, on_delete=models.PROTECT, related_name='classificacoes_ambientais')
     cnae = models.ForeignKey(CNAE, on_delete=models.CASCADE, related_name='classificacoes_ambientais')
     
     # Coluna: NÍVEL AGREGAÇÃO CNAE (Atividade ou Subclasse)
     nivel_agregacao = models.CharField(max_length=50, blank=True, null=True)
     
+    # Coluna: DESCRIÇÃO CNAE (Sinônimo da atividade, ex: "Canil; Criação De Cães")
+    descricao_cnae = models.TextField(blank=True, default='', verbose_name="Descrição CNAE (sinônimo)")
+    
     # Coluna: CÓDIGO DN COPAM (Ex: G-03-04-2, ou 'Não Listada')
     codigo_dn_copam = models.CharField(max_length=50, blank=True, null=True)
     
@@ -56,4 +78,154 @@ class ClassificacaoAmbiental(models.Model):
 
     def __str__(self):
         return f"{self.cnae.codigo} - {self.codigo_dn_copam} ({self.nivel_risco})"
-    
+
+
+class CarimboVersao(models.Model):
+    """
+    Carimbo de versão de uma base do simulador ('ses', 'ambiental:<município>', 'municipios').
+    Os comandos de importação incrementam o carimbo ao final e cada worker
+    compara com a versão do seu snapshot em memória para saber quando recarregar.
+    """
+    base = models.CharField(max_length=30, unique=True)
+    versao = models.PositiveIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.base} v{self.versao}"
+
+    @classmethod
+    def atual(cls, base):
+        """Retorna a versão corrente da base (0 se nunca foi importada)."""
+        return cls.objects.filter(base=base).values_list('versao', flat=True).first() or 0
+
+    @classmethod
+    def atuais(cls, *bases):
+        """Retorna, em uma única consulta, a tupla de versões das bases informadas."""
+        versoes = dict(cls.objects.filter(base__in=bases).values_list('base', 'versao'))
+        return tuple(versoes.get(base, 0) for base in bases)
+
+    @classmethod
+    def incrementar(cls, base):
+        """Incrementa a versão da base de forma atômica e retorna o novo valor."""
+        carimbo, _ = cls.objects.get_or_create(base=base)
+        cls.objects.filter(pk=carimbo.pk).update(versao=F('versao') + 1, atualizado_em=timezone.now())
+        return cls.atual(base)
+
+
+class ConsultaCNPJ(models.Model):
+    """
+    Cache persistente das consultas de CNPJ à BrasilAPI, já normalizadas no
+    formato devolvido por `api_consultar_cnpj` (empresa_data + cnaes).
+    """
+    cnpj = models.CharField(max_length=14, primary_key=True)
+    dados = models.JSONField()
+    consultado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Consulta de CNPJ"
+        verbose_name_plural = "Consultas de CNPJ"
+
+    def __str__(self):
+        return f"{self.cnpj} ({self.consultado_em:%d/%m/%Y})"
+
+
+class VersaoDados(models.Model):
+    """
+    Versão congelada de uma base do simulador ('ses' ou 'ambiental:<município>'), guardada
+    lado a lado com as demais. Os snapshots em memória leem a versão ativa da
+    base (ou as tabelas, se nenhuma estiver ativa); ativar outra versão é uma
+    troca de flag mais o incremento do `CarimboVersao`.
+    """
+    base = models.CharField(max_length=30)
+    numero = models.PositiveIntegerField()
+    descricao = models.CharField(max_length=255, blank=True, default='')
+    # Conteúdo completo da base (ver simulador_risco.versoes)
+    dados = models.JSONField()
+    # Diferenças por CNAE em relação à versão que estava ativa quando esta foi preparada
+    diferencas = models.JSONField(default=dict)
+    comparada_com = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    ativa = models.BooleanField(default=False)
+    criada_em = models.DateTimeField(auto_now_add=True)
+    ativada_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Versão de base"
+        verbose_name_plural = "Versões de bases"
+        ordering = ['base', '-numero']
+        constraints = [
+            models.UniqueConstraint(fields=['base', 'numero'], name='versao_dados_numero_unico'),
+            models.UniqueConstraint(fields=['base'], condition=models.Q(ativa=True), name='versao_dados_uma_ativa'),
+        ]
+
+    def __str__(self):
+        return f"{self.base} #{self.numero}{' (ativa)' if self.ativa else ''}"
+
+
+class ItemCarteira(models.Model):
+    """
+    Empresa (CNPJ ou conjunto de CNAEs) acompanhada pela consultoria para um
+    cliente (`gestao.Empresa`), com a última classificação sanitária e
+    ambiental gravada. Reclassificada por simulador_risco.carteira quando as
+    bases mudam nos CNAEs dela.
+    """
+    empresa = models.ForeignKey('gestao.Empresa', on_delete=models.CASCADE, related_name='carteira_risco')
+    cnpj = models.CharField(max_length=14, blank=True, default='')
+    nome = models.CharField(max_length=150, blank=True, default='')
+    # Códigos CNAE limpos ('4711302')
+    cnaes = models.JSONField(default=list)
+    # Respostas das perguntas dos CNAEs de risco 'P': {codigo: {numero: resposta}}
+    respostas = models.JSONField(default=dict, blank=True)
+    # Sem município, vale o SIMULADOR_MUNICIPIO_PADRAO
+    municipio = models.ForeignKey(Municipio, null=True, blank=True, on_delete=models.PROTECT, related_name='+')
+
+    # Classificação materializada
+    risco_sanitario = models.CharField(max_length=10, blank=True, default='')
+    projeto_obrigatorio = models.BooleanField(default=False)
+    pendente = models.BooleanField(default=False)
+    risco_ambiental = models.CharField(max_length=10, blank=True, default='')
+    classificacao = models.JSONField(default=dict, blank=True)
+    # Carimbos das bases usadas na classificação: {'ses': 3, 'ambiental:ssparaiso': 2}
+    versoes = models.JSONField(default=dict, blank=True)
+    classificado_em = models.DateTimeField(null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Item da carteira"
+        verbose_name_plural = "Carteira de empresas"
+        ordering = ['empresa', 'nome', 'cnpj']
+
+    def __str__(self):
+        return f"{self.empresa} - {self.nome or self.cnpj or ', '.join(self.cnaes)}"
+
+
+class CNAECarteira(models.Model):
+    """Índice reverso CNAE -> itens da carteira, mantido junto com `ItemCarteira.cnaes`."""
+    item = models.ForeignKey(ItemCarteira, on_delete=models.CASCADE, related_name='indice_cnaes')
+    codigo = models.CharField(max_length=7, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'codigo'], name='cnae_carteira_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.codigo} -> {self.item_id}"
+
+
+class RelatorioCarteira(models.Model):
+    """Resultado de uma reclassificação da carteira depois de uma mudança de base."""
+    base = models.CharField(max_length=30)
+    versao = models.PositiveIntegerField(default=0)
+    cnaes_alterados = models.JSONField(default=list)
+    itens_recalculados = models.PositiveIntegerField(default=0)
+    # [{'item', 'empresa', 'cnpj', 'nome', 'campos': {campo: [antes, depois]}}]
+    mudancas = models.JSONField(default=list)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Relatório da carteira"
+        verbose_name_plural = "Relatórios da carteira"
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"{self.base} v{self.versao}: {len(self.mudancas)} mudanças"
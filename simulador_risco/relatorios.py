@@ -0,0 +1,313 @@
+# simulador_risco/relatorios.py
+"""
+Relatórios para impressão do resultado do simulador (sanitário ou ambiental).
+
+A classificação é feita na requisição, sobre os snapshots em memória (custo
+de microssegundos); só a renderização do documento vai para um pool de
+threads próprio (SIMULADOR_RELATORIOS_THREADS), criado no primeiro uso de
+cada worker. O documento é gravado em SIMULADOR_RELATORIOS_DIR com o nome
+`<hash>.html`, onde o hash cobre o tipo, o conjunto de CNAEs, as respostas
+das perguntas, o município e a versão das bases: o mesmo relatório pedido de
+novo é servido do disco sem renderizar, e uma importação muda o hash.
+
+A situação de cada relatório fica em arquivos-marcadores ao lado do HTML
+(`<hash>.gerando` enquanto renderiza, `<hash>.erro` se falhou), visíveis a
+todos os workers: o acompanhamento pode cair em qualquer um deles, e o
+marcador criado com O_EXCL impede dois workers de renderizar o mesmo relatório.
+
+As respostas entram no hash já validadas e reduzidas ao risco de cada
+pergunta dos CNAEs 'P', então o número de relatórios distintos é limitado
+pelas combinações válidas. Mesmo assim, arquivos mais antigos que
+SIMULADOR_RELATORIOS_RETENCAO são apagados (no máximo uma varredura do
+diretório a cada INTERVALO_PODA segundos por worker, feita ao receber pedidos).
+
+O HTML é autocontido e preparado para impressão (o navegador salva em PDF).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .ambiental import municipio_padrao, obter_indice_ambiental, obter_municipios
+from .bundle import _gravar_atomico
+from .lote import classificar_cnaes
+from .snapshot import obter_snapshot_ses
+from .utils import limpar_cnae
+
+FORMATO_RELATORIO = 1
+TIPOS_RELATORIO = ('sanitario', 'ambiental')
+PADRAO_HASH = re.compile(r'^[0-9a-f]{32}$')
+# Um marcador `.gerando` mais antigo que isso é de um worker que morreu no meio da renderização
+PRAZO_RENDERIZACAO = 300
+INTERVALO_PODA = 600
+
+
+def diretorio_relatorios():
+    return getattr(settings, 'SIMULADOR_RELATORIOS_DIR',
+                   os.path.join(settings.MEDIA_ROOT, 'simulador_risco', 'relatorios'))
+
+
+def caminho_relatorio(hash_relatorio):
+    """Caminho do relatório já gravado, ou None se o hash for inválido ou o arquivo não existir."""
+    if not PADRAO_HASH.match(hash_relatorio):
+        return None
+    caminho = os.path.join(diretorio_relatorios(), f'{hash_relatorio}.html')
+    return caminho if os.path.exists(caminho) else None
+
+
+def _marcador(hash_relatorio, estado):
+    return os.path.join(diretorio_relatorios(), f'{hash_relatorio}.{estado}')
+
+
+def _idade(caminho):
+    try:
+        return time.time() - os.path.getmtime(caminho)
+    except FileNotFoundError:
+        return None
+
+
+def _remover(caminho):
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def _normalizar(tipo, codigos, respostas):
+    """
+    CNAEs limpos, ordenados e sem repetição; respostas só dos CNAEs do relatório
+    (e só no sanitário). Levanta ValueError se os tipos recebidos forem inválidos.
+    """
+    if not isinstance(codigos, list):
+        raise ValueError("'cnaes' deve ser uma lista de códigos.")
+    if respostas is not None and not isinstance(respostas, dict):
+        raise ValueError("'respostas' deve ser um objeto {CNAE: {pergunta: resposta}}.")
+    codigos = sorted({limpar_cnae(c) for c in codigos if c} - {''})
+    respostas_normalizadas = {}
+    if tipo == 'sanitario':
+        for codigo, respostas_cnae in (respostas or {}).items():
+            codigo = limpar_cnae(codigo)
+            if not isinstance(respostas_cnae, dict):
+                raise ValueError(f"Respostas do CNAE '{codigo}' devem ser um objeto {{pergunta: resposta}}.")
+            if codigo in codigos:
+                respostas_normalizadas[codigo] = {
+                    str(numero).strip(): str(resposta).strip().upper() for numero, resposta in respostas_cnae.items()
+                }
+    return codigos, respostas_normalizadas
+
+
+def _respostas_validas(snapshot, codigos, respostas):
+    """
+    Valida as respostas como o `api_resolver_risco` e guarda só as das perguntas
+    dos CNAEs 'P' do relatório, já como o risco resultante ('SIM' e o risco a
+    que ele leva geram o mesmo relatório). ValueError se houver resposta inválida.
+    """
+    _, invalidas = snapshot.resolver_respostas(codigos, respostas)
+    validas = {}
+    for codigo, respostas_cnae in respostas.items():
+        opcoes_por_pergunta = {str(numero): opcoes for numero, opcoes in snapshot.tabela_decisao.get(codigo, ())}
+        for numero, resposta in respostas_cnae.items():
+            if numero not in opcoes_por_pergunta:
+                continue
+            risco = opcoes_por_pergunta[numero].get(resposta)
+            if risco is None:
+                # O resolver para na primeira pergunta sem resposta; as seguintes também são verificadas aqui
+                mensagem = f"Resposta '{resposta}' inválida para a pergunta {numero} do CNAE {codigo}."
+                if mensagem not in invalidas:
+                    invalidas.append(mensagem)
+                continue
+            validas.setdefault(codigo, {})[numero] = risco
+    if invalidas:
+        raise ValueError(' '.join(invalidas))
+    return validas
+
+
+def chave_relatorio(tipo, codigos, respostas, municipio, versao):
+    """Hash (32 caracteres) de tudo o que determina o conteúdo do relatório."""
+    conteudo = json.dumps([FORMATO_RELATORIO, tipo, municipio, list(versao), codigos, respostas],
+                          sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(conteudo.encode()).hexdigest()[:32]
+
+
+def montar_contexto(tipo, codigos, respostas, municipio, versao, hash_relatorio):
+    """Contexto do template: a classificação, com o risco final de cada CNAE sanitário já resolvido."""
+    resultado = classificar_cnaes(codigos, respostas, municipio)
+    sanitario = resultado['sanitario']
+    riscos_resolvidos = sanitario['riscos_resolvidos']
+    cnaes_sanitarios = [
+        {**cnae, 'risco_final': riscos_resolvidos.get(cnae['codigo'], cnae['risco_base'])}
+        for cnae in sanitario['cnaes_processados']
+    ]
+    return {
+        'tipo': tipo,
+        'municipio': obter_municipios().get(municipio),
+        'sanitario': sanitario,
+        'cnaes_sanitarios': cnaes_sanitarios,
+        'ambiental': resultado['ambiental'],
+        'versao': versao,
+        'gerado_em': timezone.localtime(),
+        'hash': hash_relatorio,
+    }
+
+
+def _renderizar(hash_relatorio, contexto):
+    try:
+        html = render_to_string('simulador_risco/relatorio.html', contexto)
+        _gravar_atomico(os.path.join(diretorio_relatorios(), f'{hash_relatorio}.html'), html.encode())
+    except Exception as e:
+        _gravar_atomico(_marcador(hash_relatorio, 'erro'), repr(e).encode())
+        raise
+    finally:
+        _remover(_marcador(hash_relatorio, 'gerando'))
+        close_old_connections()
+
+
+class FilaRelatorios:
+    """
+    Pool de renderização do worker. A situação dos relatórios fica nos
+    marcadores em disco; `_tarefas` guarda só as renderizações em andamento
+    neste processo, para as métricas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._tarefas = {}
+        self._contadores = {'renderizados': 0, 'do_disco': 0, 'falhas': 0, 'removidos': 0}
+        self._ultima_poda = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SIMULADOR_RELATORIOS_THREADS', 2), thread_name_prefix='relatorios')
+        return self._executor
+
+    def _concluir(self, hash_relatorio, futuro):
+        # A falha já ficou registrada no marcador `.erro`, visto por todos os workers
+        with self._lock:
+            self._tarefas.pop(hash_relatorio, None)
+            self._contadores['falhas' if futuro.exception() is not None else 'renderizados'] += 1
+
+    def _reservar(self, hash_relatorio):
+        """
+        Cria o marcador `.gerando`; False se algum worker já está renderizando
+        o relatório. Um pedido novo apaga a falha anterior e tenta de novo.
+        """
+        os.makedirs(diretorio_relatorios(), exist_ok=True)
+        _remover(_marcador(hash_relatorio, 'erro'))
+        gerando = _marcador(hash_relatorio, 'gerando')
+        try:
+            os.close(os.open(gerando, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return True
+        except FileExistsError:
+            idade = _idade(gerando)
+            if idade is not None and idade < PRAZO_RENDERIZACAO:
+                return False
+            os.utime(gerando)  # marcador abandonado: assume a renderização
+            return True
+
+    def podar(self, forcar=False):
+        """
+        Apaga os relatórios e marcadores `.erro` mais antigos que
+        SIMULADOR_RELATORIOS_RETENCAO, os `.gerando` abandonados e os temporários
+        de gravações interrompidas. Sem `forcar`, roda no máximo a cada INTERVALO_PODA.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            if not forcar and self._ultima_poda is not None and agora - self._ultima_poda < INTERVALO_PODA:
+                return 0
+            self._ultima_poda = agora
+        retencao = getattr(settings, 'SIMULADOR_RELATORIOS_RETENCAO', 7 * 24 * 3600)
+        limites = {'.html': retencao, '.erro': retencao, '.gerando': PRAZO_RENDERIZACAO, '.tmp': PRAZO_RENDERIZACAO}
+        removidos = 0
+        try:
+            entradas = list(os.scandir(diretorio_relatorios()))
+        except FileNotFoundError:
+            return 0
+        limite_atual = time.time()
+        for entrada in entradas:
+            limite = limites.get(os.path.splitext(entrada.name)[1])
+            try:
+                if limite is not None and limite_atual - entrada.stat().st_mtime > limite:
+                    os.remove(entrada.path)
+                    removidos += 1
+            except FileNotFoundError:  # removido por outro worker
+                pass
+        with self._lock:
+            self._contadores['removidos'] += removidos
+        return removidos
+
+    def enviar(self, hash_relatorio, montar_contexto):
+        """
+        Agenda a renderização, a menos que o relatório já exista ou esteja em
+        andamento em algum worker. `montar_contexto()` só é chamado quando há o
+        que renderizar.
+        """
+        self.podar()
+        if caminho_relatorio(hash_relatorio):
+            with self._lock:
+                self._contadores['do_disco'] += 1
+            return
+        if not self._reservar(hash_relatorio):
+            return
+        try:
+            contexto = montar_contexto()
+            with self._lock:
+                futuro = self._tarefas[hash_relatorio] = self._pool().submit(_renderizar, hash_relatorio, contexto)
+        except Exception:
+            _remover(_marcador(hash_relatorio, 'gerando'))
+            raise
+        futuro.add_done_callback(lambda f: self._concluir(hash_relatorio, f))
+
+    def situacao(self, hash_relatorio):
+        """'pronto', 'gerando', 'erro' ou None (relatório nunca pedido)."""
+        if caminho_relatorio(hash_relatorio):
+            return 'pronto'
+        if not PADRAO_HASH.match(hash_relatorio):
+            return None
+        if os.path.exists(_marcador(hash_relatorio, 'erro')):
+            return 'erro'
+        idade = _idade(_marcador(hash_relatorio, 'gerando'))
+        if idade is None:
+            # A renderização pode ter terminado entre a primeira verificação e agora
+            return 'pronto' if caminho_relatorio(hash_relatorio) else None
+        return 'gerando' if idade < PRAZO_RENDERIZACAO else 'erro'
+
+    def metricas(self):
+        with self._lock:
+            return {**self._contadores, 'em_andamento': len(self._tarefas)}
+
+
+fila_relatorios = FilaRelatorios()
+
+
+def solicitar_relatorio(tipo, codigos, respostas=None, municipio=None):
+    """
+    Classifica os CNAEs e agenda a renderização do relatório (se ainda não
+    existir). Retorna (hash, situação). Levanta `MunicipioDesconhecido` se o
+    município não estiver cadastrado e ValueError para um tipo ou uma resposta inválidos.
+    """
+    if tipo not in TIPOS_RELATORIO:
+        raise ValueError(f"Tipo de relatório inválido: '{tipo}'.")
+    municipio = municipio or municipio_padrao()
+    codigos, respostas = _normalizar(tipo, codigos, respostas)
+    if tipo == 'sanitario':
+        snapshot = obter_snapshot_ses()
+        respostas = _respostas_validas(snapshot, codigos, respostas)
+        versao = snapshot.versao
+        hash_relatorio = chave_relatorio(tipo, codigos, respostas, None, versao)
+    else:
+        versao = obter_indice_ambiental(municipio).versao
+        hash_relatorio = chave_relatorio(tipo, codigos, respostas, municipio, versao)
+
+    fila_relatorios.enviar(
+        hash_relatorio, lambda: montar_contexto(tipo, codigos, respostas, municipio, versao, hash_relatorio))
+    return hash_relatorio, fila_relatorios.situacao(hash_relatorio)
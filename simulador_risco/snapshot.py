@@ -0,0 +1,253 @@
+# simulador_risco/snapshot.py
+"""
+Snapshot em memória da base da Resolução SES/MG.
+
+A base inteira (~1.300 CNAEs, ~60 perguntas e ~120 opções) é carregada uma única
+vez por worker, já com tooltips, cores, ordem e o payload das perguntas
+pré-calculados. A classificação de um conjunto de CNAEs passa a ser feita sem
+nenhuma consulta ao banco.
+
+As perguntas dos CNAEs de risco 'P' também são compiladas numa tabela de
+decisão (CNAE -> perguntas -> resposta -> risco), para que o risco final possa
+ser resolvido no servidor a partir das respostas (`resolver_respostas`).
+
+O snapshot guarda a versão do `CarimboVersao` com que foi montado. Os comandos
+de importação incrementam o carimbo e os workers recarregam os dados na
+próxima verificação (no máximo a cada SIMULADOR_SNAPSHOT_INTERVALO segundos).
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .models import CarimboVersao
+from .utils import formatar_cnae, limpar_cnae
+from .versoes import dados_base
+
+RISCO_MAP = {'NA': 0, 'I': 1, 'II': 2, 'III': 3, 'P': 4}
+RISCO_CORES = {'NA': 'info', 'I': 'success', 'II': 'warning', 'III': 'danger', 'P': 'secondary'}
+RISCO_TOOLTIPS = {
+    'NA': 'Não se Aplica - Dispensado de alvará sanitário para esta atividade.',
+    'I': 'Nível de Risco I - Baixo Risco',
+    'II': 'Nível de Risco II - Médio Risco',
+    'III': 'Nível de Risco III - Alto Risco',
+    'P': 'Responder a pergunta para classificar o risco',
+    'N/A': 'CNAE não encontrado na base da Resolução SES/MG.'
+}
+TOOLTIP_PROJETO = 'Nível de Risco III com exigência de projeto arquitetônico aprovado'
+
+BASE_SES = 'ses'
+
+
+def _intervalo_verificacao():
+    return getattr(settings, 'SIMULADOR_SNAPSHOT_INTERVALO', 30)
+
+
+class SnapshotVersionado:
+    """
+    Mantém, por processo, um objeto montado a partir do banco e o recarrega
+    quando o `CarimboVersao` de alguma das bases muda. A verificação dos
+    carimbos custa uma consulta e é feita no máximo uma vez por intervalo.
+    """
+
+    def __init__(self, bases, carregar):
+        self.bases = tuple(bases)
+        self._carregar = carregar
+        self._lock = threading.Lock()
+        self._valor = None
+        self._versao = None
+        self._verificado_em = 0.0
+
+    def _valido(self):
+        return self._valor is not None and time.monotonic() - self._verificado_em < _intervalo_verificacao()
+
+    def obter(self):
+        if self._valido():
+            return self._valor
+        with self._lock:
+            if self._valido():
+                return self._valor
+            versao = CarimboVersao.atuais(*self.bases)
+            if self._valor is None or versao != self._versao:
+                self._valor = self._carregar(versao)
+                self._versao = versao
+            self._verificado_em = time.monotonic()
+            return self._valor
+
+    def invalidar(self):
+        """Descarta o objeto em memória; o próximo `obter()` recarrega do banco."""
+        with self._lock:
+            self._valor = None
+            self._versao = None
+
+
+class SnapshotSES:
+    """Visão somente-leitura da base SES, indexada pelo código limpo do CNAE."""
+
+    __slots__ = ('versao', 'cnaes', 'perguntas_por_cnae', 'tabela_decisao')
+
+    def __init__(self, versao, cnaes, perguntas_por_cnae):
+        self.versao = versao
+        self.cnaes = MappingProxyType(cnaes)
+        self.perguntas_por_cnae = MappingProxyType(perguntas_por_cnae)
+        self.tabela_decisao = MappingProxyType(compilar_tabela_decisao(perguntas_por_cnae))
+
+    def classificar(self, codigos_limpos):
+        """
+        Monta a resposta de `api_consultar_cnaes` para a lista de códigos limpos.
+        Cada CNAE encontrado aparece uma única vez; os não encontrados são
+        listados na ordem em que foram informados.
+        """
+        resultado_final = {'cnaes_processados': [], 'perguntas_necessarias': []}
+        perguntas_vistas = set()
+
+        for codigo in sorted(set(codigos_limpos) & self.cnaes.keys()):
+            for numero, pergunta_data in self.perguntas_por_cnae.get(codigo, ()):
+                if numero not in perguntas_vistas:
+                    perguntas_vistas.add(numero)
+                    resultado_final['perguntas_necessarias'].append(dict(pergunta_data))
+            item = dict(self.cnaes[codigo])
+            item['perguntas_nums'] = list(item['perguntas_nums'])
+            resultado_final['cnaes_processados'].append(item)
+
+        for codigo in codigos_limpos:
+            if codigo not in self.cnaes:
+                resultado_final['cnaes_processados'].append({
+                    'codigo': codigo, 'codigo_formatado': formatar_cnae(codigo),
+                    'descricao': 'CNAE não encontrado na base da Resolução.', 'risco_base': 'N/A',
+                    'cor': 'light', 'tooltip': RISCO_TOOLTIPS.get('N/A', ''),
+                    'perguntas_nums': [], 'ordem': -1
+                })
+
+        return resultado_final
+
+    def resolver_respostas(self, codigos_limpos, respostas):
+        """
+        Resolve os CNAEs de risco 'P' pela tabela de decisão.
+
+        `respostas` é {codigo: {numero_pergunta: resposta}}; a resposta pode ser o
+        texto da opção ("SIM") ou o risco resultante ("III"), que é o que o
+        navegador guarda. Um CNAE só é resolvido com todas as perguntas
+        respondidas, e o risco dele é o maior entre as respostas.
+        Retorna (riscos_resolvidos {codigo: risco}, respostas_invalidas [mensagens]).
+        """
+        respostas_por_cnae, invalidas = {}, []
+        for codigo, respostas_cnae in (respostas or {}).items():
+            if not isinstance(respostas_cnae, dict):
+                invalidas.append(f"Respostas do CNAE {codigo} devem ser um objeto {{pergunta: resposta}}.")
+                continue
+            respostas_por_cnae[limpar_cnae(codigo)] = {
+                str(numero).strip(): str(resposta).strip().upper() for numero, resposta in respostas_cnae.items()
+            }
+
+        riscos_resolvidos = {}
+        for codigo in sorted(set(codigos_limpos) & self.tabela_decisao.keys()):
+            respostas_cnae = respostas_por_cnae.get(codigo, {})
+            riscos = []
+            for numero, opcoes in self.tabela_decisao[codigo]:
+                resposta = respostas_cnae.get(str(numero))
+                if not resposta:
+                    break
+                risco = opcoes.get(resposta)
+                if risco is None:
+                    invalidas.append(f"Resposta '{resposta}' inválida para a pergunta {numero} do CNAE {codigo}.")
+                    break
+                riscos.append(risco)
+            else:
+                riscos_resolvidos[codigo] = max(riscos, key=lambda r: RISCO_MAP.get(r, 0), default='NA')
+        return riscos_resolvidos, invalidas
+
+
+def compilar_tabela_decisao(perguntas_por_cnae):
+    """
+    {codigo: ((numero, {RESPOSTA: risco}), ...)} para os CNAEs de risco 'P'.
+    Cada pergunta aceita tanto o texto das opções quanto os riscos resultantes.
+    """
+    tabela = {}
+    for codigo, perguntas in perguntas_por_cnae.items():
+        tabela[codigo] = tuple(
+            (numero, MappingProxyType({
+                **{opcao['risco'].upper(): opcao['risco'] for opcao in pergunta['opcoes']},
+                **{opcao['texto'].strip().upper(): opcao['risco'] for opcao in pergunta['opcoes']},
+            }))
+            for numero, pergunta in perguntas
+        )
+    return tabela
+
+
+def resumo_sanitario(resultado, riscos_resolvidos=None):
+    """
+    Consolida a resposta de `classificar` no risco final da empresa, como o
+    simulador faz no navegador: o maior nível entre os CNAEs, com projeto
+    arquitetônico obrigatório se algum CNAE de nível III não for dispensado.
+    CNAEs de risco 'P' entram com o risco de `riscos_resolvidos` (ver
+    `resolver_respostas`); os que ficaram sem resposta marcam o resultado como pendente.
+    """
+    riscos_resolvidos = riscos_resolvidos or {}
+    risco, ordem, projeto_obrigatorio = 'NA', 0, False
+    pendente = False
+    for cnae in resultado['cnaes_processados']:
+        risco_cnae = cnae['risco_base']
+        if risco_cnae == 'P':
+            if cnae['codigo'] not in riscos_resolvidos:
+                pendente = True
+                continue
+            risco_cnae = riscos_resolvidos[cnae['codigo']]
+        ordem_cnae = RISCO_MAP.get(risco_cnae, 0)
+        if ordem_cnae > ordem:
+            risco, ordem = risco_cnae, ordem_cnae
+            projeto_obrigatorio = False
+        if ordem_cnae == 3 == ordem and not cnae.get('dispensado_projeto', True):
+            projeto_obrigatorio = True
+    return {'risco': risco, 'projeto_obrigatorio': projeto_obrigatorio, 'pendente': pendente}
+
+
+def _tooltip(risco_base, dispensado_de_projeto):
+    if risco_base == 'III' and not dispensado_de_projeto:
+        return TOOLTIP_PROJETO
+    return RISCO_TOOLTIPS.get(risco_base, '')
+
+
+def carregar_snapshot_ses(versao):
+    """Monta o snapshot a partir da versão ativa da Resolução SES (ou das tabelas, ver simulador_risco.versoes)."""
+    dados = dados_base(BASE_SES)
+    perguntas = {
+        numero: (texto, tuple({'texto': texto_opcao, 'risco': risco} for texto_opcao, risco in opcoes))
+        for numero, texto, opcoes in dados['perguntas']
+    }
+
+    cnaes = {}
+    perguntas_por_cnae = {}
+    for codigo, descricao, risco_base, dispensado, numeros in dados['cnaes']:
+        perguntas_do_cnae = []
+        if risco_base == 'P':
+            for numero in numeros:
+                if numero not in perguntas:
+                    continue
+                texto, opcoes = perguntas[numero]
+                perguntas_do_cnae.append((numero, MappingProxyType({
+                    'numero': numero, 'texto': texto, 'opcoes': [dict(op) for op in opcoes],
+                    'cnae_origem_codigo': codigo,
+                    'cnae_origem_descricao': descricao,
+                })))
+            perguntas_por_cnae[codigo] = tuple(perguntas_do_cnae)
+
+        cnaes[codigo] = MappingProxyType({
+            'codigo': codigo, 'codigo_formatado': formatar_cnae(codigo),
+            'descricao': descricao, 'risco_base': risco_base,
+            'cor': RISCO_CORES.get(risco_base, 'dark'), 'tooltip': _tooltip(risco_base, dispensado),
+            'perguntas_nums': tuple(numero for numero, _ in perguntas_do_cnae),
+            'ordem': RISCO_MAP.get(risco_base, -1),
+            'dispensado_projeto': dispensado,
+        })
+
+    return SnapshotSES(versao, cnaes, perguntas_por_cnae)
+
+
+snapshot_ses = SnapshotVersionado((BASE_SES,), carregar_snapshot_ses)
+
+
+def obter_snapshot_ses():
+    """Atalho para o snapshot SES corrente deste worker."""
+    return snapshot_ses.obter()
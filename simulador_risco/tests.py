@@ -1,3 +1,131 @@
-from django.test import TestCase
+import csv
+import os
+import tempfile
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from gestao.models import Empresa
+
+from .ambiental import indices_ambientais, municipio_padrao
+from .carteira import adicionar_item, conteudo_atual, recalcular_apos_mudanca
+from .cnpj import normalizar_resposta
+from .espelho_cnpj import (
+    ARQUIVO_EMPRESAS, ARQUIVO_ESTABELECIMENTOS, SITUACOES, ArquivoOrdenado, EspelhoCNPJ,
+    decodificar_estabelecimento, gerar_sintetico, gravar_arquivo_ordenado, ler_empresas, ler_estabelecimentos,
+)
+from .models import CNAE, Municipio, OpcaoResposta, Pergunta
+from .snapshot import snapshot_ses
+from .versoes import ativar_versao, calcular_diferencas, exportar, preparar_versao
+
+
+def dados_ses(opcoes_pergunta_1):
+    return {
+        'perguntas': [[1, 'Realiza procedimentos invasivos?', opcoes_pergunta_1]],
+        'cnaes': [
+            ['8630503', 'Atividade médica ambulatorial', 'P', False, [1]],
+            ['4711302', 'Comércio varejista', 'II', False, []],
+        ],
+    }
+
+
+class DiferencasSESTests(SimpleTestCase):
+    def test_troca_dos_riscos_das_opcoes_altera_os_cnaes_da_pergunta(self):
+        antes = dados_ses([['SIM', 'NA'], ['NÃO', 'III']])
+        depois = dados_ses([['SIM', 'III'], ['NÃO', 'NA']])
+
+        diferencas = calcular_diferencas('ses', antes, depois)
+
+        self.assertEqual(diferencas['novos'], [])
+        self.assertEqual(diferencas['removidos'], [])
+        self.assertEqual([item['codigo'] for item in diferencas['alterados']], ['8630503'])
+        self.assertEqual(
+            diferencas['alterados'][0]['campos']['perguntas'],
+            [{'1': {'SIM': 'NA', 'NÃO': 'III'}}, {'1': {'SIM': 'III', 'NÃO': 'NA'}}],
+        )
+
+    def test_conteudo_igual_nao_tem_diferencas(self):
+        dados = dados_ses([['SIM', 'NA'], ['NÃO', 'III']])
+        self.assertEqual(calcular_diferencas('ses', dados, dados), {'novos': [], 'removidos': [], 'alterados': []})
+
+
+class CarteiraMudancaRespostasTests(TestCase):
+    def setUp(self):
+        pergunta = Pergunta.objects.create(numero=1, texto='Realiza procedimentos invasivos?')
+        OpcaoResposta.objects.create(pergunta=pergunta, texto='SIM', risco_resultante='NA')
+        OpcaoResposta.objects.create(pergunta=pergunta, texto='NÃO', risco_resultante='III')
+        cnae = CNAE.objects.create(codigo='8630503', descricao='Atividade médica ambulatorial', risco_base='P')
+        cnae.perguntas.add(pergunta)
+        Municipio.objects.get_or_create(slug=municipio_padrao(), defaults={'nome': 'Padrão'})
+        snapshot_ses.invalidar()
+        indices_ambientais.invalidar()
+
+    def test_troca_dos_riscos_das_opcoes_reclassifica_itens_com_respostas(self):
+        empresa = Empresa.objects.create(nome='Cliente')
+        item = adicionar_item(empresa, cnaes=['8630503'], respostas={'8630503': {'1': 'SIM'}})
+        self.assertEqual(item.classificacao['sanitario'], {'8630503': 'NA'})
+
+        antes = conteudo_atual('ses')
+        trocado = exportar('ses')
+        trocado['perguntas'] = [[1, 'Realiza procedimentos invasivos?', [['SIM', 'III'], ['NÃO', 'NA']]]]
+        ativar_versao(preparar_versao('ses', trocado))
+        relatorio = recalcular_apos_mudanca('ses', antes)
+
+        self.assertEqual(relatorio.cnaes_alterados, ['8630503'])
+        self.assertEqual(relatorio.itens_recalculados, 1)
+        self.assertEqual(relatorio.mudancas[0]['campos']['sanitario:8630503'], ['NA', 'III'])
+        item.refresh_from_db()
+        self.assertEqual(item.risco_sanitario, 'III')
+
+
+class EspelhoCNPJSinteticoTests(SimpleTestCase):
+    CNAES = ['4711302', '5611201', '8630503', '9602501']
+
+    def setUp(self):
+        temporario = tempfile.TemporaryDirectory()
+        self.addCleanup(temporario.cleanup)
+        self.diretorio = temporario.name
+        self.caminho_estab, self.caminho_empresas = gerar_sintetico(self.diretorio, 300, self.CNAES)
+        with open(self.caminho_estab, encoding='latin-1', newline='') as f:
+            self.linhas = list(csv.reader(f, delimiter=';'))
+        with open(self.caminho_empresas, encoding='latin-1', newline='') as f:
+            self.razoes = {linha[0]: linha[1] for linha in csv.reader(f, delimiter=';')}
+
+    def gravar(self):
+        # Blocos pequenos para passar pela intercalação da ordenação externa
+        gravar_arquivo_ordenado(ler_estabelecimentos([self.caminho_estab]),
+                                os.path.join(self.diretorio, ARQUIVO_ESTABELECIMENTOS), tamanho_bloco=37)
+        gravar_arquivo_ordenado(ler_empresas([self.caminho_empresas]),
+                                os.path.join(self.diretorio, ARQUIVO_EMPRESAS), tamanho_bloco=37)
+
+    def test_busca_encontra_todos_os_registros_gravados(self):
+        self.gravar()
+        arquivo = ArquivoOrdenado(os.path.join(self.diretorio, ARQUIVO_ESTABELECIMENTOS))
+        self.assertEqual(arquivo.quantidade, len(self.linhas))
+        for linha in self.linhas:
+            cnpj = int(linha[0] + linha[1] + linha[2])
+            situacao, cnaes, nome_fantasia = decodificar_estabelecimento(arquivo.buscar(cnpj))
+            self.assertEqual(situacao, int(linha[5]))
+            self.assertEqual([f'{c:07d}' for c in cnaes], [linha[11]] + [c for c in linha[12].split(',') if c])
+            self.assertEqual(nome_fantasia, linha[4])
+        self.assertIsNone(arquivo.buscar(1))
+        self.assertIsNone(arquivo.buscar(99999999999999))
+
+    def test_consulta_no_formato_da_brasilapi_normalizada(self):
+        self.gravar()
+        espelho = EspelhoCNPJ()
+        with self.settings(SIMULADOR_ESPELHO_CNPJ_DIR=self.diretorio):
+            for linha in self.linhas[:50]:
+                cnpj = linha[0] + linha[1] + linha[2]
+                secundarios = [c for c in linha[12].split(',') if c]
+                resposta_brasilapi = {
+                    'razao_social': self.razoes[linha[0]],
+                    'nome_fantasia': linha[4],
+                    'descricao_situacao_cadastral': SITUACOES[int(linha[5])],
+                    'cnae_fiscal': int(linha[11]),
+                    'cnaes_secundarios': [{'codigo': int(c)} for c in secundarios],
+                }
+                self.assertEqual(espelho.consultar(cnpj), normalizar_resposta(resposta_brasilapi))
+            self.assertIsNone(espelho.consultar('00000000000191'))
+            metricas = espelho.metricas()
+        self.assertEqual((metricas['acertos'], metricas['falhas']), (50, 1))
+        self.assertEqual(metricas['estabelecimentos'], len(self.linhas))
+        self.assertEqual(metricas['empresas'], len(self.razoes))
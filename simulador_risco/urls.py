@@ -1,15 +1,38 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'simulador_risco'
 
+# Em modo ASGI (SIMULADOR_ASGI=True) as APIs com chamadas externas usam as views assíncronas
+if getattr(settings, 'SIMULADOR_ASGI', False):
+    view_consultar_cnaes = views.api_consultar_cnaes_async
+    view_consultar_cnpj = views.api_consultar_cnpj_async
+    view_consultar_empresa = views.api_consultar_empresa_async
+    view_consultar_cnaes_ambiental = views.api_consultar_cnaes_ambiental_async
+else:
+    view_consultar_cnaes = views.api_consultar_cnaes
+    view_consultar_cnpj = views.api_consultar_cnpj
+    view_consultar_empresa = views.api_consultar_empresa
+    view_consultar_cnaes_ambiental = views.api_consultar_cnaes_ambiental
+
 urlpatterns = [
     path('', views.pagina_simulador, name='simulador'),
-    path('api/consultar-cnaes/', views.api_consultar_cnaes, name='api_consultar_cnaes'),
-    path('api/consultar-cnpj/<str:cnpj>/', views.api_consultar_cnpj, name='api_consultar_cnpj'),
+    path('api/consultar-cnaes/', view_consultar_cnaes, name='api_consultar_cnaes'),
+    path('api/consultar-cnpj/<str:cnpj>/', view_consultar_cnpj, name='api_consultar_cnpj'),
+    path('api/consultar-empresa/<str:cnpj>/', view_consultar_empresa, name='api_consultar_empresa'),
+    path('api/resolver-risco/', views.api_resolver_risco, name='api_resolver_risco'),
+    path('bundle/<str:hash_conteudo>.json', views.bundle_regras, name='bundle_regras'),
     path('api/buscar-cnae/', views.api_buscar_cnae, name='api_buscar_cnae'),
+    path('api/hierarquia-cnae/<str:codigo>/', views.api_hierarquia_cnae, name='api_hierarquia_cnae'),
     path('simulador-ambiental-ssparaiso/', views.pagina_simulador_ambiental, name='simulador_ambiental'),
     path('semam/', views.pagina_simulador_ambiental, name='simulador_ambiental'),
-    path('api/consultar-cnaes-ambiental/', views.api_consultar_cnaes_ambiental, name='api_consultar_cnaes_ambiental'),
+    path('ambiental/<slug:municipio>/', views.pagina_simulador_ambiental, name='simulador_ambiental_municipio'),
+    path('api/consultar-cnaes-ambiental/', view_consultar_cnaes_ambiental, name='api_consultar_cnaes_ambiental'),
+    path('api/relatorio/', views.api_gerar_relatorio, name='api_gerar_relatorio'),
+    path('api/relatorio/<str:hash_relatorio>/', views.api_situacao_relatorio, name='api_situacao_relatorio'),
+    path('relatorio/<str:hash_relatorio>.html', views.relatorio_simulador, name='relatorio_simulador'),
+    path('api/consultar-lote/', views.api_consultar_lote, name='api_consultar_lote'),
+    path('api/metricas/', views.api_metricas, name='api_metricas'),
 
 ]
\ No newline at end of file
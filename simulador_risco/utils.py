@@ -0,0 +1,15 @@
+# simulador_risco/utils.py
+
+
+def limpar_cnae(codigo):
+    """Mantém apenas os dígitos do código CNAE (ex: '0111-3/01' -> '0111301')."""
+    if not codigo:
+        return ''
+    return ''.join(filter(str.isdigit, str(codigo)))
+
+
+def formatar_cnae(codigo):
+    """Helper para formatar o código CNAE de 7 dígitos."""
+    if codigo and len(codigo) == 7:
+        return f"{codigo[0:4]}-{codigo[4]}/{codigo[5:]}"
+    return codigo
@@ -0,0 +1,104 @@
+# simulador_risco/verificacao.py
+"""
+Token de verificação do simulador.
+
+A primeira chamada que passa pelo reCAPTCHA recebe, no cabeçalho
+`X-Simulador-Token`, um token assinado (HMAC com a SECRET_KEY, via
+`django.core.signing`) e vinculado ao IP e ao navegador do cliente. Enquanto
+o token for válido (SIMULADOR_VERIFICACAO_VALIDADE segundos), as chamadas
+seguintes que o reenviam dispensam a verificação no Google, que custa uma
+chamada HTTPS de 100–300 ms.
+"""
+import hashlib
+import threading
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+
+from .limites import ip_cliente
+
+CABECALHO_TOKEN = 'X-Simulador-Token'
+SALT = 'simulador_risco.verificacao'
+
+
+def _validade():
+    return getattr(settings, 'SIMULADOR_VERIFICACAO_VALIDADE', 900)
+
+
+def _vinculo(request):
+    """Resumo do IP + User-Agent: o token não serve se for copiado para outro cliente."""
+    dados = f"{ip_cliente(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.sha256(dados.encode()).hexdigest()[:32]
+
+
+class _Contadores:
+    def __init__(self):
+        self.emitidos = 0
+        self.reaproveitados = 0
+        self._lock = threading.Lock()
+
+    def somar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+
+contadores = _Contadores()
+
+
+def emitir_token(request):
+    return signing.dumps({'v': _vinculo(request)}, salt=SALT)
+
+
+def token_valido(request):
+    """True se a requisição traz um token dentro da validade e emitido para este cliente."""
+    token = request.headers.get(CABECALHO_TOKEN)
+    if not token:
+        return False
+    try:
+        dados = signing.loads(token, salt=SALT, max_age=_validade())
+    except signing.BadSignature:  # inclui SignatureExpired
+        return False
+    return isinstance(dados, dict) and constant_time_compare(dados.get('v', ''), _vinculo(request))
+
+
+def cliente_verificado(request, recaptcha_response, verificar_recaptcha):
+    """
+    Aceita o token de verificação ou, na falta dele, valida o reCAPTCHA com
+    `verificar_recaptcha` e agenda um token novo para a resposta (ver `anexar_token`).
+    """
+    if token_valido(request):
+        contadores.somar('reaproveitados')
+        return True
+    if verificar_recaptcha(recaptcha_response):
+        request.simulador_token = emitir_token(request)
+        contadores.somar('emitidos')
+        return True
+    return False
+
+
+def _anexar(request, response):
+    token = getattr(request, 'simulador_token', None)
+    if token and response.status_code < 400:
+        response[CABECALHO_TOKEN] = token
+    return response
+
+
+def anexar_token(view):
+    """Decorator: devolve no cabeçalho o token emitido durante a view (views síncronas ou assíncronas)."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrap(request, *args, **kwargs):
+            return _anexar(request, await view(request, *args, **kwargs))
+    else:
+        @wraps(view)
+        def wrap(request, *args, **kwargs):
+            return _anexar(request, view(request, *args, **kwargs))
+    return wrap
+
+
+def metricas():
+    """Contadores de tokens deste worker."""
+    return {'emitidos': contadores.emitidos, 'reaproveitados': contadores.reaproveitados}
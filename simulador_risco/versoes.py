@@ -0,0 +1,171 @@
+# simulador_risco/versoes.py
+"""
+Versões das bases do simulador (Resolução SES e classificação ambiental de
+cada município, 'ambiental:<slug>').
+
+Cada versão (`VersaoDados`) guarda a base inteira num JSON:
+
+    ses:         {'perguntas': [[numero, texto, [[texto_opcao, risco], ...]], ...],
+                  'cnaes': [[codigo, descricao, risco_base, dispensado_de_projeto, [numeros]], ...]}
+    ambiental:*  {'itens': [[cnae, nivel_agregacao, descricao_cnae, dn_copam,
+                             descricao_atividade, exigencia, risco], ...]}
+
+Os carregadores dos snapshots em memória (SES, ambiental, busca, hierarquia)
+leem `dados_base(base)`: o conteúdo da versão ativa ou, se nenhuma estiver
+ativa, o das tabelas. Uma versão nova é preparada ao lado da ativa, já com as
+diferenças por CNAE calculadas (risco, exigência, dispensa de projeto), e só
+passa a valer com `ativar_versao`, que troca a flag e incrementa o carimbo da
+base: os workers recarregam na verificação seguinte, sem reescrever tabelas.
+Voltar atrás é ativar a versão anterior.
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import CNAE, CarimboVersao, ClassificacaoAmbiental, OpcaoResposta, Pergunta, VersaoDados
+
+
+# --- Conteúdo das tabelas ---
+
+def exportar_ses():
+    """Conteúdo das tabelas da Resolução SES no formato das versões (4 consultas)."""
+    opcoes = {}
+    for pergunta_id, texto, risco in OpcaoResposta.objects.order_by('id').values_list(
+            'pergunta_id', 'texto', 'risco_resultante'):
+        opcoes.setdefault(pergunta_id, []).append([texto, risco])
+
+    perguntas, numeros = [], {}
+    for pk, numero, texto in Pergunta.objects.order_by('numero').values_list('id', 'numero', 'texto'):
+        perguntas.append([numero, texto, opcoes.get(pk, [])])
+        numeros[pk] = numero
+
+    perguntas_por_cnae = {}
+    for cnae_id, pergunta_id in CNAE.perguntas.through.objects.values_list('cnae_id', 'pergunta_id'):
+        perguntas_por_cnae.setdefault(cnae_id, []).append(numeros[pergunta_id])
+
+    cnaes = [
+        [codigo, descricao, risco_base, dispensado, sorted(perguntas_por_cnae.get(codigo, ()))]
+        for codigo, descricao, risco_base, dispensado in CNAE.objects.order_by('codigo').values_list(
+            'codigo', 'descricao', 'risco_base', 'dispensado_de_projeto')
+    ]
+    return {'perguntas': perguntas, 'cnaes': cnaes}
+
+
+def exportar_ambiental(municipio):
+    """Conteúdo da tabela `ClassificacaoAmbiental` do município no formato das versões."""
+    itens = ClassificacaoAmbiental.objects.filter(municipio__slug=municipio).order_by('id').values_list(
+        'cnae_id', 'nivel_agregacao', 'descricao_cnae', 'codigo_dn_copam',
+        'descricao_atividade', 'exigencia_municipal', 'nivel_risco')
+    return {'itens': [list(item) for item in itens]}
+
+
+def tipo_base(base):
+    """'ses' ou 'ambiental' (para 'ambiental:<município>'); ValueError se o nome não for de uma base."""
+    tipo, _, municipio = base.partition(':')
+    if (tipo == 'ses' and not municipio) or (tipo == 'ambiental' and municipio):
+        return tipo
+    raise ValueError(f"Base inválida: '{base}'. Use 'ses' ou 'ambiental:<município>'.")
+
+
+def exportar(base):
+    """Conteúdo atual das tabelas da base."""
+    if tipo_base(base) == 'ses':
+        return exportar_ses()
+    return exportar_ambiental(base.partition(':')[2])
+
+
+def versao_ativa(base):
+    return VersaoDados.objects.filter(base=base, ativa=True).first()
+
+
+def dados_base(base):
+    """Conteúdo que os simuladores devem ler: a versão ativa da base ou, sem ela, as tabelas."""
+    dados = VersaoDados.objects.filter(base=base, ativa=True).values_list('dados', flat=True).first()
+    return dados if dados is not None else exportar(base)
+
+
+# --- Diferenças ---
+
+def _resumo_ses(dados):
+    # Opção -> risco de cada pergunta: trocar o risco a que uma resposta leva também é uma mudança
+    riscos_por_pergunta = {numero: dict(opcoes) for numero, _, opcoes in dados['perguntas']}
+    resumo = {}
+    for codigo, descricao, risco_base, dispensado, numeros in dados['cnaes']:
+        resumo[codigo] = {
+            'descricao': descricao,
+            'risco': risco_base,
+            'dispensa_projeto': bool(dispensado),
+            # Para os CNAEs 'P', as perguntas e o risco a que cada resposta leva
+            'perguntas': {str(n): riscos_por_pergunta.get(n, {}) for n in numeros} if risco_base == 'P' else {},
+        }
+    return resumo
+
+
+def _resumo_ambiental(dados):
+    agrupado = {}
+    for cnae, _, _, dn_copam, _, exigencia, risco in dados['itens']:
+        item = agrupado.setdefault(cnae, {'riscos': set(), 'exigencias': set(), 'dn_copam': set()})
+        item['riscos'].add(risco or '')
+        item['exigencias'].add(exigencia or '')
+        item['dn_copam'].add(dn_copam or '')
+    return {cnae: {campo: sorted(valores) for campo, valores in item.items()} for cnae, item in agrupado.items()}
+
+
+RESUMIDORES = {'ses': _resumo_ses, 'ambiental': _resumo_ambiental}
+
+
+def calcular_diferencas(base, antes, depois):
+    """CNAEs novos, removidos e alterados (campo -> [antes, depois]) entre dois conteúdos da base."""
+    resumir = RESUMIDORES[tipo_base(base)]
+    resumo_antes, resumo_depois = resumir(antes), resumir(depois)
+    alterados = []
+    for codigo in sorted(resumo_antes.keys() & resumo_depois.keys()):
+        campos = {
+            campo: [valor, resumo_depois[codigo][campo]]
+            for campo, valor in resumo_antes[codigo].items() if valor != resumo_depois[codigo][campo]
+        }
+        if campos:
+            alterados.append({'codigo': codigo, 'campos': campos})
+    return {
+        'novos': sorted(resumo_depois.keys() - resumo_antes.keys()),
+        'removidos': sorted(resumo_antes.keys() - resumo_depois.keys()),
+        'alterados': alterados,
+    }
+
+
+def recalcular_diferencas(versao):
+    """Refaz as diferenças gravadas na versão contra a versão com que foi comparada (ou as tabelas atuais)."""
+    antes = versao.comparada_com.dados if versao.comparada_com else exportar(versao.base)
+    versao.diferencas = calcular_diferencas(versao.base, antes, versao.dados)
+    versao.save(update_fields=['diferencas'])
+    return versao.diferencas
+
+
+# --- Preparação e ativação ---
+
+def preparar_versao(base, dados, descricao=''):
+    """Grava `dados` como nova versão (inativa) da base, com as diferenças para o conteúdo em uso."""
+    with transaction.atomic():
+        ativa = versao_ativa(base)
+        antes = ativa.dados if ativa else exportar(base)
+        numero = (VersaoDados.objects.filter(base=base).aggregate(m=Max('numero'))['m'] or 0) + 1
+        return VersaoDados.objects.create(
+            base=base, numero=numero, descricao=descricao, dados=dados,
+            diferencas=calcular_diferencas(base, antes, dados), comparada_com=ativa)
+
+
+def ativar_versao(versao):
+    """Torna `versao` a versão lida pelos simuladores e avisa os workers. Retorna o novo carimbo da base."""
+    with transaction.atomic():
+        VersaoDados.objects.filter(base=versao.base, ativa=True).exclude(pk=versao.pk).update(ativa=False)
+        versao.ativa = True
+        versao.ativada_em = timezone.now()
+        versao.save(update_fields=['ativa', 'ativada_em'])
+        return CarimboVersao.incrementar(versao.base)
+
+
+def desativar_versoes(base):
+    """Volta os simuladores a ler as tabelas da base. Retorna o novo carimbo."""
+    with transaction.atomic():
+        VersaoDados.objects.filter(base=base, ativa=True).update(ativa=False)
+        return CarimboVersao.incrementar(base)
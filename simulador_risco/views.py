@@ -1,18 +1,62 @@
 # simulador_risco/views.py
 
 from django.shortcuts import render
-from django.http import JsonResponse
-from .models import CNAE, ClassificacaoAmbiental
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+import re
 import requests 
 import json
-from django.db.models import Q 
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from accounts.decorators import administrador_required
+from asgiref.sync import sync_to_async
+from .assincrono import em_thread_io
+from .cache_respostas import resposta_ambiental, resposta_empresa, resposta_sanitaria
+from .cache_respostas import metricas as metricas_cache
+from .cliente_http import cliente, metricas
+from .bundle import bundle_atual, caminho_bundle
+from .busca import buscar_cnaes
+from .cnpj import consultar_cnpj
+from .espelho_cnpj import espelho_cnpj
+from .hierarquia import obter_hierarquia
+from .limites import controlar_admissao
+from .limites import metricas as metricas_admissao
+from .lote import classificar_cnpjs, gerar_ndjson
+from .relatorios import caminho_relatorio, fila_relatorios, solicitar_relatorio
+from .ambiental import MENSAGENS_RISCO_GERAL, MunicipioDesconhecido, municipio_padrao, obter_indice_ambiental, obter_municipios
+from .snapshot import obter_snapshot_ses, resumo_sanitario
+from .utils import limpar_cnae
+from .verificacao import anexar_token, cliente_verificado
+from .verificacao import metricas as metricas_verificacao
+
+RECAPTCHA_VERIFY_URL = 'https://www.google.com/recaptcha/api/siteverify'
+ERRO_MUNICIPIO = 'Município sem classificação ambiental cadastrada.'
+# Fichas do limite por IP gastas por consulta de CNPJ (reCAPTCHA + BrasilAPI)
+CUSTO_CONSULTA_CNPJ = 3
 
 # --- View Principal ---
 def pagina_simulador(request):
     """Renderiza a página principal do simulador e passa a chave pública do reCAPTCHA."""
-    return render(request, 'simulador_risco/simulador.html', {'RECAPTCHA_PUBLIC_KEY': settings.RECAPTCHA_PUBLIC_KEY})
+    return render(request, 'simulador_risco/simulador.html', {
+        'RECAPTCHA_PUBLIC_KEY': settings.RECAPTCHA_PUBLIC_KEY,
+        'BUNDLE_URL': _url_bundle(),
+    })
+
+def _url_bundle():
+    """URL do pacote de regras corrente (classificação no navegador), ou '' para usar as APIs."""
+    hash_conteudo = bundle_atual()
+    return reverse('simulador_risco:bundle_regras', args=[hash_conteudo]) if hash_conteudo else ''
+
+def bundle_regras(request, hash_conteudo):
+    """Serve o pacote de regras compilado. O nome muda com o conteúdo, então o cache pode ser eterno."""
+    caminho = caminho_bundle(hash_conteudo)
+    if caminho is None:
+        raise Http404('Pacote de regras não encontrado.')
+    response = FileResponse(open(caminho, 'rb'), content_type='application/json')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = f'"{hash_conteudo}"'
+    return response
 
 # --- Função Auxiliar de Validação ---
 def _is_recaptcha_valid(recaptcha_response, min_score=0.5):
@@ -25,7 +69,8 @@ def _is_recaptcha_valid(recaptcha_response, min_score=0.5):
         'response': recaptcha_response
     }
     try:
-        r = requests.post('https://www.google.com/recaptcha/api/siteverify', data=data, timeout=5)
+        url = getattr(settings, 'SIMULADOR_RECAPTCHA_URL', RECAPTCHA_VERIFY_URL)
+        r = cliente.post(url, data=data)
         r.raise_for_status()
         result = r.json()
         
@@ -36,42 +81,61 @@ def _is_recaptcha_valid(recaptcha_response, min_score=0.5):
     except requests.RequestException:
         return False
 
+def _cliente_verificado(request, recaptcha_response):
+    """Token de verificação já emitido (ver simulador_risco.verificacao) ou, na falta dele, o reCAPTCHA."""
+    return cliente_verificado(request, recaptcha_response, _is_recaptcha_valid)
+
 # --- Views da API ---
+@controlar_admissao(custo=CUSTO_CONSULTA_CNPJ)
+@anexar_token
 def api_consultar_cnpj(request, cnpj):
     """API para consultar os CNAEs de um CNPJ, com validação reCAPTCHA."""
     if request.method != 'GET':
         return JsonResponse({'erro': 'Método não permitido'}, status=405)
 
     recaptcha_response = request.GET.get('g-recaptcha-response')
-    if not _is_recaptcha_valid(recaptcha_response):
+    if not _cliente_verificado(request, recaptcha_response):
         return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
 
     cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
     try:
-        response = requests.get(f"https://brasilapi.com.br/api/cnpj/v1/{cnpj_limpo}", timeout=10)
-        response.raise_for_status() 
-        data = response.json()
-
-        cnaes_codes = []
-        if data.get('cnae_fiscal'):
-            cnaes_codes.append(str(data['cnae_fiscal']))
-        if data.get('cnaes_secundarios'):
-            for cnae_sec in data.get('cnaes_secundarios', []):
-                cnaes_codes.append(str(cnae_sec.get('codigo')))
-
-        resposta_final = {
-            'empresa_data': {
-                'razao_social': data.get('razao_social'),
-                'nome_fantasia': data.get('nome_fantasia'),
-                'situacao_cadastral': data.get('descricao_situacao_cadastral'),
-            },
-            'cnaes': cnaes_codes
-        }
+        # Cache em memória/banco na frente da BrasilAPI (ver simulador_risco.cnpj)
+        resposta_final = consultar_cnpj(cnpj_limpo)
         return JsonResponse(resposta_final)
     except requests.RequestException as e:
         return JsonResponse({'erro': f'Falha ao consultar API externa: {str(e)}'}, status=500)
 
+@controlar_admissao(custo=CUSTO_CONSULTA_CNPJ)
+@anexar_token
+def api_consultar_empresa(request, cnpj):
+    """
+    Consulta o CNPJ e classifica seus CNAEs nas bases sanitária e ambiental numa
+    única chamada (uma só verificação de segurança). Devolve os dados cadastrais,
+    'sanitario' (mesmo formato de `api_consultar_cnaes`) e 'ambiental' (mesmo
+    formato de `api_consultar_cnaes_ambiental`, na base do município do
+    parâmetro 'municipio', ou do padrão).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    recaptcha_response = request.GET.get('g-recaptcha-response')
+    if not _cliente_verificado(request, recaptcha_response):
+        return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
+
+    cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+    try:
+        dados = consultar_cnpj(cnpj_limpo)
+    except requests.RequestException as e:
+        return JsonResponse({'erro': f'Falha ao consultar API externa: {str(e)}'}, status=500)
+    try:
+        conteudo = resposta_empresa(dados, request.GET.get('municipio'))
+    except MunicipioDesconhecido:
+        return JsonResponse({'erro': ERRO_MUNICIPIO}, status=404)
+    return HttpResponse(conteudo, content_type='application/json')
+
 @csrf_exempt
+@controlar_admissao()
+@anexar_token
 def api_consultar_cnaes(request):
     """API principal que recebe a lista de CNAEs e retorna a análise de risco, com validação reCAPTCHA."""
     if request.method != 'POST':
@@ -81,91 +145,162 @@ def api_consultar_cnaes(request):
         data = json.loads(request.body)
         
         recaptcha_response = data.get('g-recaptcha-response')
-        if not _is_recaptcha_valid(recaptcha_response):
+        if not _cliente_verificado(request, recaptcha_response):
             return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
 
         cnaes_codigos = data.get('cnaes', [])
-        cnaes_codigos_limpos = [''.join(filter(str.isdigit, c)) for c in cnaes_codigos]
-
-        RISCO_MAP = {'NA': 0, 'I': 1, 'II': 2, 'III': 3, 'P': 4}
-        RISCO_CORES = {'NA': 'info', 'I': 'success', 'II': 'warning', 'III': 'danger', 'P': 'secondary'}
-        RISCO_TOOLTIPS = {
-            'NA': 'Não se Aplica - Dispensado de alvará sanitário para esta atividade.',
-            'I': 'Nível de Risco I - Baixo Risco',
-            'II': 'Nível de Risco II - Médio Risco',
-            'III': 'Nível de Risco III - Alto Risco',
-            'P': 'Responder a pergunta para classificar o risco',
-            'N/A': 'CNAE não encontrado na base da Resolução SES/MG.'
-        }
-        resultado_final = {'cnaes_processados': [], 'perguntas_necessarias': []}
-        cnaes_encontrados = CNAE.objects.filter(codigo__in=cnaes_codigos_limpos)
-        codigos_encontrados = {c.codigo for c in cnaes_encontrados}
-
-        for cnae in cnaes_encontrados:
-            perguntas_do_cnae = []
-            if cnae.risco_base == 'P':
-                for pergunta in cnae.perguntas.all().prefetch_related('opcoes'):
-                    opcoes_data = [{'texto': op.texto, 'risco': op.risco_resultante} for op in pergunta.opcoes.all()]
-                    pergunta_data = {
-                        'numero': pergunta.numero, 'texto': pergunta.texto, 'opcoes': opcoes_data,
-                        'cnae_origem_codigo': cnae.codigo,
-                        'cnae_origem_descricao': cnae.descricao
-                    }
-                    if pergunta.numero not in [p['numero'] for p in resultado_final['perguntas_necessarias']]:
-                        resultado_final['perguntas_necessarias'].append(pergunta_data)
-                    perguntas_do_cnae.append(pergunta.numero)
-            
-            tooltip_text = RISCO_TOOLTIPS.get(cnae.risco_base, '')
-            if cnae.risco_base == 'III' and not cnae.dispensado_de_projeto:
-                tooltip_text = 'Nível de Risco III com exigência de projeto arquitetônico aprovado'
-            
-            resultado_final['cnaes_processados'].append({
-                'codigo': cnae.codigo, 'codigo_formatado': formatar_cnae(cnae.codigo),
-                'descricao': cnae.descricao, 'risco_base': cnae.risco_base,
-                'cor': RISCO_CORES.get(cnae.risco_base, 'dark'), 'tooltip': tooltip_text, 
-                'perguntas_nums': perguntas_do_cnae, 'ordem': RISCO_MAP.get(cnae.risco_base, -1),
-                'dispensado_projeto': cnae.dispensado_de_projeto,
-            })
-        
-        for codigo in cnaes_codigos_limpos:
-            if codigo not in codigos_encontrados:
-                resultado_final['cnaes_processados'].append({
-                    'codigo': codigo, 'codigo_formatado': formatar_cnae(codigo), 
-                    'descricao': 'CNAE não encontrado na base da Resolução.', 'risco_base': 'N/A', 
-                    'cor': 'light', 'tooltip': RISCO_TOOLTIPS.get('N/A', ''), 
-                    'perguntas_nums': [], 'ordem': -1
-                })
-        
+        cnaes_codigos_limpos = [limpar_cnae(c) for c in cnaes_codigos]
+
+        # Classificação feita sobre o snapshot em memória, com a resposta serializada em cache
+        return HttpResponse(resposta_sanitaria(cnaes_codigos_limpos), content_type='application/json')
+    except Exception as e:
+        return JsonResponse({'erro': str(e)}, status=500)
+
+@csrf_exempt
+@controlar_admissao()
+@anexar_token
+def api_resolver_risco(request):
+    """
+    Classifica os CNAEs e resolve no servidor os de risco 'P' a partir das respostas,
+    devolvendo o risco final consolidado numa única chamada.
+    Corpo: {"cnaes": [...], "respostas": {"codigo": {"numero": "SIM"}}, "g-recaptcha-response": "..."}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+
+        recaptcha_response = data.get('g-recaptcha-response')
+        if not _cliente_verificado(request, recaptcha_response):
+            return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
+
+        respostas = data.get('respostas') or {}
+        if not isinstance(respostas, dict):
+            return JsonResponse({'erro': 'O campo "respostas" deve ser um objeto {cnae: {pergunta: resposta}}.'}, status=400)
+        cnaes = data.get('cnaes', [])
+        if not isinstance(cnaes, list):
+            return JsonResponse({'erro': 'O campo "cnaes" deve ser uma lista de códigos.'}, status=400)
+
+        cnaes_codigos_limpos = [limpar_cnae(c) for c in cnaes]
+        snapshot = obter_snapshot_ses()
+        riscos_resolvidos, invalidas = snapshot.resolver_respostas(cnaes_codigos_limpos, respostas)
+        if invalidas:
+            return JsonResponse({'erro': 'Respostas inválidas.', 'detalhes': invalidas}, status=400)
+
+        resultado_final = snapshot.classificar(cnaes_codigos_limpos)
+        resultado_final['riscos_resolvidos'] = riscos_resolvidos
+        resultado_final['risco_final'] = resumo_sanitario(resultado_final, riscos_resolvidos)
         return JsonResponse(resultado_final)
     except Exception as e:
         return JsonResponse({'erro': str(e)}, status=500)
 
+# --- Versões assíncronas das APIs (modo ASGI, ver lummia_project/asgi.py) ---
+@controlar_admissao(custo=CUSTO_CONSULTA_CNPJ)
+@anexar_token
+async def api_consultar_cnpj_async(request, cnpj):
+    """Mesma API de `api_consultar_cnpj`, sem prender um worker durante as chamadas externas."""
+    if request.method != 'GET':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    recaptcha_response = request.GET.get('g-recaptcha-response')
+    if not await em_thread_io(_cliente_verificado, request, recaptcha_response):
+        return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
+
+    cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+    try:
+        resposta_final = await em_thread_io(consultar_cnpj, cnpj_limpo)
+        return JsonResponse(resposta_final)
+    except requests.RequestException as e:
+        return JsonResponse({'erro': f'Falha ao consultar API externa: {str(e)}'}, status=500)
+
+@controlar_admissao(custo=CUSTO_CONSULTA_CNPJ)
+@anexar_token
+async def api_consultar_empresa_async(request, cnpj):
+    """Mesma API de `api_consultar_empresa`, sem prender um worker durante as chamadas externas."""
+    if request.method != 'GET':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    recaptcha_response = request.GET.get('g-recaptcha-response')
+    if not await em_thread_io(_cliente_verificado, request, recaptcha_response):
+        return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
+
+    cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+    try:
+        dados = await em_thread_io(consultar_cnpj, cnpj_limpo)
+    except requests.RequestException as e:
+        return JsonResponse({'erro': f'Falha ao consultar API externa: {str(e)}'}, status=500)
+    try:
+        conteudo = await sync_to_async(resposta_empresa)(dados, request.GET.get('municipio'))
+    except MunicipioDesconhecido:
+        return JsonResponse({'erro': ERRO_MUNICIPIO}, status=404)
+    return HttpResponse(conteudo, content_type='application/json')
+
+@csrf_exempt
+@controlar_admissao()
+@anexar_token
+async def api_consultar_cnaes_async(request):
+    """Mesma API de `api_consultar_cnaes`, com a verificação do reCAPTCHA fora do event loop."""
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+
+        recaptcha_response = data.get('g-recaptcha-response')
+        if not await em_thread_io(_cliente_verificado, request, recaptcha_response):
+            return JsonResponse({'erro': 'Falha na verificação de segurança. Sua ação pareceu automatizada.'}, status=403)
+
+        cnaes_codigos_limpos = [limpar_cnae(c) for c in data.get('cnaes', [])]
+        conteudo = await sync_to_async(resposta_sanitaria)(cnaes_codigos_limpos)
+        return HttpResponse(conteudo, content_type='application/json')
+    except Exception as e:
+        return JsonResponse({'erro': str(e)}, status=500)
+
+@csrf_exempt
+@controlar_admissao()
+@anexar_token
+async def api_consultar_cnaes_ambiental_async(request):
+    """Mesma API de `api_consultar_cnaes_ambiental`, com a verificação do reCAPTCHA fora do event loop."""
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+
+        recaptcha_response = data.get('g-recaptcha-response')
+        if not await em_thread_io(_cliente_verificado, request, recaptcha_response):
+            return JsonResponse({'erro': 'Falha na verificação de segurança.'}, status=403)
+
+        cnaes_codigos_limpos = [limpar_cnae(c) for c in data.get('cnaes', [])]
+        conteudo = await sync_to_async(resposta_ambiental)(cnaes_codigos_limpos, data.get('municipio'))
+        return HttpResponse(conteudo, content_type='application/json')
+    except MunicipioDesconhecido:
+        return JsonResponse({'erro': ERRO_MUNICIPIO}, status=404)
+    except Exception as e:
+        return JsonResponse({'erro': str(e)}, status=500)
+
 def api_buscar_cnae(request):
     """View para a busca com autocompletar de CNAEs (não precisa de CAPTCHA)."""
     termo = request.GET.get('termo', '').strip()
     if len(termo) < 3:
         return JsonResponse([], safe=False)
-    termo_limpo = ''.join(filter(str.isdigit, termo))
-    query = Q(descricao__icontains=termo)
-    if termo_limpo:
-        query |= Q(codigo__icontains=termo_limpo)
-    cnaes = CNAE.objects.filter(query)[:10]
-    resultados = [{'id': cnae.codigo, 'text': f"{formatar_cnae(cnae.codigo)} - {cnae.descricao}"} for cnae in cnaes]
+    # Índice em memória: sem acentos, com sinônimos do decreto e resultados ordenados por relevância
+    resultados = buscar_cnaes(termo, limite=10)
     return JsonResponse(resultados, safe=False)
 
-def formatar_cnae(codigo):
-    """Helper para formatar o código CNAE de 7 dígitos."""
-    if codigo and len(codigo) == 7:
-        return f"{codigo[0:4]}-{codigo[4]}/{codigo[5:]}"
-    return codigo
+def api_hierarquia_cnae(request, codigo):
+    """
+    Nível da hierarquia CNAE (seção, divisão, grupo, classe ou subclasse) indicado
+    pelo código, mesmo parcial, com o maior risco sanitário e ambiental abaixo dele.
+    """
+    resumo = obter_hierarquia().consultar(codigo)
+    if resumo is None:
+        return JsonResponse({'erro': 'Código CNAE não encontrado na hierarquia.'}, status=404)
+    return JsonResponse(resumo)
 
 def simulador_ambiental(request):
     resultado = None
-    risco_geral = "Não Classificado"
-    cor_risco = "secondary" # cinza padrão
-    mensagem_resultado = "Insira os CNAEs para verificar a classificação."
-    cnaes_encontrados = []
-    cnaes_nao_encontrados = []
 
     if request.method == 'POST':
         # Pega o input do usuário (CNPJ ou Lista de CNAEs)
@@ -176,69 +311,44 @@ def simulador_ambiental(request):
         # Limpa e separa os códigos (aceita vírgula, ponto e vírgula, quebra de linha)
         # Exemplo: "0111-3/01, 0111302" vira ['0111301', '0111302']
         codigos_limpos = re.findall(r'\d+', cnaes_input)
-        
-        # Lista para guardar objetos de ClassificacaoAmbiental encontrados
-        classificacoes = []
-        
-        for codigo in codigos_limpos:
-            # Tenta buscar CNAE base
-            try:
-                cnae_obj = CNAE.objects.get(codigo=codigo)
-                
-                # Busca as classificações ambientais vinculadas a este CNAE
-                # Um CNAE pode ter mais de uma classificação (ex: riscos diferentes dependendo do porte/detalhe)
-                itens_ambientais = ClassificacaoAmbiental.objects.filter(cnae=cnae_obj)
-                
-                if itens_ambientais.exists():
-                    for item in itens_ambientais:
-                        classificacoes.append(item)
-                        cnaes_encontrados.append(codigo)
-                else:
-                    # CNAE existe na base IBGE, mas não tem classificação específica no Decreto Municipal
-                    # Pode ser tratado como "Não Listada" ou "Risco I" dependendo da regra.
-                    # Vamos marcar como "Sem classificação específica encontrada"
-                    cnaes_nao_encontrados.append(f"{codigo} (Sem classificação ambiental)")
-                    
-            except CNAE.DoesNotExist:
-                cnaes_nao_encontrados.append(codigo)
-
-        # Lógica de Cálculo do Risco Geral (Hierarquia: III > II > I)
-        if classificacoes:
-            riscos = [c.nivel_risco for c in classificacoes if c.nivel_risco]
-            
-            if 'III' in riscos:
-                risco_geral = 'III'
-                cor_risco = 'danger' # Vermelho
-                mensagem_resultado = "ATIVIDADE DE ALTO RISCO AMBIENTAL"
-            elif 'II' in riscos:
-                risco_geral = 'II'
-                cor_risco = 'warning' # Amarelo/Laranja
-                mensagem_resultado = "ATIVIDADE DE MÉDIO RISCO AMBIENTAL"
-            elif 'I' in riscos:
-                risco_geral = 'I'
-                cor_risco = 'success' # Verde
-                mensagem_resultado = "ATIVIDADE DE BAIXO RISCO AMBIENTAL (Dispensado de Licenciamento)"
+
+        classificacao = obter_indice_ambiental().classificar(codigos_limpos)
+        nao_encontrados = classificacao['nao_encontrados'] + [
+            f"{codigo} (Sem classificação ambiental)" for codigo in classificacao['sem_classificacao']
+        ]
+
+        # Risco Geral considera apenas as classificações explícitas do decreto (Hierarquia: III > II > I)
+        risco_geral = "Não Classificado"
+        cor_risco = "secondary" # cinza padrão
+        mensagem_resultado = "Insira os CNAEs para verificar a classificação."
+        if classificacao['classificacoes']:
+            risco_geral = classificacao['risco_classificado']
+            if risco_geral in MENSAGENS_RISCO_GERAL:
+                cor_risco, mensagem_resultado = MENSAGENS_RISCO_GERAL[risco_geral]
             else:
                 risco_geral = "Não Definido"
         elif cnaes_input:
-             mensagem_resultado = "Nenhuma classificação ambiental encontrada para os códigos informados."
+            mensagem_resultado = "Nenhuma classificação ambiental encontrada para os códigos informados."
 
         resultado = {
-            'classificacoes': classificacoes,
+            'classificacoes': classificacao['classificacoes'],
             'risco_geral': risco_geral,
             'cor_risco': cor_risco,
             'mensagem': mensagem_resultado,
-            'nao_encontrados': cnaes_nao_encontrados
+            'nao_encontrados': nao_encontrados
         }
 
     return render(request, 'simulador_risco/simulador_ambiental.html', {'resultado': resultado})
 
 
 @csrf_exempt
+@controlar_admissao()
+@anexar_token
 def api_consultar_cnaes_ambiental(request):
     """
     API específica para o Simulador Ambiental.
-    Recebe lista de CNAEs via JSON, consulta ClassificacaoAmbiental e retorna JSON estruturado.
+    Recebe lista de CNAEs (e, opcionalmente, o 'municipio') via JSON, consulta a
+    classificação ambiental do município e retorna JSON estruturado.
     """
     if request.method != 'POST':
         return JsonResponse({'erro': 'Método não permitido'}, status=405)
@@ -246,79 +356,129 @@ def api_consultar_cnaes_ambiental(request):
     try:
         data = json.loads(request.body)
         
-        # Validação reCAPTCHA (Reutilizando sua função _is_recaptcha_valid)
+        # Validação reCAPTCHA (ou token de verificação já emitido)
         recaptcha_response = data.get('g-recaptcha-response')
-        if not _is_recaptcha_valid(recaptcha_response):
+        if not _cliente_verificado(request, recaptcha_response):
             return JsonResponse({'erro': 'Falha na verificação de segurança.'}, status=403)
 
         cnaes_codigos = data.get('cnaes', [])
         # Limpeza dos códigos
-        cnaes_codigos_limpos = [''.join(filter(str.isdigit, str(c))) for c in cnaes_codigos]
+        cnaes_codigos_limpos = [limpar_cnae(c) for c in cnaes_codigos]
 
-        resultado_final = {'cnaes_processados': []}
-        
-        # Mapeamento de Risco para Ordenação e Cores
-        RISCO_MAP = {'I': 1, 'II': 2, 'III': 3}
-        RISCO_CORES = {'I': 'success', 'II': 'warning', 'III': 'danger', 'NA': 'secondary'}
-
-        for codigo in cnaes_codigos_limpos:
-            try:
-                cnae_obj = CNAE.objects.get(codigo=codigo)
-                
-                # Busca as classificações ambientais específicas
-                classificacoes = ClassificacaoAmbiental.objects.filter(cnae=cnae_obj)
-                
-                detalhes_ambientais = []
-                risco_max_cnae = 0
-                risco_texto_cnae = "NA"
-
-                if classificacoes.exists():
-                    for item in classificacoes:
-                        # Determina o maior risco entre as opções deste CNAE
-                        valor_risco = RISCO_MAP.get(item.nivel_risco, 0)
-                        if valor_risco > risco_max_cnae:
-                            risco_max_cnae = valor_risco
-                            risco_texto_cnae = item.nivel_risco
-
-                        detalhes_ambientais.append({
-                            'nivel_agregacao': item.nivel_agregacao,
-                            'dn_copam': item.codigo_dn_copam,
-                            'descricao_especifica': item.descricao_atividade,
-                            'exigencia': item.exigencia_municipal,
-                            'risco': item.nivel_risco,
-                            'cor': RISCO_CORES.get(item.nivel_risco, 'secondary')
-                        })
-                else:
-                    # Se não tem classificação específica, considera risco I ou NA conforme sua regra
-                    risco_texto_cnae = "I" # Assumindo padrão baixo risco se não listado
-                    detalhes_ambientais.append({
-                        'dn_copam': 'N/A',
-                        'descricao_especifica': 'Atividade não listada especificamente no Decreto (Regra Geral)',
-                        'exigencia': 'Não se aplica / Dispensa',
-                        'risco': 'I',
-                        'cor': 'success'
-                    })
-
-                resultado_final['cnaes_processados'].append({
-                    'codigo': cnae_obj.codigo,
-                    'codigo_formatado': formatar_cnae(cnae_obj.codigo),
-                    'descricao': cnae_obj.descricao,
-                    'itens_ambientais': detalhes_ambientais,
-                    'risco_consolidado': risco_texto_cnae,
-                    'cor_consolidada': RISCO_CORES.get(risco_texto_cnae, 'secondary')
-                })
-
-            except CNAE.DoesNotExist:
-                # CNAE não encontrado na base
-                pass
-
-        return JsonResponse(resultado_final)
+        # Lote inteiro classificado sobre o índice em memória (CNAEs inexistentes são ignorados),
+        # com a resposta serializada em cache
+        return HttpResponse(
+            resposta_ambiental(cnaes_codigos_limpos, data.get('municipio')), content_type='application/json')
 
+    except MunicipioDesconhecido:
+        return JsonResponse({'erro': ERRO_MUNICIPIO}, status=404)
     except Exception as e:
         return JsonResponse({'erro': str(e)}, status=500)
 
-def pagina_simulador_ambiental(request):
-    """Renderiza o template do Simulador Ambiental (cópia do sanitário)."""
+def pagina_simulador_ambiental(request, municipio=None):
+    """Renderiza o template do Simulador Ambiental do município (padrão: SIMULADOR_MUNICIPIO_PADRAO)."""
+    municipio = municipio or municipio_padrao()
+    dados_municipio = obter_municipios().get(municipio)
+    if dados_municipio is None:
+        raise Http404(ERRO_MUNICIPIO)
     return render(request, 'simulador_risco/simulador_ambiental.html', {
-        'RECAPTCHA_PUBLIC_KEY': settings.RECAPTCHA_PUBLIC_KEY
-    })
\ No newline at end of file
+        'RECAPTCHA_PUBLIC_KEY': settings.RECAPTCHA_PUBLIC_KEY,
+        # O pacote de regras só traz a base ambiental do município padrão
+        'BUNDLE_URL': _url_bundle() if municipio == municipio_padrao() else '',
+        'MUNICIPIO': dados_municipio,
+    })
+
+
+@csrf_exempt
+@controlar_admissao()
+@anexar_token
+def api_gerar_relatorio(request):
+    """
+    Pede o relatório para impressão de uma simulação: {'tipo': 'sanitario' ou
+    'ambiental', 'cnaes', 'respostas', 'municipio'}. Responde 200 com a URL se o
+    mesmo relatório já estiver gravado; senão agenda a renderização e responde
+    202 com a URL de acompanhamento.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+
+        recaptcha_response = data.get('g-recaptcha-response')
+        if not _cliente_verificado(request, recaptcha_response):
+            return JsonResponse({'erro': 'Falha na verificação de segurança.'}, status=403)
+
+        hash_relatorio, situacao = solicitar_relatorio(
+            data.get('tipo', 'sanitario'), data.get('cnaes', []), data.get('respostas'), data.get('municipio'))
+    except MunicipioDesconhecido:
+        return JsonResponse({'erro': ERRO_MUNICIPIO}, status=404)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    return _resposta_relatorio(hash_relatorio, situacao)
+
+
+def _resposta_relatorio(hash_relatorio, situacao):
+    corpo = {
+        'status': situacao,
+        'url': reverse('simulador_risco:relatorio_simulador', args=[hash_relatorio]),
+        'status_url': reverse('simulador_risco:api_situacao_relatorio', args=[hash_relatorio]),
+    }
+    if situacao == 'erro':
+        return JsonResponse({**corpo, 'erro': 'Falha ao gerar o relatório. Tente novamente.'}, status=500)
+    return JsonResponse(corpo, status=200 if situacao == 'pronto' else 202)
+
+
+def api_situacao_relatorio(request, hash_relatorio):
+    """Situação de um relatório pedido em `api_gerar_relatorio` ('pronto', 'gerando' ou 'erro')."""
+    situacao = fila_relatorios.situacao(hash_relatorio)
+    if situacao is None:
+        return JsonResponse({'erro': 'Relatório não encontrado.'}, status=404)
+    return _resposta_relatorio(hash_relatorio, situacao)
+
+
+def relatorio_simulador(request, hash_relatorio):
+    """Serve o relatório gravado. O nome muda com o conteúdo, então o cache pode ser eterno."""
+    caminho = caminho_relatorio(hash_relatorio)
+    if caminho is None:
+        raise Http404('Relatório não encontrado.')
+    response = FileResponse(open(caminho, 'rb'), content_type='text/html; charset=utf-8')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = f'"{hash_relatorio}"'
+    return response
+
+
+@login_required
+def api_consultar_lote(request):
+    """
+    Triagem de uma carteira de CNPJs (uso interno da consultoria).
+    Recebe {"cnpjs": [...]} e devolve NDJSON, uma linha por CNPJ, à medida que
+    cada consulta termina.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Método não permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'erro': 'JSON inválido.'}, status=400)
+
+    cnpjs = data.get('cnpjs', [])
+    limite = getattr(settings, 'SIMULADOR_LOTE_MAXIMO', 500)
+    if not isinstance(cnpjs, list) or not cnpjs:
+        return JsonResponse({'erro': 'Informe a lista de CNPJs em "cnpjs".'}, status=400)
+    if len(cnpjs) > limite:
+        return JsonResponse({'erro': f'Máximo de {limite} CNPJs por lote.'}, status=400)
+
+    return StreamingHttpResponse(gerar_ndjson(classificar_cnpjs(cnpjs)), content_type='application/x-ndjson')
+
+
+@login_required
+@administrador_required
+def api_metricas(request):
+    """Contadores internos do simulador neste worker (chamadas externas, caches, admissão e tokens)."""
+    return JsonResponse({
+        'http': metricas(), 'respostas': metricas_cache(),
+        'admissao': metricas_admissao(), 'verificacao': metricas_verificacao(),
+        'espelho_cnpj': espelho_cnpj.metricas(), 'relatorios': fila_relatorios.metricas(),
+    })